@@ -0,0 +1,63 @@
+"""Сравнение стоимости маршрутизации callback data от числа маршрутов.
+
+Запуск: python -m benchmarks.bench_callback_router
+"""
+import timeit
+
+from utils.callback_router import CallbackRouter
+
+ROUTE_COUNTS = [10, 100, 1000, 10000]
+LOOKUPS = 200000
+
+
+async def _handler(update, context, *args):
+    pass
+
+
+def build_router(route_count):
+    """Маршрутизатор с route_count точными и префиксными маршрутами"""
+    router = CallbackRouter()
+    for i in range(route_count // 2):
+        router.add_exact(f"action{i}", _handler)
+        router.add_prefix(f"item{i}_", _handler, params=(int,))
+    return router
+
+
+def build_chain(route_count):
+    """Эквивалент цепочки if/elif со startswith"""
+    routes = []
+    for i in range(route_count // 2):
+        routes.append((f"action{i}", False))
+        routes.append((f"item{i}_", True))
+
+    def resolve(data):
+        for route, is_prefix in routes:
+            if is_prefix and data.startswith(route):
+                return _handler, (int(data[len(route):]),)
+            if data == route:
+                return _handler, ()
+        return None
+
+    return resolve
+
+
+def main():
+    print(f"{'маршрутов':>10} {'router, нс':>12} {'if/elif, нс':>12}")
+    for route_count in ROUTE_COUNTS:
+        router = build_router(route_count)
+        chain = build_chain(route_count)
+        # Худший для цепочки случай - последний зарегистрированный маршрут
+        data = f"item{route_count // 2 - 1}_42"
+        assert router.resolve(data) == chain(data)
+
+        router_time = timeit.timeit(lambda: router.resolve(data),
+                                    number=LOOKUPS)
+        chain_number = max(LOOKUPS // route_count, 100)
+        chain_time = timeit.timeit(lambda: chain(data), number=chain_number)
+
+        print(f"{route_count:>10} {router_time / LOOKUPS * 1e9:>12.0f} "
+              f"{chain_time / chain_number * 1e9:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
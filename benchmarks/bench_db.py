@@ -0,0 +1,294 @@
+"""Производительность методов MathProblemsDB на синтетических данных.
+
+Строит базу с задачами из настоящей базы и заданным числом пользователей
+и попыток, затем замеряет каждый метод в течение --seconds секунд и
+печатает операции в секунду и перцентили времени одного вызова.
+
+Запуск: python -m benchmarks.bench_db [--users 100000] [--attempts 50000000]
+        [--dataset ФАЙЛ] [--seconds 2] [--baseline ФАЙЛ]
+        [--save-baseline ФАЙЛ] [--tolerance 20]
+
+--dataset сохраняет сгенерированную базу и переиспользует ее в следующих
+прогонах (генерация 50 млн попыток занимает минуты); замеры идут на ее
+копии. --baseline сравнивает результат с сохраненным через --save-baseline
+и завершается с кодом 1, если какой-то метод стал медленнее больше чем
+на --tolerance процентов.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from database.models import MathProblemsDB
+
+ROOT = Path(__file__).resolve().parent.parent
+
+SEARCH_KEYWORDS = ['км', 'скорость', 'площадь', 'процент', 'дробь',
+                   'лодка', 'работа', 'круг', 'числ', 'ответ']
+
+# Множитель хеша Кнута: детерминированный разброс значений в генераторе
+HASH = 2654435761
+
+
+def generate_dataset(path, source_db, users, attempts):
+    """Создает базу с задачами из source_db и синтетическими попытками.
+
+    Попытки равномерно распределены по пользователям и задачам, 60% из них
+    верные, время - в пределах последнего года. Данные вставляются одним
+    INSERT ... SELECT по порядку user_id, чтобы индексы росли с конца.
+    """
+    MathProblemsDB(path)
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute('PRAGMA journal_mode = OFF')
+        conn.execute('PRAGMA synchronous = OFF')
+        conn.execute('ATTACH DATABASE ? AS source', (source_db,))
+        with conn:
+            conn.execute('''
+                INSERT INTO sections (id, name, description)
+                SELECT id, name, description FROM source.sections
+            ''')
+            conn.execute('''
+                INSERT INTO problems (id, section_id, problem_number,
+                                      problem_text, answer, difficulty_level)
+                SELECT id, section_id, problem_number, problem_text, answer,
+                       difficulty_level
+                FROM source.problems
+            ''')
+        conn.execute('DETACH DATABASE source')
+
+        conn.execute('''
+            CREATE TEMP TABLE bench_problems AS
+            SELECT ROW_NUMBER() OVER (ORDER BY problem_number) - 1 AS ord,
+                   problem_number, answer
+            FROM problems
+        ''')
+        conn.execute('CREATE INDEX temp.idx_bench_problems ON bench_problems(ord)')
+        problem_count = conn.execute(
+            'SELECT COUNT(*) FROM bench_problems').fetchone()[0]
+
+        per_user = max(1, attempts // users)
+        with conn:
+            conn.execute(f'''
+                WITH RECURSIVE seq(i) AS (
+                    SELECT 0 UNION ALL SELECT i + 1 FROM seq WHERE i + 1 < ?
+                ),
+                rows AS (
+                    SELECT i, i / {per_user} + 1 AS user_id,
+                           (i * {HASH}) % 4294967296 AS h
+                    FROM seq
+                )
+                INSERT INTO user_attempts (user_id, problem_number, user_answer,
+                                           correct_answer, is_correct,
+                                           attempt_number, solved_at)
+                SELECT r.user_id, p.problem_number,
+                       CASE WHEN r.h % 100 < 60 THEN p.answer ELSE '-1' END,
+                       p.answer, r.h % 100 < 60, 1,
+                       datetime('now', '-' || (r.h % 525600) || ' minutes')
+                FROM rows r
+                JOIN bench_problems p ON p.ord = r.h % {problem_count}
+            ''', (per_user * users,))
+
+            conn.execute('''
+                INSERT INTO user_problem_attempts
+                    (user_id, problem_number, last_attempt_number)
+                SELECT user_id, problem_number, COUNT(*)
+                FROM user_attempts
+                GROUP BY user_id, problem_number
+            ''')
+            conn.execute('''
+                INSERT INTO user_stats
+                    (user_id, username, first_name, last_name, total_attempts,
+                     correct_attempts, unique_solved_problems, last_activity)
+                SELECT user_id, 'user' || user_id, 'Ученик', NULL, COUNT(*),
+                       SUM(is_correct),
+                       COUNT(DISTINCT CASE WHEN is_correct
+                                           THEN problem_number END),
+                       MAX(solved_at)
+                FROM user_attempts
+                GROUP BY user_id
+            ''')
+        conn.execute('ANALYZE')
+    finally:
+        conn.close()
+
+
+def dataset_info(path):
+    conn = sqlite3.connect(path)
+    try:
+        users = conn.execute('SELECT COUNT(*) FROM user_stats').fetchone()[0]
+        attempts = conn.execute(
+            'SELECT COUNT(*) FROM user_attempts').fetchone()[0]
+        problems = [row[0] for row in conn.execute(
+            'SELECT problem_number FROM problems ORDER BY problem_number')]
+    finally:
+        conn.close()
+    return users, attempts, problems
+
+
+def build_cases(db, users, problems, rng):
+    """Замеряемые вызовы: (имя, функция без аргументов).
+
+    Изменяющие методы идут последними, чтобы не влиять на читающие.
+    """
+    def user():
+        return rng.randint(1, users)
+
+    def problem():
+        return rng.choice(problems)
+
+    def add_attempt():
+        is_correct = rng.random() < 0.6
+        db.add_user_attempt(user(), problem(), '42',
+                            '42' if is_correct else '7', is_correct)
+
+    def update_stats():
+        uid = user()
+        db.update_user_stats(uid, f'user{uid}', 'Ученик', None,
+                             rng.random() < 0.6, problem())
+
+    def update_stats_known():
+        # Как в Services.record_attempt: число решенных задач уже известно
+        uid = user()
+        db.update_user_stats(uid, f'user{uid}', 'Ученик', None,
+                             rng.random() < 0.6, problem(),
+                             unique_solved=rng.randint(0, len(problems)))
+
+    return [
+        ('get_user_stats', lambda: db.get_user_stats(user())),
+        ('get_leaderboard', lambda: db.get_leaderboard(10)),
+        ('get_random_unsolved_problem',
+         lambda: db.get_random_unsolved_problem(user())),
+        ('search_problems',
+         lambda: db.search_problems(rng.choice(SEARCH_KEYWORDS))),
+        ('add_user_attempt', add_attempt),
+        ('update_user_stats', update_stats),
+        ('update_user_stats[unique_solved]', update_stats_known),
+        ('delete_user_attempts',
+         lambda: db.delete_user_attempts(user(), problem_number=problem())),
+    ]
+
+
+def measure(func, seconds, max_ops):
+    """Вызывает func, пока не истечет время; возвращает показатели"""
+    func()  # прогрев кэша страниц
+    timings = []
+    deadline = time.perf_counter() + seconds
+    while len(timings) < max_ops:
+        started = time.perf_counter()
+        func()
+        finished = time.perf_counter()
+        timings.append(finished - started)
+        if finished >= deadline:
+            break
+
+    timings.sort()
+    last = len(timings) - 1
+    return {
+        'ops': len(timings),
+        'ops_per_sec': round(len(timings) / sum(timings), 1),
+        'p50_ms': round(timings[last // 2] * 1000, 3),
+        'p99_ms': round(timings[min(last, int(0.99 * len(timings)))] * 1000, 3),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Печатает изменения относительно базовой линии; True - есть регрессии"""
+    base_results = baseline.get('results', {})
+    regressed = False
+    print()
+    print(f"{'метод':<34} {'было, оп/с':>12} {'стало, оп/с':>12} "
+          f"{'изменение':>10}")
+    for name, result in results.items():
+        base = base_results.get(name)
+        if not base:
+            print(f"{name:<34} {'-':>12} {result['ops_per_sec']:>12.1f}")
+            continue
+        change = (result['ops_per_sec'] / base['ops_per_sec'] - 1) * 100
+        mark = ''
+        if change < -tolerance:
+            regressed = True
+            mark = ' ❌'
+        print(f"{name:<34} {base['ops_per_sec']:>12.1f} "
+              f"{result['ops_per_sec']:>12.1f} {change:>+9.1f}%{mark}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--attempts', type=int, default=1000000)
+    parser.add_argument('--source-db', default=str(ROOT / 'math_problems.db'),
+                        help='база, из которой берутся разделы и задачи')
+    parser.add_argument('--dataset',
+                        help='файл сгенерированной базы (переиспользуется)')
+    parser.add_argument('--seconds', type=float, default=2,
+                        help='время замера одного метода, с')
+    parser.add_argument('--max-ops', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--baseline', help='JSON с базовой линией')
+    parser.add_argument('--save-baseline', help='куда сохранить результат')
+    parser.add_argument('--tolerance', type=float, default=20,
+                        help='допустимое замедление, %%')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        dataset = args.dataset or os.path.join(workdir, 'dataset.db')
+        if not os.path.exists(dataset):
+            print(f"Генерация: {args.users} пользователей, "
+                  f"{args.attempts} попыток...")
+            started = time.perf_counter()
+            generate_dataset(dataset, args.source_db, args.users,
+                             args.attempts)
+            print(f"Готово за {time.perf_counter() - started:.1f} с")
+
+        users, attempts, problems = dataset_info(dataset)
+        print(f"База {dataset}: {users} пользователей, {attempts} попыток, "
+              f"{len(problems)} задач")
+        print()
+
+        # Изменяющие методы работают с копией, сохраненная база не меняется
+        path = os.path.join(workdir, 'bench.db')
+        shutil.copy(dataset, path)
+
+        db = MathProblemsDB(path)
+        rng = random.Random(args.seed)
+        results = {}
+        print(f"{'метод':<34} {'вызовов':>8} {'оп/с':>10} {'p50, мс':>9} "
+              f"{'p99, мс':>9}")
+        for name, func in build_cases(db, users, problems, rng):
+            result = results[name] = measure(func, args.seconds, args.max_ops)
+            print(f"{name:<34} {result['ops']:>8} "
+                  f"{result['ops_per_sec']:>10.1f} {result['p50_ms']:>9.3f} "
+                  f"{result['p99_ms']:>9.3f}")
+
+    report = {
+        'dataset': {'users': users, 'attempts': attempts,
+                    'problems': len(problems)},
+        'results': results,
+    }
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\nБазовая линия сохранена в {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('dataset') != report['dataset']:
+            print(f"\n⚠️ Базовая линия снята на других данных: "
+                  f"{baseline.get('dataset')}")
+        if compare(results, baseline, args.tolerance):
+            print(f"\n❌ Замедление больше {args.tolerance:.0f}%")
+            sys.exit(1)
+        print(f"\n✅ Без замедлений больше {args.tolerance:.0f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""Локальная замена Telegram Bot API для нагрузочного тестирования.
+
+Сервер понимает ровно те методы, которые использует бот: getUpdates
+(long polling), sendMessage, editMessageText, answerCallbackQuery и
+служебные вызовы при запуске. Обновления для бота кладутся через
+push_update, а ответы бота складываются в очередь чата, откуда их
+забирают виртуальные пользователи.
+"""
+import asyncio
+import itertools
+import json
+import logging
+import time
+from collections import Counter, defaultdict
+from urllib.parse import parse_qsl
+
+logger = logging.getLogger(__name__)
+
+BOT_USER = {
+    'id': 1,
+    'is_bot': True,
+    'first_name': 'LoadTestBot',
+    'username': 'load_test_bot',
+    'can_join_groups': False,
+    'can_read_all_group_messages': False,
+    'supports_inline_queries': False,
+}
+
+
+def _decode_params(body, content_type):
+    """Параметры запроса PTB: form-urlencoded или JSON"""
+    if not body:
+        return {}
+    if content_type.startswith('application/json'):
+        return json.loads(body)
+    params = dict(parse_qsl(body.decode(), keep_blank_values=True))
+    # Сложные значения PTB передает JSON-строками
+    for key, value in params.items():
+        if value[:1] in ('{', '['):
+            try:
+                params[key] = json.loads(value)
+            except ValueError:
+                pass
+    return params
+
+
+class FakeBotAPI:
+    """HTTP-сервер, отвечающий на запросы бота вместо api.telegram.org"""
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self.host = host
+        self.port = port
+        self._server = None
+        self._updates = []
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._new_updates = asyncio.Event()
+        # id чата -> очередь (метод, параметры, время получения)
+        self._inboxes = defaultdict(asyncio.Queue)
+        self.method_counts = Counter()
+        self._connections = set()
+        self._closing = False
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_connection,
+                                                  self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"Тестовый Bot API слушает {self.url}")
+
+    async def stop(self):
+        # Отпускаем ожидающий getUpdates и закрываем открытые соединения,
+        # чтобы обработчики завершились сами, а не были отменены
+        self._closing = True
+        self._new_updates.set()
+        await asyncio.sleep(0)
+        for writer in list(self._connections):
+            writer.close()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    def push_update(self, update):
+        """Ставит обновление в очередь getUpdates"""
+        update['update_id'] = next(self._update_ids)
+        self._updates.append(update)
+        self._new_updates.set()
+        return update['update_id']
+
+    def inbox(self, chat_id):
+        """Очередь ответов бота в чат"""
+        return self._inboxes[chat_id]
+
+    def next_message_id(self):
+        return next(self._message_ids)
+
+    async def _handle_connection(self, reader, writer):
+        # httpx держит соединения открытыми: обрабатываем запросы по очереди
+        self._connections.add(writer)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if not line.strip():
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get('content-length', 0))
+                body = await reader.readexactly(length) if length else b''
+                path = request_line.decode('latin-1').split()[1]
+
+                result = await self._dispatch(
+                    path.rsplit('/', 1)[-1],
+                    _decode_params(body, headers.get('content-type', '')))
+
+                payload = json.dumps({'ok': True, 'result': result}).encode()
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\n"
+                    b"Content-Type: application/json\r\n" +
+                    f"Content-Length: {len(payload)}\r\n\r\n".encode() +
+                    payload)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+
+    async def _dispatch(self, method, params):
+        self.method_counts[method] += 1
+
+        if method == 'getUpdates':
+            return await self._get_updates(params)
+        if method == 'getMe':
+            return BOT_USER
+        if method in ('sendMessage', 'editMessageText'):
+            return self._deliver(method, params)
+        # answerCallbackQuery, setMyCommands, deleteWebhook и прочее
+        return True
+
+    async def _get_updates(self, params):
+        offset = int(params.get('offset') or 0)
+        timeout = float(params.get('timeout') or 0)
+        limit = int(params.get('limit') or 100)
+
+        self._updates = [u for u in self._updates if u['update_id'] >= offset]
+        if not self._updates and timeout and not self._closing:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self._updates[:limit]
+
+    def _deliver(self, method, params):
+        """Кладет ответ бота в очередь чата и возвращает объект Message"""
+        chat_id = int(params['chat_id'])
+        message_id = int(params.get('message_id') or self.next_message_id())
+        self._inboxes[chat_id].put_nowait((method, params, time.perf_counter()))
+
+        message = {
+            'message_id': message_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': BOT_USER,
+            'text': params.get('text', ''),
+        }
+        if params.get('reply_markup'):
+            message['reply_markup'] = params['reply_markup']
+        return message
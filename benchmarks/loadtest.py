@@ -0,0 +1,363 @@
+"""Нагрузочный тест: настоящее приложение из main.py против тестового Bot API.
+
+Виртуальные пользователи проходят типичные сценарии (/random и ответы,
+тестовый режим, поиск, /stats, /leaderboard), после чего печатается
+пропускная способность, перцентили задержек по шагам и время запросов
+к базе.
+
+Запуск: python -m benchmarks.loadtest [--users 1000] [--duration 60]
+        [--ramp-up 10] [--think-time 1.0] [--db math_problems.db]
+        [--telegram-limits] [--shards N] [--workers N]
+
+Тест работает на копии базы во временном каталоге. По умолчанию лимиты
+исходящих сообщений Telegram отключены, чтобы измерять сам бот;
+--telegram-limits включает их. --shards раскладывает данные пользователей
+копии по N файлам (см. database/sharding.py), --workers запускает бота
+в режиме нескольких процессов; время запросов к базе и ошибки блокировки
+тогда считаются в рабочих процессах и в отчет не попадают.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+
+from benchmarks.fake_bot_api import FakeBotAPI
+from database.sharding import reshard
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Сколько ждать ответа бота на одно действие
+REPLY_TIMEOUT = 30
+
+# Сценарии и их доли в нагрузке
+SCENARIOS = {
+    'random': 35,
+    'test': 25,
+    'search': 15,
+    'stats': 15,
+    'leaderboard': 10,
+}
+
+SEARCH_KEYWORDS = ['км', 'скорость', 'площадь', 'процент', 'дробь',
+                   'лодка', 'работа', 'круг', 'числ', 'ответ']
+
+PROBLEM_NUMBER = re.compile(r'Задача №(\d+)')
+
+
+class LockErrorCounter(logging.Handler):
+    """Считает ошибки блокировки SQLite в логах бота"""
+
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.count = 0
+
+    def emit(self, record):
+        if 'database is locked' in record.getMessage():
+            self.count += 1
+
+
+class LoadTestStats:
+    """Задержки ответов бота по шагам сценариев"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.timeouts = Counter()
+        self.errors = Counter()
+
+    def percentiles(self, step):
+        values = sorted(self.latencies[step])
+        if not values:
+            return None
+        last = len(values) - 1
+        return {q: values[min(last, int(q * len(values)))]
+                for q in (0.5, 0.95, 0.99)}
+
+
+class VirtualUser:
+    """Ученик, который ходит по сценариям бота"""
+
+    def __init__(self, user_id, api, stats, answers, think_time):
+        self.user_id = user_id
+        self.api = api
+        self.stats = stats
+        self.answers = answers
+        self.think_time = think_time
+        self.inbox = api.inbox(user_id)
+        self.user = {'id': user_id, 'is_bot': False,
+                     'first_name': f'Ученик {user_id}',
+                     'username': f'pupil{user_id}'}
+        self.last_message_id = None
+
+    def _message(self, text):
+        message = {
+            'message_id': self.api.next_message_id(),
+            'date': int(time.time()),
+            'chat': {'id': self.user_id, 'type': 'private'},
+            'from': self.user,
+            'text': text,
+        }
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0,
+                                    'length': len(text.split()[0])}]
+        return {'message': message}
+
+    def _callback(self, data):
+        return {'callback_query': {
+            'id': str(random.getrandbits(48)),
+            'from': self.user,
+            'chat_instance': str(self.user_id),
+            'data': data,
+            'message': {
+                'message_id': self.last_message_id or 1,
+                'date': int(time.time()),
+                'chat': {'id': self.user_id, 'type': 'private'},
+                'text': '',
+            },
+        }}
+
+    async def _act(self, step, update):
+        """Отправляет обновление и ждет первого ответа бота"""
+        # Ответы на предыдущие действия, пришедшие с опозданием, не считаем
+        while not self.inbox.empty():
+            self.inbox.get_nowait()
+
+        sent_at = time.perf_counter()
+        self.api.push_update(update)
+        try:
+            method, params, received_at = await asyncio.wait_for(
+                self.inbox.get(), REPLY_TIMEOUT)
+        except asyncio.TimeoutError:
+            self.stats.timeouts[step] += 1
+            return None
+
+        self.stats.latencies[step].append(received_at - sent_at)
+        text = params.get('text', '')
+        if text.startswith('❌ Произошла ошибка'):
+            self.stats.errors[step] += 1
+        if method == 'sendMessage' or params.get('message_id'):
+            self.last_message_id = int(params.get('message_id') or 0) or \
+                self.last_message_id
+        return params
+
+    async def _think(self):
+        if self.think_time:
+            await asyncio.sleep(random.uniform(0.5, 1.5) * self.think_time)
+
+    def _answer_for(self, reply):
+        """Правильный ответ с вероятностью 60%, иначе заведомо неверный"""
+        match = PROBLEM_NUMBER.search(reply.get('text', '')) if reply else None
+        if match and random.random() < 0.6:
+            return self.answers.get(int(match.group(1)), '0')
+        return '-1'
+
+    @staticmethod
+    def _buttons(reply):
+        markup = (reply or {}).get('reply_markup') or {}
+        return [button.get('callback_data') for row in
+                markup.get('inline_keyboard', []) for button in row]
+
+    async def run_random(self):
+        reply = await self._act('random', self._message('/random'))
+        await self._think()
+        await self._act('random_answer', self._message(self._answer_for(reply)))
+
+    async def run_test(self):
+        reply = await self._act('test', self._message('/test'))
+        for _ in range(random.randint(1, 3)):
+            await self._think()
+            reply = await self._act('test_answer',
+                                    self._message(self._answer_for(reply)))
+            if 'test_next' not in self._buttons(reply):
+                break
+            await self._think()
+            reply = await self._act('test_next', self._callback('test_next'))
+        await self._think()
+        await self._act('test_stop', self._callback('test_stop'))
+
+    async def run_search(self):
+        await self._act('search', self._message('/search'))
+        await self._think()
+        reply = await self._act('search_query',
+                                self._message(random.choice(SEARCH_KEYWORDS)))
+        pages = [data for data in self._buttons(reply)
+                 if data and data.startswith('search_page_')]
+        if pages:
+            await self._think()
+            await self._act('search_page', self._callback(pages[-1]))
+
+    async def run_stats(self):
+        await self._act('stats', self._message('/stats'))
+
+    async def run_leaderboard(self):
+        await self._act('leaderboard', self._message('/leaderboard'))
+
+    async def run(self, deadline):
+        names = list(SCENARIOS)
+        weights = [SCENARIOS[name] for name in names]
+        while time.perf_counter() < deadline:
+            scenario = random.choices(names, weights)[0]
+            await getattr(self, f'run_{scenario}')()
+            await self._think()
+
+
+def load_answers(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return dict(conn.execute('SELECT problem_number, answer FROM problems'))
+    finally:
+        conn.close()
+
+
+def print_report(stats, elapsed, api, lock_errors):
+    from utils.metrics import registry
+
+    total = sum(len(values) for values in stats.latencies.values())
+    print("=" * 70)
+    print(f"Длительность: {elapsed:.1f} с, ответов бота: {total}, "
+          f"пропускная способность: {total / elapsed:.1f} действий/с")
+    print(f"Запросов к Bot API: {dict(api.method_counts)}")
+    print()
+    print(f"{'шаг':<16} {'число':>7} {'p50, мс':>9} {'p95, мс':>9} "
+          f"{'p99, мс':>9} {'таймауты':>9} {'ошибки':>7}")
+    for step in sorted(stats.latencies.keys() | stats.timeouts.keys()):
+        q = stats.percentiles(step) or {0.5: 0, 0.95: 0, 0.99: 0}
+        print(f"{step:<16} {len(stats.latencies[step]):>7} "
+              f"{q[0.5] * 1000:>9.1f} {q[0.95] * 1000:>9.1f} "
+              f"{q[0.99] * 1000:>9.1f} {stats.timeouts[step]:>9} "
+              f"{stats.errors[step]:>7}")
+
+    # Время методов базы из метрик бота: где растет конкуренция за SQLite
+    print()
+    print(f"{'метод БД':<32} {'вызовов':>8} {'p50, мс':>9} {'p95, мс':>9} "
+          f"{'p99, мс':>9}")
+    db_series = registry._summaries.get('bot_db_seconds', {})
+    rows = sorted(db_series.items(),
+                  key=lambda item: item[1].total, reverse=True)
+    for labels, summary in rows[:10]:
+        q = summary.quantiles()
+        print(f"{dict(labels)['method']:<32} {summary.count:>8} "
+              f"{q[0.5] * 1000:>9.2f} {q[0.95] * 1000:>9.2f} "
+              f"{q[0.99] * 1000:>9.2f}")
+    print(f"\nОшибок 'database is locked': {lock_errors}")
+
+
+async def run_load_test(args, workdir):
+    # Конфигурация читается при импорте, поэтому main импортируется
+    # только после перехода во временный каталог
+    # Настройки передаются через окружение: рабочие процессы читают
+    # Config заново
+    os.environ.setdefault('BOT_TOKEN', '1:loadtest')
+    os.environ.update({
+        'METRICS_PORT': '0',
+        'WORKERS': str(args.workers),
+        'DB_SHARDS': str(args.shards),
+        # Фоновое обслуживание базы не должно влиять на замеры
+        'ARCHIVE_AFTER_DAYS': '0',
+        'VACUUM_PAGES': '0',
+        'BACKUP_INTERVAL': '0',
+    })
+    if not args.telegram_limits:
+        os.environ.update({
+            'SEND_GLOBAL_RATE': '1e9',
+            'SEND_CHAT_RATE': '1e9',
+            'SEND_CHAT_BURST': '1000000000',
+        })
+    sys.path.insert(0, str(ROOT))
+    import main
+    from utils.services import Services
+
+    api = FakeBotAPI()
+    await api.start()
+
+    services = Services.build(main.Config.DB_PATH, shard_count=args.shards)
+    main.initialize_database_if_needed(services.db)
+    services.load_catalog()
+
+    lock_errors = LockErrorCounter()
+    logging.getLogger().addHandler(lock_errors)
+
+    application = front = None
+    stop_front = asyncio.Event()
+    if args.workers > 1:
+        front = asyncio.create_task(
+            main.serve_workers(services, api.url, stop_front))
+    else:
+        application = main.build_application(services, bot_api_url=api.url)
+        await application.initialize()
+        await application.updater.start_polling(poll_interval=0, timeout=10)
+        await application.start()
+
+    stats = LoadTestStats()
+    answers = load_answers(main.Config.DB_PATH)
+    started = time.perf_counter()
+    deadline = started + args.duration
+
+    tasks = []
+    for i in range(args.users):
+        user = VirtualUser(100000 + i, api, stats, answers, args.think_time)
+        tasks.append(asyncio.create_task(user.run(deadline)))
+        # Пользователи подключаются постепенно в течение ramp-up
+        if args.ramp_up:
+            await asyncio.sleep(args.ramp_up / args.users)
+
+    await asyncio.gather(*tasks, return_exceptions=True)
+    elapsed = time.perf_counter() - started
+
+    if front is not None:
+        stop_front.set()
+        await front
+    else:
+        await application.updater.stop()
+        await application.stop()
+        await application.shutdown()
+    await api.stop()
+
+    print_report(stats, elapsed, api, lock_errors.count)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--duration', type=float, default=60,
+                        help='длительность теста, с')
+    parser.add_argument('--ramp-up', type=float, default=10,
+                        help='за сколько секунд подключаются все пользователи')
+    parser.add_argument('--think-time', type=float, default=1.0,
+                        help='средняя пауза пользователя между действиями, с')
+    parser.add_argument('--db', default=str(ROOT / 'math_problems.db'))
+    parser.add_argument('--telegram-limits', action='store_true',
+                        help='соблюдать лимиты исходящих сообщений Telegram')
+    parser.add_argument('--shards', type=int, default=1,
+                        help='число файлов с данными пользователей')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='число рабочих процессов бота')
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.WARNING
+    )
+
+    with tempfile.TemporaryDirectory() as workdir:
+        shutil.copy(args.db, Path(workdir) / 'math_problems.db')
+        if args.shards > 1:
+            reshard(str(Path(workdir) / 'math_problems.db'), args.shards)
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        try:
+            asyncio.run(run_load_test(args, workdir))
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    main()
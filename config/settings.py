@@ -22,9 +22,112 @@ class Config:
     # Состояния ConversationHandler
 
     WAITING_FOR_RANDOM_ANSWER = 7  # Новое состояние для случайных задач
+    WAITING_FOR_REVIEW_ANSWER = 8  # Ответ на задачу из повторения
 
-    # Настройки базы данных
-    DB_PATH = 'math_problems.db'
+    # Настройки базы данных. Шарды лежат в том же каталоге, что и
+    # основная база (см. database/sharding.py)
+    DB_PATH = os.getenv('DB_PATH', 'math_problems.db')
+    # На сколько файлов разложены данные пользователей;
+    # менять только вместе с перераспределением
+    DB_SHARDS = int(os.getenv('DB_SHARDS', '1'))
+    # Прежнее расположение базы: если DB_PATH еще нет, база при запуске
+    # копируется отсюда (см. database.sharding.adopt_legacy_database)
+    LEGACY_DB_PATH = os.getenv('LEGACY_DB_PATH', 'math_problems.db')
+
+    # Сколько задач показывать на одной странице раздела
+    SECTION_PAGE_SIZE = int(os.getenv('SECTION_PAGE_SIZE', '10'))
+
+    # Результаты поиска: задач на странице и сколько секунд
+    # хранится список найденных задач для листания
+    SEARCH_PAGE_SIZE = int(os.getenv('SEARCH_PAGE_SIZE', '5'))
+    SEARCH_SESSION_TTL = int(os.getenv('SEARCH_SESSION_TTL', '600'))
+
+    # Хранилище состояния диалогов (по умолчанию в той же базе,
+    # чтобы оно переживало перезапуск контейнера вместе с ней)
+    PERSISTENCE_DB_PATH = os.getenv('PERSISTENCE_DB_PATH', DB_PATH)
+    # Как часто (в секундах) изменения user_data сбрасываются в базу
+    PERSISTENCE_UPDATE_INTERVAL = float(
+        os.getenv('PERSISTENCE_UPDATE_INTERVAL', '10'))
+
+    # Параллельная обработка обновлений: сколько обработчиков выполняется
+    # одновременно и сколько обновлений может ждать своей очереди
+    MAX_CONCURRENT_UPDATES = int(os.getenv('MAX_CONCURRENT_UPDATES', '16'))
+    MAX_PENDING_UPDATES = int(os.getenv('MAX_PENDING_UPDATES', '1024'))
+
+    # Число процессов-обработчиков. При WORKERS > 1 основной процесс только
+    # принимает обновления и раздает их рабочим процессам по хешу чата
+    WORKERS = int(os.getenv('WORKERS', '1'))
+    # Как часто (в секундах) рабочие процессы перечитывают сложность задач
+    # по попыткам всех процессов
+    ADAPTIVE_RELOAD_INTERVAL = float(
+        os.getenv('ADAPTIVE_RELOAD_INTERVAL', '60'))
+
+    # Лимиты исходящих сообщений (по ограничениям Telegram): всего в секунду,
+    # в секунду в личный чат (с запасом на короткие всплески), в минуту в группу
+    SEND_GLOBAL_RATE = float(os.getenv('SEND_GLOBAL_RATE', '30'))
+    SEND_CHAT_RATE = float(os.getenv('SEND_CHAT_RATE', '1'))
+    SEND_CHAT_BURST = int(os.getenv('SEND_CHAT_BURST', '3'))
+    SEND_GROUP_RATE_PER_MINUTE = float(
+        os.getenv('SEND_GROUP_RATE_PER_MINUTE', '20'))
+    # Сколько раз повторять запрос после ответа 429
+    SEND_MAX_RETRIES = int(os.getenv('SEND_MAX_RETRIES', '3'))
+
+    # Профилирование SQL-запросов: запросы дольше SLOW_QUERY_MS пишутся
+    # в лог database.slow_queries, для доли из них сохраняется план запроса
+    SQL_PROFILING = os.getenv('SQL_PROFILING', '0') == '1'
+    SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', '50'))
+    SQL_EXPLAIN_SAMPLE_RATE = float(os.getenv('SQL_EXPLAIN_SAMPLE_RATE', '0.1'))
+
+    # Архивация попыток: попытки старше ARCHIVE_AFTER_DAYS дней раз в
+    # MAINTENANCE_INTERVAL секунд переносятся в помесячные архивы
+    # (по умолчанию 0 - не архивировать, см. README), после чего файлу
+    # базы возвращается до VACUUM_PAGES свободных страниц (0 - не освобождать)
+    ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', '0'))
+    ARCHIVE_BATCH_SIZE = int(os.getenv('ARCHIVE_BATCH_SIZE', '5000'))
+    MAINTENANCE_INTERVAL = float(os.getenv('MAINTENANCE_INTERVAL', '21600'))
+    VACUUM_PAGES = int(os.getenv('VACUUM_PAGES', '2000'))
+
+    # Резервные копии базы раз в BACKUP_INTERVAL секунд (по умолчанию
+    # 0 - не делать, см. README): копия снимается порциями по BACKUP_PAGES
+    # страниц с паузой BACKUP_STEP_SLEEP секунд, в BACKUP_DIR хранится
+    # BACKUP_KEEP копий каждого файла
+    BACKUP_INTERVAL = float(os.getenv('BACKUP_INTERVAL', '0'))
+    BACKUP_DIR = os.getenv('BACKUP_DIR', 'backups')
+    BACKUP_KEEP = int(os.getenv('BACKUP_KEEP', '7'))
+    BACKUP_PAGES = int(os.getenv('BACKUP_PAGES', '256'))
+    BACKUP_STEP_SLEEP = float(os.getenv('BACKUP_STEP_SLEEP', '0.05'))
+
+    # Раз в REVIEW_PLAN_INTERVAL секунд пересчитываются планы интервальных
+    # повторений на завтра (0 - не пересчитывать)
+    REVIEW_PLAN_INTERVAL = float(os.getenv('REVIEW_PLAN_INTERVAL', '21600'))
+
+    # HTTP-адрес метрик в формате Prometheus. Адрес отдается без
+    # авторизации, поэтому сервер запускается, только если задан порт
+    # (0 - не запускать); при WORKERS > 1 рабочие процессы занимают
+    # следующие порты
+    METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+    METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+
+    # Режим получения обновлений: 'polling' или 'webhook'
+    RUN_MODE = os.getenv('RUN_MODE', 'polling').lower()
+
+    # Настройки webhook (используются только при RUN_MODE=webhook)
+    WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+    WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+    WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', 'telegram').strip('/')
+    # Публичный адрес, по которому Telegram доступен наш сервер
+    # (например, адрес балансировщика): https://bot.example.com
+    WEBHOOK_URL = os.getenv('WEBHOOK_URL')
+    # Telegram передает его в заголовке X-Telegram-Bot-Api-Secret-Token;
+    # пустое значение (docker-compose без переменной) - проверки нет,
+    # иначе PTB отклонял бы все обновления
+    WEBHOOK_SECRET_TOKEN = os.getenv('WEBHOOK_SECRET_TOKEN') or None
+
+    if RUN_MODE not in ('polling', 'webhook'):
+        raise ValueError(f"Неизвестный RUN_MODE: {RUN_MODE}")
+
+    if RUN_MODE == 'webhook' and not WEBHOOK_URL:
+        raise ValueError("Для RUN_MODE=webhook необходимо задать WEBHOOK_URL")
 
     # Список администраторов (можно добавить несколько через запятую)
     ADMIN_IDS = [int(admin_id.strip()) for admin_id in
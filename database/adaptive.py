@@ -0,0 +1,144 @@
+"""Подбор задач теста по уровню ученика.
+
+Эмпирическая сложность задачи - доля неверных попыток всех
+пользователей, сглаженная априорной оценкой по difficulty_level, пока
+попыток мало. Счетчики попыток по задачам хранятся в таблице
+problem_stats и в памяти обновляются с каждой попыткой.
+
+Уровень ученика - точка на той же шкале сложности от 0 до 1; после
+каждой задачи теста он сдвигается, как рейтинг Эло.
+"""
+import copy
+import math
+import random
+from bisect import bisect_left, insort
+
+# Ожидаемая доля верных попыток по уровню из DatabaseInitializer
+PRIOR_SUCCESS = {'легкая': 0.8, 'средняя': 0.6, 'сложная': 0.4}
+DEFAULT_PRIOR_SUCCESS = 0.6
+# Сколько попыток весит априорная оценка
+PRIOR_WEIGHT = 10
+
+# Начальный уровень: чуть легче средней задачи
+DEFAULT_ABILITY = 0.35
+ABILITY_RATE = 0.1
+# Крутизна кривой вероятности решить задачу от разницы уровней
+ABILITY_SCALE = 8
+
+
+def rebuild_problem_stats(cursor):
+    """Пересчитывает problem_stats по попыткам и сводкам архива"""
+    cursor.execute('DELETE FROM problem_stats')
+    cursor.execute('''
+        INSERT INTO problem_stats (problem_number, attempts, correct_attempts)
+        SELECT problem_number, SUM(attempts), SUM(correct_attempts)
+        FROM (
+            SELECT problem_number, COUNT(*) AS attempts,
+                   SUM(CASE WHEN is_correct THEN 1 ELSE 0 END)
+                       AS correct_attempts
+            FROM user_attempts
+            WHERE problem_number IS NOT NULL
+            GROUP BY problem_number
+            UNION ALL
+            SELECT problem_number, attempts, correct_attempts
+            FROM user_problem_rollup
+        )
+        GROUP BY problem_number
+    ''')
+
+
+def update_ability(ability, difficulty, score):
+    """Новый уровень ученика после задачи.
+
+    score - результат от 0 (не решил) до 1 (решил с первой попытки).
+    """
+    expected = 1 / (1 + math.exp(-ABILITY_SCALE * (ability - difficulty)))
+    ability += ABILITY_RATE * (score - expected)
+    return min(1.0, max(0.0, ability))
+
+
+class AdaptiveSelector:
+    """Задачи, упорядоченные по эмпирической сложности.
+
+    Список (сложность, номер) поддерживается отсортированным при каждой
+    попытке, поэтому задача около уровня ученика находится бинарным
+    поиском, а не запросом ORDER BY RANDOM(). Обновление - сдвиг в списке
+    длиной в число задач (O(n), но это несколько тысяч элементов).
+
+    Счетчики в памяти учитывают только попытки своего процесса; при
+    нескольких процессах их периодически перечитывают из problem_stats
+    (см. AdaptiveReloader).
+    """
+
+    def __init__(self, catalog, stats):
+        # номер задачи -> ожидаемая доля верных попыток до накопления данных
+        self.priors = {
+            problem_number: PRIOR_SUCCESS.get(problem.difficulty_level,
+                                              DEFAULT_PRIOR_SUCCESS)
+            for problem_number, problem in catalog.problems.items()}
+        self.reset(stats)
+
+    def reset(self, stats):
+        """Загружает счетчики: номер задачи -> (попыток, верных)"""
+        self.counts = {problem_number: list(stats.get(problem_number, (0, 0)))
+                       for problem_number in self.priors}
+        self.difficulties = {problem_number: self._difficulty(problem_number)
+                             for problem_number in self.priors}
+        self._order = sorted((difficulty, problem_number) for
+                             problem_number, difficulty
+                             in self.difficulties.items())
+
+    def with_stats(self, stats):
+        """Новый селектор с теми же задачами и счетчиками из stats.
+
+        Текущий селектор не меняется, поэтому его можно заменить новым,
+        собранным в другом потоке.
+        """
+        selector = copy.copy(self)
+        selector.reset(stats)
+        return selector
+
+    def _difficulty(self, problem_number):
+        attempts, correct = self.counts[problem_number]
+        success = ((correct + self.priors[problem_number] * PRIOR_WEIGHT)
+                   / (attempts + PRIOR_WEIGHT))
+        return 1 - success
+
+    def record(self, problem_number, is_correct):
+        """Учитывает попытку в сложности задачи"""
+        problem_number = int(problem_number)
+        counts = self.counts.get(problem_number)
+        if counts is None:
+            return
+        counts[0] += 1
+        counts[1] += bool(is_correct)
+
+        old = (self.difficulties[problem_number], problem_number)
+        del self._order[bisect_left(self._order, old)]
+        difficulty = self.difficulties[problem_number] = \
+            self._difficulty(problem_number)
+        insort(self._order, (difficulty, problem_number))
+
+    def pick(self, ability, exclude=(), choices=3):
+        """Номер задачи со сложностью около ability или None.
+
+        Из choices ближайших задач не из exclude выбирается случайная,
+        чтобы ученики с одинаковым уровнем получали разные задачи.
+        """
+        order = self._order
+        right = bisect_left(order, (ability,))
+        left = right - 1
+        candidates = []
+        while len(candidates) < choices and (left >= 0 or right < len(order)):
+            # Берем ближайшую по сложности с любой стороны
+            if right >= len(order) or (
+                    left >= 0 and ability - order[left][0]
+                    <= order[right][0] - ability):
+                problem_number = order[left][1]
+                left -= 1
+            else:
+                problem_number = order[right][1]
+                right += 1
+            if problem_number not in exclude:
+                candidates.append(problem_number)
+        return random.choice(candidates) if candidates else None
@@ -0,0 +1,277 @@
+"""Архивация старых попыток и освобождение места в файле базы.
+
+Попытки старше заданного горизонта переносятся из user_attempts в
+помесячные таблицы user_attempts_archive_ГГГГ_ММ, а их итоги
+добавляются в сводки user_problem_rollup и user_daily_rollup. Рабочая
+таблица остается маленькой, а статистика - точной.
+
+Ручной запуск: python -m database.archive [база] [--days 180] [--vacuum]
+"""
+import argparse
+import logging
+import re
+import sqlite3
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+_PERIOD = re.compile(r'^\d{4}-\d{2}$')
+
+# Колонки попытки, общие для рабочей таблицы и архивов
+ATTEMPT_COLUMNS = ('id, user_id, problem_number, user_answer, correct_answer, '
+                   'is_correct, attempt_number, solved_at')
+
+
+def archive_table_name(period):
+    """Имя таблицы архива для месяца 'ГГГГ-ММ'"""
+    if not _PERIOD.match(period or ''):
+        raise ValueError(f"Некорректный период архива: {period!r}")
+    return f"user_attempts_archive_{period.replace('-', '_')}"
+
+
+def archive_tables(cursor):
+    """Таблицы архивов, от новых к старым"""
+    cursor.execute(
+        'SELECT table_name FROM attempt_archives ORDER BY period DESC')
+    return [row[0] for row in cursor.fetchall()]
+
+
+def archive_cutoff(days):
+    """Граница архивации: попытки раньше нее уходят в архив"""
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    # В формате CURRENT_TIMESTAMP, которым заполняется solved_at
+    return cutoff.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def ensure_archive_table(cursor, period, schema='main'):
+    """Создает таблицу архива месяца, если ее еще нет"""
+    table = archive_table_name(period)
+    # Строки архива хранятся по пользователям: чтение истории одного
+    # пользователя не требует отдельного индекса
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS {schema}.{table} (
+            id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            problem_number INTEGER,
+            user_answer TEXT NOT NULL,
+            correct_answer TEXT NOT NULL,
+            is_correct BOOLEAN,
+            attempt_number INTEGER,
+            solved_at TIMESTAMP,
+            PRIMARY KEY (user_id, id)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute(f'''
+        INSERT OR IGNORE INTO {schema}.attempt_archives (period, table_name)
+        VALUES (?, ?)
+    ''', (period, table))
+    return table
+
+
+def rebuild_user_rollups(cursor, user_id):
+    """Пересчитывает сводки пользователя по его строкам в архивах"""
+    cursor.execute('DELETE FROM user_problem_rollup WHERE user_id = ?',
+                   (user_id,))
+    cursor.execute('DELETE FROM user_daily_rollup WHERE user_id = ?',
+                   (user_id,))
+
+    tables = archive_tables(cursor)
+    if not tables:
+        return
+    source = ' UNION ALL '.join(
+        f'SELECT problem_number, is_correct, solved_at FROM {table} '
+        f'WHERE user_id = ?' for table in tables)
+    params = (user_id,) * len(tables)
+
+    cursor.execute(f'''
+        INSERT INTO user_problem_rollup
+            (user_id, problem_number, attempts, correct_attempts,
+             first_attempt_at, last_attempt_at)
+        SELECT ?, problem_number, COUNT(*),
+               SUM(CASE WHEN is_correct THEN 1 ELSE 0 END),
+               MIN(solved_at), MAX(solved_at)
+        FROM ({source})
+        WHERE problem_number IS NOT NULL
+        GROUP BY problem_number
+    ''', (user_id, *params))
+    cursor.execute(f'''
+        INSERT INTO user_daily_rollup (user_id, day, attempts, correct_attempts)
+        SELECT ?, substr(solved_at, 1, 10), COUNT(*),
+               SUM(CASE WHEN is_correct THEN 1 ELSE 0 END)
+        FROM ({source})
+        GROUP BY substr(solved_at, 1, 10)
+    ''', (user_id, *params))
+
+
+class AttemptArchiver:
+    """Перенос старых попыток в архив и incremental_vacuum.
+
+    Попытки переносятся пачками по batch_size строк, каждая пачка - в
+    своей транзакции, поэтому бот не ждет блокировку записи долго.
+    """
+
+    def __init__(self, db_path, batch_size=5000):
+        self.db_path = db_path
+        self.batch_size = batch_size
+
+    def archive_before(self, cutoff):
+        """Переносит в архив попытки раньше cutoff. Возвращает их число"""
+        conn = sqlite3.connect(self.db_path)
+        moved = 0
+        try:
+            conn.execute(f'''
+                CREATE TEMP TABLE IF NOT EXISTS archive_batch AS
+                SELECT {ATTEMPT_COLUMNS}, '' AS period
+                FROM user_attempts WHERE 0
+            ''')
+            while True:
+                batch = self._archive_batch(conn, cutoff)
+                if not batch:
+                    break
+                moved += batch
+        finally:
+            conn.close()
+
+        if moved:
+            logger.info(f"В архив перенесено попыток: {moved}")
+        return moved
+
+    def _archive_batch(self, conn, cutoff):
+        cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            cursor.execute('DELETE FROM temp.archive_batch')
+            # Попытки без пользователя в архив не попадают:
+            # user_id входит в первичный ключ архива
+            cursor.execute(f'''
+                INSERT INTO temp.archive_batch
+                SELECT {ATTEMPT_COLUMNS}, substr(solved_at, 1, 7)
+                FROM user_attempts
+                WHERE solved_at < ? AND user_id IS NOT NULL
+                ORDER BY id
+                LIMIT ?
+            ''', (cutoff, self.batch_size))
+            count = cursor.rowcount
+            if not count:
+                cursor.execute('COMMIT')
+                return 0
+
+            cursor.execute('SELECT DISTINCT period FROM temp.archive_batch')
+            for (period,) in cursor.fetchall():
+                table = ensure_archive_table(cursor, period)
+                cursor.execute(f'''
+                    INSERT INTO {table} ({ATTEMPT_COLUMNS})
+                    SELECT {ATTEMPT_COLUMNS} FROM temp.archive_batch
+                    WHERE period = ?
+                ''', (period,))
+                cursor.execute('''
+                    UPDATE attempt_archives
+                    SET rows = rows + ?, updated_at = CURRENT_TIMESTAMP
+                    WHERE period = ?
+                ''', (cursor.rowcount, period))
+
+            cursor.execute('''
+                INSERT INTO user_problem_rollup
+                    (user_id, problem_number, attempts, correct_attempts,
+                     first_attempt_at, last_attempt_at)
+                SELECT user_id, problem_number, COUNT(*),
+                       SUM(CASE WHEN is_correct THEN 1 ELSE 0 END),
+                       MIN(solved_at), MAX(solved_at)
+                FROM temp.archive_batch
+                WHERE problem_number IS NOT NULL
+                GROUP BY user_id, problem_number
+                ON CONFLICT (user_id, problem_number) DO UPDATE SET
+                    attempts = attempts + excluded.attempts,
+                    correct_attempts = correct_attempts + excluded.correct_attempts,
+                    first_attempt_at = MIN(first_attempt_at,
+                                           excluded.first_attempt_at),
+                    last_attempt_at = MAX(last_attempt_at,
+                                          excluded.last_attempt_at)
+            ''')
+            cursor.execute('''
+                INSERT INTO user_daily_rollup
+                    (user_id, day, attempts, correct_attempts)
+                SELECT user_id, substr(solved_at, 1, 10), COUNT(*),
+                       SUM(CASE WHEN is_correct THEN 1 ELSE 0 END)
+                FROM temp.archive_batch
+                GROUP BY user_id, substr(solved_at, 1, 10)
+                ON CONFLICT (user_id, day) DO UPDATE SET
+                    attempts = attempts + excluded.attempts,
+                    correct_attempts = correct_attempts + excluded.correct_attempts
+            ''')
+
+            cursor.execute('''
+                DELETE FROM user_attempts
+                WHERE id IN (SELECT id FROM temp.archive_batch)
+            ''')
+            cursor.execute('COMMIT')
+        except Exception:
+            cursor.execute('ROLLBACK')
+            logger.error("Ошибка при архивации попыток")
+            raise
+        return count
+
+    def incremental_vacuum(self, max_pages):
+        """Возвращает файлу до max_pages свободных страниц.
+
+        Работает только в базах с auto_vacuum = INCREMENTAL; остальные
+        нужно один раз перевести через vacuum(). Возвращает число
+        освобожденных страниц или None, если режим не тот.
+        """
+        conn = sqlite3.connect(self.db_path)
+        try:
+            if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+                return None
+            before = conn.execute('PRAGMA freelist_count').fetchone()[0]
+            if before:
+                conn.execute(f'PRAGMA incremental_vacuum({int(max_pages)})') \
+                    .fetchall()
+            after = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        finally:
+            conn.close()
+        return before - after
+
+    def vacuum(self):
+        """Полный VACUUM с переводом базы в режим auto_vacuum = INCREMENTAL.
+
+        Переписывает весь файл и блокирует базу на все время работы,
+        поэтому запускается вручную, а не планировщиком.
+        """
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            conn.execute('VACUUM')
+        finally:
+            conn.close()
+        logger.info(f"VACUUM базы {self.db_path} завершен")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('db_path', nargs='?', default='math_problems.db')
+    parser.add_argument('--days', type=int, default=180,
+                        help='архивировать попытки старше стольких дней')
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--vacuum', action='store_true',
+                        help='после архивации выполнить полный VACUUM')
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+
+    # Применяет недостающие миграции, в том числе таблицы архива
+    from database.models import MathProblemsDB
+    MathProblemsDB(args.db_path)
+
+    archiver = AttemptArchiver(args.db_path, args.batch_size)
+    moved = archiver.archive_before(archive_cutoff(args.days))
+    print(f"Перенесено в архив: {moved}")
+    if args.vacuum:
+        archiver.vacuum()
+        print("VACUUM выполнен")
+
+
+if __name__ == "__main__":
+    main()
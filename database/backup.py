@@ -0,0 +1,205 @@
+"""Резервные копии базы через online backup API SQLite.
+
+Копия снимается порциями по pages страниц с паузой между ними, поэтому
+бот продолжает записывать попытки во время копирования. Готовая копия
+проверяется, сжимается gzip и кладется в каталог копий, где хранится
+не больше keep последних файлов.
+
+Каждый файл (основная база и каждый шард) копируется и восстанавливается
+отдельно: общего снимка у шардов нет.
+
+Запуск: python -m database.backup backup [--db ФАЙЛ] [--dir КАТАЛОГ]
+        python -m database.backup list [--db ФАЙЛ] [--dir КАТАЛОГ]
+        python -m database.backup restore [КОПИЯ] [--db ФАЙЛ]
+"""
+import argparse
+import gzip
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+BACKUP_SUFFIX = '.db.gz'
+
+
+class BackupRestarted(Exception):
+    """Копирование началось заново из-за записи в базу"""
+
+
+class BackupManager:
+    """Снятие, ротация и восстановление сжатых копий базы"""
+
+    def __init__(self, db_path, backup_dir='backups', keep=7, pages=256,
+                 step_sleep=0.05, max_restarts=3):
+        self.db_path = db_path
+        self.backup_dir = Path(backup_dir)
+        self.keep = keep
+        self.pages = pages
+        self.step_sleep = step_sleep
+        self.max_restarts = max_restarts
+
+    def backup(self):
+        """Снимает копию базы и возвращает путь к сжатому файлу"""
+        self.backup_dir.mkdir(parents=True, exist_ok=True)
+        # Микросекунды в имени: ручная и плановая копии, снятые в одну
+        # секунду, не перезаписывают друг друга
+        name = (f"{Path(self.db_path).stem}-"
+                f"{datetime.now():%Y%m%d-%H%M%S-%f}")
+        target = self.backup_dir / f"{name}{BACKUP_SUFFIX}"
+
+        with tempfile.TemporaryDirectory(dir=self.backup_dir) as workdir:
+            snapshot = os.path.join(workdir, f"{name}.db")
+            self._snapshot(snapshot)
+
+            # Пишем во временный файл: незаконченная копия не попадет
+            # в список и не вытеснит при ротации целую
+            partial = os.path.join(workdir, f"{name}{BACKUP_SUFFIX}")
+            with open(snapshot, 'rb') as src, \
+                    gzip.open(partial, 'wb', compresslevel=6) as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+            # link, в отличие от replace, не перезаписывает существующую
+            # копию, а завершается ошибкой
+            os.link(partial, target)
+
+        self.rotate()
+        logger.info(f"Резервная копия базы сохранена: {target}")
+        return target
+
+    def _snapshot(self, path):
+        """Копирует базу в path через backup API и проверяет копию"""
+        source = sqlite3.connect(self.db_path)
+        dest = sqlite3.connect(path)
+        try:
+            # Запись в базу из другого соединения начинает пошаговое
+            # копирование заново. Если база меняется чаще, чем успевает
+            # копироваться, увеличиваем порцию, а в конце копируем
+            # за один шаг
+            pages = self.pages
+            for _ in range(self.max_restarts):
+                try:
+                    source.backup(dest, pages=pages,
+                                  progress=self._restart_guard(),
+                                  sleep=self.step_sleep)
+                    break
+                except BackupRestarted:
+                    pages *= 4
+            else:
+                logger.warning("Копирование базы перезапускалось "
+                               f"{self.max_restarts} раз, копируем за "
+                               f"один шаг")
+                source.backup(dest, pages=-1)
+
+            result = dest.execute('PRAGMA quick_check').fetchone()[0]
+            if result != 'ok':
+                raise sqlite3.DatabaseError(
+                    f"Копия базы не прошла проверку: {result}")
+        finally:
+            dest.close()
+            source.close()
+
+    @staticmethod
+    def _restart_guard():
+        """Колбэк progress, прерывающий копирование, начатое заново"""
+        last_remaining = None
+
+        def progress(status, remaining, total):
+            nonlocal last_remaining
+            # Перезапуск виден по тому, что страниц осталось больше
+            if last_remaining is not None and remaining > last_remaining:
+                raise BackupRestarted()
+            last_remaining = remaining
+
+        return progress
+
+    def list_backups(self):
+        """Файлы копий, от новых к старым"""
+        if not self.backup_dir.is_dir():
+            return []
+        # Имя содержит время снятия, поэтому сортировка по имени
+        # совпадает с сортировкой по времени. Копии шардов лежат в том же
+        # каталоге, но у них свое имя файла
+        pattern = f"{Path(self.db_path).stem}-*{BACKUP_SUFFIX}"
+        return sorted(self.backup_dir.glob(pattern), reverse=True)
+
+    def rotate(self):
+        """Удаляет копии сверх keep последних"""
+        removed = []
+        for path in self.list_backups()[self.keep:]:
+            path.unlink()
+            removed.append(path)
+        if removed:
+            logger.info(f"Удалено старых копий: {len(removed)}")
+        return removed
+
+    def restore(self, backup_path=None):
+        """Восстанавливает базу из копии (по умолчанию - последней).
+
+        Содержимое переносится в db_path тем же backup API, поэтому
+        файл базы не подменяется под открытыми соединениями. Бот на время
+        восстановления лучше остановить: его кэши не узнают о новых данных.
+        """
+        if backup_path is None:
+            backups = self.list_backups()
+            if not backups:
+                raise FileNotFoundError(f"В {self.backup_dir} нет копий")
+            backup_path = backups[0]
+
+        with tempfile.TemporaryDirectory() as workdir:
+            snapshot = os.path.join(workdir, 'restore.db')
+            with gzip.open(backup_path, 'rb') as src, \
+                    open(snapshot, 'wb') as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+
+            source = sqlite3.connect(snapshot)
+            dest = sqlite3.connect(self.db_path)
+            try:
+                result = source.execute('PRAGMA quick_check').fetchone()[0]
+                if result != 'ok':
+                    raise sqlite3.DatabaseError(
+                        f"Копия {backup_path} повреждена: {result}")
+                source.backup(dest)
+            finally:
+                dest.close()
+                source.close()
+
+        logger.info(f"База {self.db_path} восстановлена из {backup_path}")
+        return backup_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('command', choices=['backup', 'list', 'restore'])
+    parser.add_argument('backup_path', nargs='?',
+                        help='копия для restore (по умолчанию последняя)')
+    parser.add_argument('--db', default='math_problems.db')
+    parser.add_argument('--dir', default='backups')
+    parser.add_argument('--keep', type=int, default=7)
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+
+    manager = BackupManager(args.db, args.dir, keep=args.keep)
+    if args.command == 'backup':
+        started = time.perf_counter()
+        path = manager.backup()
+        print(f"Копия {path} ({path.stat().st_size} байт) "
+              f"за {time.perf_counter() - started:.1f} с")
+    elif args.command == 'list':
+        for path in manager.list_backups():
+            print(f"{path}  {path.stat().st_size} байт")
+    else:
+        path = manager.restore(args.backup_path)
+        print(f"База {args.db} восстановлена из {path}")
+
+
+if __name__ == "__main__":
+    main()
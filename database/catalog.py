@@ -0,0 +1,91 @@
+import logging
+from collections import Counter, namedtuple
+
+logger = logging.getLogger(__name__)
+
+# Задача в каталоге: то, что нужно для списков, навигации и проверки
+# ответов в тесте
+CatalogProblem = namedtuple(
+    'CatalogProblem',
+    ['problem_number', 'section_id', 'problem_text', 'difficulty_level',
+     'answer'])
+
+# Страница раздела: задачи страницы и данные для навигации
+SectionPage = namedtuple(
+    'SectionPage',
+    ['section_id', 'section_name', 'problems', 'page', 'page_count', 'total'])
+
+
+class ProblemCatalog:
+    """Неизменяемый снимок разделов и задач в памяти.
+
+    Задачи каждого раздела хранятся в упорядоченном по номеру списке,
+    поэтому страница раздела - это срез за O(размер страницы) без
+    обращения к базе. После переинициализации базы каталог нужно
+    загрузить заново.
+    """
+
+    def __init__(self, sections, problems):
+        # id раздела -> (название, описание)
+        self.sections = {section_id: (name, description)
+                         for section_id, name, description in sections}
+        # номер задачи -> задача
+        self.problems = {}
+        # id раздела -> задачи раздела по возрастанию номера
+        self.section_problems = {section_id: [] for section_id in self.sections}
+        for problem in problems:
+            self.problems[problem.problem_number] = problem
+            self.section_problems.setdefault(problem.section_id, []).append(
+                problem)
+
+        # Метаданные разделов считаются один раз при загрузке
+        self.section_counts = {section_id: len(problems) for section_id, problems
+                               in self.section_problems.items()}
+        self.difficulty_histograms = {
+            section_id: Counter(problem.difficulty_level for problem in problems)
+            for section_id, problems in self.section_problems.items()}
+
+    @classmethod
+    def load(cls, db):
+        """Загружает каталог из базы данных"""
+        sections = db.get_all_sections()
+        problems = [CatalogProblem(problem_number, section_id, str(text),
+                                   difficulty, str(answer))
+                    for section_id, problem_number, text, difficulty, answer
+                    in db.get_catalog_rows()]
+        catalog = cls(sections, problems)
+        logger.info(f"Каталог загружен: {len(catalog.sections)} разделов, "
+                    f"{len(problems)} задач")
+        return catalog
+
+    def section_name(self, section_id):
+        section = self.sections.get(section_id)
+        return section[0] if section else "Неизвестный раздел"
+
+    def get_problem(self, problem_number):
+        """Задача в виде MathProblemsDB.get_problem_by_number:
+        (номер, текст, ответ, название раздела) или None"""
+        problem = self.problems.get(problem_number)
+        if problem is None:
+            return None
+        return (problem.problem_number, problem.problem_text, problem.answer,
+                self.section_name(problem.section_id))
+
+    def section_of(self, problem_number):
+        """id раздела задачи или None, если задачи нет в каталоге"""
+        problem = self.problems.get(problem_number)
+        return problem.section_id if problem else None
+
+    def page_count(self, section_id, page_size):
+        total = len(self.section_problems.get(section_id, ()))
+        return max(1, -(-total // page_size))
+
+    def get_page(self, section_id, page, page_size):
+        """Возвращает страницу раздела. Номер страницы приводится к допустимому"""
+        problems = self.section_problems.get(section_id, [])
+        page_count = self.page_count(section_id, page_size)
+        page = min(max(page, 0), page_count - 1)
+        start = page * page_size
+        return SectionPage(section_id, self.section_name(section_id),
+                           problems[start:start + page_size], page,
+                           page_count, len(problems))
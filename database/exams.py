@@ -0,0 +1,232 @@
+"""Экзамены для всего класса с заранее составленным списком задач.
+
+Когда учитель запускает экзамен, последовательность задач составляется
+один раз и хранится в exam_sessions массивом int32. Тестовый режим
+ученика во время экзамена берет задачи по индексу из этого массива
+вместо подбора задач для каждого ученика. Если задачи перемешиваются,
+порядок ученика выводится из seed сессии и его user_id, поэтому хранить
+его не нужно.
+
+Ответы учеников пишутся в exam_answers в шард пользователя; при
+завершении экзамена они сводятся за один проход по каждому шарду.
+"""
+import logging
+import random
+import time
+from array import array
+from collections import namedtuple
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Сколько секунд процесс доверяет запомненной активной сессии: экзамен,
+# запущенный или остановленный в другом процессе, будет замечен позже
+ACTIVE_SESSION_TTL = 5
+
+
+class ExamSession(namedtuple('ExamSession',
+                             'id problems shuffle seed started_at')):
+    """Экзамен: номера задач (array('i')) в порядке без перемешивания"""
+
+    def order_for(self, user_id):
+        """Порядок позиций задач для ученика"""
+        order = list(range(len(self.problems)))
+        if self.shuffle:
+            random.Random(f"{self.seed}:{user_id}").shuffle(order)
+        return order
+
+
+ExamResults = namedtuple('ExamResults', 'session pupils problems')
+
+
+def build_exam_sequence(difficulties, count, rng=random):
+    """Случайные count задач по возрастанию эмпирической сложности.
+
+    difficulties - номер задачи -> сложность (AdaptiveSelector.difficulties).
+    """
+    problem_numbers = rng.sample(sorted(difficulties),
+                                 min(count, len(difficulties)))
+    return sorted(problem_numbers,
+                  key=lambda number: (difficulties[number], number))
+
+
+def _decode(row):
+    session_id, blob, shuffle, seed, started_at = row
+    problems = array('i')
+    problems.frombytes(blob)
+    return ExamSession(session_id, problems, bool(shuffle), seed, started_at)
+
+
+class ExamStore:
+    """Экзаменационные сессии и ответы учеников"""
+
+    def __init__(self, db):
+        self.db = db
+        # id сессии -> ExamSession; массив задач сессии не меняется
+        self._sessions = {}
+        self._active = None
+        self._active_checked = None
+
+    def start(self, problem_numbers, shuffle=False):
+        """Запускает экзамен; None, если уже идет другой"""
+        seed = random.getrandbits(31)
+        blob = array('i', problem_numbers).tobytes()
+        # Блокировка на запись берется до проверки: иначе два процесса
+        # могут одновременно не найти активный экзамен и запустить два
+        with self.db._transaction() as cursor:
+            cursor.execute('SELECT 1 FROM exam_sessions '
+                           'WHERE finished_at IS NULL')
+            if cursor.fetchone():
+                return None
+            cursor.execute('''
+                INSERT INTO exam_sessions (problems, shuffle, seed)
+                VALUES (?, ?, ?)
+            ''', (blob, int(shuffle), seed))
+            cursor.execute('''
+                SELECT id, problems, shuffle, seed, started_at
+                FROM exam_sessions WHERE id = ?
+            ''', (cursor.lastrowid,))
+            row = cursor.fetchone()
+
+        session = self._sessions[row[0]] = _decode(row)
+        self._set_active(session)
+        logger.info(f"Запущен экзамен {session.id}: "
+                    f"{len(session.problems)} задач")
+        return session
+
+    def _set_active(self, session):
+        self._active = session
+        self._active_checked = time.monotonic()
+
+    def active(self):
+        """Текущий экзамен или None"""
+        if self._active_checked is not None and \
+                time.monotonic() - self._active_checked < ACTIVE_SESSION_TTL:
+            return self._active
+
+        conn = self.db._connect()
+        try:
+            row = conn.execute('''
+                SELECT id FROM exam_sessions WHERE finished_at IS NULL
+            ''').fetchone()
+            session = None
+            if row is not None:
+                session = self._sessions.get(row[0])
+                if session is None:
+                    session = self._sessions[row[0]] = _decode(
+                        conn.execute('''
+                            SELECT id, problems, shuffle, seed, started_at
+                            FROM exam_sessions WHERE id = ?
+                        ''', row).fetchone())
+        finally:
+            conn.close()
+        self._set_active(session)
+        return session
+
+    def resume_position(self, session_id, user_id):
+        """Позиция, с которой ученик продолжает экзамен"""
+        conn = self.db._connect(user_id)
+        try:
+            row = conn.execute('''
+                SELECT MAX(position) FROM exam_answers
+                WHERE session_id = ? AND user_id = ?
+            ''', (session_id, user_id)).fetchone()
+        finally:
+            conn.close()
+        return 0 if row[0] is None else row[0] + 1
+
+    def record(self, session_id, user_id, position, problem_number,
+               attempts, is_correct):
+        """Сохраняет итог ученика по задаче экзамена.
+
+        Засчитывается только первый итог по позиции и только пока
+        экзамен не завершен: кэш active() в других процессах может
+        устареть, поэтому это проверяется в той же вставке. Возвращает
+        True, если итог записан.
+        """
+        conn = self.db._connect(user_id, content=True)
+        try:
+            with conn:
+                cursor = conn.execute('''
+                    INSERT OR IGNORE INTO exam_answers
+                        (session_id, user_id, position, problem_number,
+                         attempts, is_correct)
+                    SELECT ?, ?, ?, ?, ?, ?
+                    WHERE EXISTS (SELECT 1 FROM exam_sessions
+                                  WHERE id = ? AND finished_at IS NULL)
+                ''', (session_id, user_id, position, problem_number,
+                      attempts, bool(is_correct), session_id))
+                return cursor.rowcount == 1
+        finally:
+            conn.close()
+
+    def finish(self):
+        """Завершает текущий экзамен и сводит результаты.
+
+        Возвращает ExamResults или None, если экзамен не идет:
+        pupils - список словарей по ученикам (лучшие первыми),
+        problems - номер задачи -> [ответивших, решивших].
+        """
+        # Как и в start, экзамен завершает только один процесс
+        with self.db._transaction() as cursor:
+            cursor.execute('''
+                SELECT id, problems, shuffle, seed, started_at
+                FROM exam_sessions WHERE finished_at IS NULL
+            ''')
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            # Новые ответы после этого момента не принимаются
+            cursor.execute('''
+                UPDATE exam_sessions SET finished_at = ? WHERE id = ?
+            ''', (datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'), row[0]))
+        session = _decode(row)
+        self._set_active(None)
+
+        pupils = {}
+        problems = {number: [0, 0] for number in session.problems}
+        for path in self.db.user_db_paths:
+            conn = self.db._connect_path(path)
+            try:
+                rows = conn.execute('''
+                    SELECT a.user_id, a.problem_number, a.attempts,
+                           a.is_correct, s.username, s.first_name
+                    FROM exam_answers a
+                    LEFT JOIN user_stats s ON s.user_id = a.user_id
+                    WHERE a.session_id = ?
+                ''', (session.id,))
+                for user_id, problem_number, attempts, is_correct, \
+                        username, first_name in rows:
+                    pupil = pupils.get(user_id)
+                    if pupil is None:
+                        pupil = pupils[user_id] = {
+                            'user_id': user_id, 'username': username,
+                            'first_name': first_name, 'answered': 0,
+                            'solved': 0, 'attempts': 0}
+                    pupil['answered'] += 1
+                    pupil['solved'] += bool(is_correct)
+                    pupil['attempts'] += attempts
+                    counts = problems.setdefault(problem_number, [0, 0])
+                    counts[0] += 1
+                    counts[1] += bool(is_correct)
+            finally:
+                conn.close()
+
+        ranking = sorted(pupils.values(),
+                         key=lambda pupil: (-pupil['solved'],
+                                            pupil['attempts']))
+        conn = self.db._connect()
+        try:
+            with conn:
+                conn.execute('''
+                    UPDATE exam_sessions
+                    SET participants = ?, answers = ?, correct_answers = ?
+                    WHERE id = ?
+                ''', (len(ranking),
+                      sum(pupil['answered'] for pupil in ranking),
+                      sum(pupil['solved'] for pupil in ranking), session.id))
+        finally:
+            conn.close()
+        logger.info(f"Экзамен {session.id} завершен: "
+                    f"участников {len(ranking)}")
+        return ExamResults(session, ranking, problems)
@@ -3,6 +3,8 @@ import re
 import logging
 from pathlib import Path
 
+from .migrations import apply_migrations
+
 logger = logging.getLogger(__name__)
 
 
@@ -27,39 +29,10 @@ class DatabaseInitializer:
     def create_tables(self):
         """Создает таблицы в базе данных"""
         conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        # Таблица разделов
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS sections (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name VARCHAR(100) NOT NULL,
-                description TEXT
-            )
-        ''')
-
-        # Таблица задач
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS problems (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                section_id INTEGER,
-                problem_number INTEGER NOT NULL,
-                problem_text TEXT NOT NULL,
-                answer TEXT NOT NULL,
-                difficulty_level VARCHAR(20) DEFAULT 'средняя',
-                FOREIGN KEY (section_id) REFERENCES sections(id),
-                UNIQUE(section_id, problem_number)
-            )
-        ''')
-
-        # Создаем индексы для быстрого поиска
-        cursor.execute(
-            'CREATE INDEX IF NOT EXISTS idx_problem_number ON problems(problem_number)')
-        cursor.execute(
-            'CREATE INDEX IF NOT EXISTS idx_section_id ON problems(section_id)')
-
-        conn.commit()
-        conn.close()
+        try:
+            apply_migrations(conn)
+        finally:
+            conn.close()
         logger.info("Таблицы созданы успешно")
 
     def parse_problems_file(self):
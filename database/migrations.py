@@ -0,0 +1,371 @@
+import logging
+
+from .adaptive import rebuild_problem_stats
+
+logger = logging.getLogger(__name__)
+
+
+def _baseline_schema(cursor):
+    """Базовая схема: разделы, задачи, попытки и статистика пользователей"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sections (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name VARCHAR(100) NOT NULL,
+            description TEXT
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS problems (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            section_id INTEGER,
+            problem_number INTEGER NOT NULL,
+            problem_text TEXT NOT NULL,
+            answer TEXT NOT NULL,
+            difficulty_level VARCHAR(20) DEFAULT 'средняя',
+            FOREIGN KEY (section_id) REFERENCES sections(id),
+            UNIQUE(section_id, problem_number)
+        )
+    ''')
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS idx_problem_number ON problems(problem_number)')
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS idx_section_id ON problems(section_id)')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_stats (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            first_name TEXT,
+            last_name TEXT,
+            total_attempts INTEGER DEFAULT 0,
+            correct_attempts INTEGER DEFAULT 0,
+            unique_solved_problems INTEGER DEFAULT 0,
+            last_activity TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_attempts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            problem_number INTEGER,
+            user_answer TEXT NOT NULL,
+            correct_answer TEXT NOT NULL,
+            is_correct BOOLEAN,
+            attempt_number INTEGER DEFAULT 1,
+            solved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES user_stats (user_id)
+        )
+    ''')
+
+
+def _add_missing_columns(cursor):
+    """Добавляет колонки, которых нет в базах, созданных старыми версиями"""
+    # ALTER TABLE не допускает непостоянных значений DEFAULT,
+    # поэтому created_at добавляется без CURRENT_TIMESTAMP
+    required_columns = {
+        'user_stats': [
+            ('unique_solved_problems', 'INTEGER DEFAULT 0'),
+            ('last_activity', 'TIMESTAMP'),
+            ('created_at', 'TIMESTAMP'),
+        ],
+        'user_attempts': [
+            ('attempt_number', 'INTEGER DEFAULT 1'),
+        ],
+    }
+
+    for table, columns in required_columns.items():
+        cursor.execute(f'PRAGMA table_info({table})')
+        existing = {column[1] for column in cursor.fetchall()}
+        for name, definition in columns:
+            if name not in existing:
+                cursor.execute(
+                    f'ALTER TABLE {table} ADD COLUMN {name} {definition}')
+                logger.info(f"Добавлена колонка {name} в {table}")
+
+
+def _hot_query_indexes(cursor):
+    """Индексы под частые запросы статистики и таблицы лидеров"""
+    # Старый индекс полностью покрывается idx_user_attempts_user_problem
+    cursor.execute('DROP INDEX IF EXISTS idx_user_attempts')
+
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_user_attempts_user_problem
+        ON user_attempts (user_id, problem_number, is_correct)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_user_attempts_user_solved
+        ON user_attempts (user_id, solved_at)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_user_stats_leaderboard
+        ON user_stats (unique_solved_problems DESC, correct_attempts DESC,
+                       total_attempts)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_user_stats_last_activity
+        ON user_stats (last_activity)
+    ''')
+
+
+def _attempt_counters(cursor):
+    """Счетчики номеров попыток по паре (пользователь, задача)"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_problem_attempts (
+            user_id INTEGER NOT NULL,
+            problem_number INTEGER NOT NULL,
+            last_attempt_number INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, problem_number)
+        ) WITHOUT ROWID
+    ''')
+
+    # Продолжаем нумерацию с уже выданных номеров
+    cursor.execute('''
+        INSERT OR IGNORE INTO user_problem_attempts
+            (user_id, problem_number, last_attempt_number)
+        SELECT user_id, problem_number,
+               MAX(COUNT(*), COALESCE(MAX(attempt_number), 0))
+        FROM user_attempts
+        GROUP BY user_id, problem_number
+    ''')
+
+
+def _user_progress(cursor):
+    """Битовые множества решенных и начатых задач пользователя"""
+    # Отпечаток каталога, по которому назначены номера битов:
+    # при его изменении прогресс пересчитывается из user_attempts.
+    # Имя user_progress уже занято таблицей из старых версий бота
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_progress_bits (
+            user_id INTEGER PRIMARY KEY,
+            fingerprint TEXT NOT NULL,
+            solved BLOB NOT NULL,
+            attempted BLOB NOT NULL
+        ) WITHOUT ROWID
+    ''')
+
+
+def _attempt_archive(cursor):
+    """Реестр архивов попыток и сводки по архивным попыткам"""
+    # Сами архивы - таблицы user_attempts_archive_ГГГГ_ММ,
+    # они создаются при архивации (см. database/archive.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS attempt_archives (
+            period TEXT PRIMARY KEY,
+            table_name TEXT NOT NULL,
+            rows INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Сводки заменяют архивные строки в статистике, поэтому статистика
+    # остается точной без чтения архивов
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_problem_rollup (
+            user_id INTEGER NOT NULL,
+            problem_number INTEGER NOT NULL,
+            attempts INTEGER NOT NULL,
+            correct_attempts INTEGER NOT NULL,
+            first_attempt_at TIMESTAMP,
+            last_attempt_at TIMESTAMP,
+            PRIMARY KEY (user_id, problem_number)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_daily_rollup (
+            user_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            attempts INTEGER NOT NULL,
+            correct_attempts INTEGER NOT NULL,
+            PRIMARY KEY (user_id, day)
+        ) WITHOUT ROWID
+    ''')
+
+
+def _db_settings(cursor):
+    """Служебные настройки базы (например, число шардов)"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS db_settings (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        )
+    ''')
+
+
+def _problem_stats(cursor):
+    """Счетчики попыток по задачам для подбора задач теста"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS problem_stats (
+            problem_number INTEGER PRIMARY KEY,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            correct_attempts INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    # Счетчики для уже сохраненных попыток
+    rebuild_problem_stats(cursor)
+
+
+def _review_schedule(cursor):
+    """Расписание интервальных повторений и планы повторений по дням"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS review_schedule (
+            user_id INTEGER NOT NULL,
+            problem_number INTEGER NOT NULL,
+            repetitions INTEGER NOT NULL DEFAULT 0,
+            interval_days INTEGER NOT NULL DEFAULT 1,
+            ease REAL NOT NULL DEFAULT 2.5,
+            due_at TIMESTAMP NOT NULL,
+            reviewed_at TIMESTAMP NOT NULL,
+            PRIMARY KEY (user_id, problem_number)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_review_schedule_due
+        ON review_schedule(user_id, due_at)
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS review_plan (
+            user_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            planned INTEGER NOT NULL,
+            PRIMARY KEY (user_id, day)
+        ) WITHOUT ROWID
+    ''')
+
+    # Уже решавшиеся задачи ставятся на повторение через день после
+    # последней попытки; решенные считаются одним успешным повторением
+    cursor.execute('''
+        INSERT OR IGNORE INTO review_schedule
+            (user_id, problem_number, repetitions, interval_days, ease,
+             due_at, reviewed_at)
+        SELECT user_id, problem_number, MAX(solved), 1, 2.5,
+               datetime(MAX(last_attempt_at), '+1 day'), MAX(last_attempt_at)
+        FROM (
+            SELECT user_id, problem_number,
+                   MAX(CASE WHEN is_correct THEN 1 ELSE 0 END) AS solved,
+                   MAX(solved_at) AS last_attempt_at
+            FROM user_attempts
+            WHERE problem_number IS NOT NULL AND solved_at IS NOT NULL
+            GROUP BY user_id, problem_number
+            UNION ALL
+            SELECT user_id, problem_number,
+                   CASE WHEN correct_attempts > 0 THEN 1 ELSE 0 END,
+                   last_attempt_at
+            FROM user_problem_rollup
+            WHERE last_attempt_at IS NOT NULL
+        )
+        GROUP BY user_id, problem_number
+    ''')
+
+
+def _exam_sessions(cursor):
+    """Экзамены для класса и ответы учеников на них"""
+    # problems - номера задач массивом int32 (см. database/exams.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS exam_sessions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            problems BLOB NOT NULL,
+            shuffle INTEGER NOT NULL DEFAULT 0,
+            seed INTEGER NOT NULL,
+            started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            finished_at TIMESTAMP,
+            participants INTEGER,
+            answers INTEGER,
+            correct_answers INTEGER
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_exam_sessions_active
+        ON exam_sessions(id) WHERE finished_at IS NULL
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS exam_answers (
+            session_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            problem_number INTEGER NOT NULL,
+            attempts INTEGER NOT NULL,
+            is_correct BOOLEAN NOT NULL,
+            answered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (session_id, user_id, position)
+        ) WITHOUT ROWID
+    ''')
+
+
+def _progress_version(cursor):
+    """Версия прогресса пользователя для сброса кэшей всех процессов"""
+    # Сброс прогресса увеличивает версию, и процесс с прогрессом в
+    # памяти перечитывает его вместо того, чтобы записать старые биты
+    cursor.execute('''
+        ALTER TABLE user_progress_bits
+        ADD COLUMN version INTEGER NOT NULL DEFAULT 0
+    ''')
+
+
+# Упорядоченный список миграций: (версия, описание, функция)
+# Новые миграции добавляются только в конец, существующие не изменяются
+MIGRATIONS = [
+    (1, 'Базовая схема', _baseline_schema),
+    (2, 'Недостающие колонки user_stats и user_attempts',
+     _add_missing_columns),
+    (3, 'Индексы для частых запросов', _hot_query_indexes),
+    (4, 'Счетчики номеров попыток', _attempt_counters),
+    (5, 'Прогресс пользователей в битовых множествах', _user_progress),
+    (6, 'Архив попыток и сводки по нему', _attempt_archive),
+    (7, 'Служебные настройки базы', _db_settings),
+    (8, 'Счетчики попыток по задачам', _problem_stats),
+    (9, 'Расписание интервальных повторений', _review_schedule),
+    (10, 'Экзамены для класса', _exam_sessions),
+    (11, 'Версия прогресса пользователей', _progress_version),
+]
+
+
+def get_schema_version(conn):
+    """Возвращает текущую версию схемы базы данных"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    row = conn.execute('SELECT MAX(version) FROM schema_version').fetchone()
+    return row[0] or 0
+
+
+def apply_migrations(conn):
+    """Применяет все еще не примененные миграции по порядку"""
+    current_version = get_schema_version(conn)
+    applied = 0
+
+    for version, description, migration in MIGRATIONS:
+        if version <= current_version:
+            continue
+
+        cursor = conn.cursor()
+        # IMMEDIATE берет блокировку на запись сразу, поэтому несколько
+        # одновременно стартующих процессов применят миграцию один раз
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            cursor.execute('SELECT 1 FROM schema_version WHERE version = ?',
+                           (version,))
+            if cursor.fetchone():
+                cursor.execute('COMMIT')
+                continue
+
+            migration(cursor)
+            cursor.execute(
+                'INSERT INTO schema_version (version, description) VALUES (?, ?)',
+                (version, description))
+            cursor.execute('COMMIT')
+        except Exception:
+            cursor.execute('ROLLBACK')
+            logger.error(f"Ошибка при применении миграции {version}")
+            raise
+
+        applied += 1
+        logger.info(f"Применена миграция {version}: {description}")
+
+    return applied
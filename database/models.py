@@ -1,243 +1,385 @@
+import heapq
+import itertools
 import sqlite3
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import date as date_type, datetime, timedelta
 from typing import List, Tuple, Optional, Dict, Any
 
+from .archive import archive_tables, rebuild_user_rollups
+from .migrations import apply_migrations
+from .profiler import profiling_connection_factory
+from .sharding import attach_content, check_shard_count, shard_index, \
+    shard_paths
+
 logger = logging.getLogger(__name__)
 
 
+def day_range(date):
+    """Возвращает полуинтервал [начало дня; начало следующего дня) для даты.
+
+    Границы сравниваются с solved_at как строки, поэтому условие
+    solved_at >= ? AND solved_at < ? использует индекс, в отличие от
+    DATE(solved_at) = ?.
+    """
+    if not isinstance(date, date_type):
+        date = datetime.strptime(date, '%Y-%m-%d').date()
+    return date.isoformat(), (date + timedelta(days=1)).isoformat()
+
+
+def utc_today():
+    """Сегодняшняя дата по UTC.
+
+    solved_at заполняется CURRENT_TIMESTAMP, то есть по UTC, поэтому и
+    границы дней, и подписи дней в статистике считаются от этой даты.
+    """
+    return datetime.utcnow().date()
+
+
+def days_back_start(days):
+    """Возвращает начало (UTC) дня, отстоящего на days - 1 дней от сегодня"""
+    return (utc_today() - timedelta(days=days - 1)).isoformat()
+
+
+# Запросы, которые бот выполняет на каждое действие пользователя. Они
+# вынесены в константы, чтобы database.query_plans проверял планы тех же
+# самых запросов.
+
+# Колонки истории попыток пользователя (рабочая таблица и архивы)
+HISTORY_COLUMNS = ('problem_number, user_answer, correct_answer, '
+                   'is_correct, attempt_number, solved_at')
+
+ATTEMPTS_COUNT_SQL = '''
+    SELECT COUNT(*) FROM user_attempts
+    WHERE user_id = ? AND problem_number = ?
+'''
+
+UNIQUE_SOLVED_SQL = '''
+    SELECT COUNT(*) FROM (
+        SELECT problem_number FROM user_attempts
+        WHERE user_id = ? AND is_correct = 1
+        UNION
+        SELECT problem_number FROM user_problem_rollup
+        WHERE user_id = ? AND correct_attempts > 0
+    )
+'''
+
+# Архивные попытки учитываются по сводке user_problem_rollup
+ATTEMPTS_PER_PROBLEM_SQL = '''
+    SELECT problem_number, SUM(attempts)
+    FROM (
+        SELECT problem_number, COUNT(*) AS attempts
+        FROM user_attempts
+        WHERE user_id = ?
+        GROUP BY problem_number
+        UNION ALL
+        SELECT problem_number, attempts
+        FROM user_problem_rollup
+        WHERE user_id = ?
+    )
+    GROUP BY problem_number
+'''
+
+DAILY_ACTIVITY_SQL = '''
+    SELECT day, SUM(attempts), SUM(correct_attempts)
+    FROM (
+        SELECT DATE(solved_at) AS day, COUNT(*) AS attempts,
+               SUM(CASE WHEN is_correct THEN 1 ELSE 0 END)
+                   AS correct_attempts
+        FROM user_attempts
+        WHERE user_id = ? AND solved_at >= ?
+        GROUP BY DATE(solved_at)
+        UNION ALL
+        SELECT day, attempts, correct_attempts
+        FROM user_daily_rollup
+        WHERE user_id = ? AND day >= ?
+    )
+    GROUP BY day
+    ORDER BY day DESC
+'''
+
+RECENT_ATTEMPTS_SQL = '''
+    SELECT ua.problem_number, ua.user_answer, ua.correct_answer,
+           ua.is_correct, ua.attempt_number, ua.solved_at, p.problem_text
+    FROM user_attempts ua
+    LEFT JOIN problems p ON ua.problem_number = p.problem_number
+    WHERE ua.user_id = ?
+    ORDER BY ua.solved_at DESC
+    LIMIT ?
+'''
+
+# {source} - подзапрос MathProblemsDB._user_attempts_source
+ATTEMPTS_BY_DATE_SQL = '''
+    SELECT problem_number, user_answer, correct_answer, is_correct,
+           attempt_number, solved_at
+    FROM {source}
+    WHERE solved_at >= ? AND solved_at < ?
+    ORDER BY solved_at DESC
+'''
+
+LEADERBOARD_SQL = '''
+    SELECT username, first_name, total_attempts, correct_attempts,
+           unique_solved_problems
+    FROM user_stats
+    WHERE total_attempts >= 5
+    ORDER BY unique_solved_problems DESC, correct_attempts DESC,
+             total_attempts ASC
+    LIMIT ?
+'''
+
+ALL_USERS_STATS_SQL = '''
+    SELECT user_id, username, first_name, last_name,
+           total_attempts, correct_attempts, unique_solved_problems,
+           last_activity, created_at
+    FROM user_stats
+    ORDER BY last_activity DESC
+    LIMIT ?
+'''
+
+
 class MathProblemsDB:
-    def __init__(self, db_path: str = "math_problems.db"):
+    def __init__(self, db_path: str = "math_problems.db", profiler=None,
+                 shard_count=1):
         self.db_path = db_path
+        # QueryProfiler: если задан, все запросы проходят через него
+        self.profiler = profiler
+        self._connection_factory = (
+            profiling_connection_factory(profiler) if profiler
+            else sqlite3.Connection)
+        # Файлы с таблицами пользователей: при одном шарде - сама база
+        self.shard_count = shard_count
+        self.user_db_paths = shard_paths(db_path, shard_count)
+        # Запросы по всем пользователям выполняются на шардах параллельно
+        self._executor = ThreadPoolExecutor(
+            shard_count, thread_name_prefix='db-shard') \
+            if shard_count > 1 else None
         self._create_tables()
 
-    def _create_tables(self):
-        """Создает таблицы, если они не существуют"""
-        with sqlite3.connect(self.db_path) as conn:
+    def _connect(self, user_id=None, content=False):
+        """Открывает соединение с базой (с профилированием, если включено).
+
+        С user_id соединение открывается с шардом пользователя; content
+        делает в нем видимыми разделы и задачи основной базы.
+        """
+        if user_id is None or self.shard_count == 1:
+            return sqlite3.connect(self.db_path,
+                                   factory=self._connection_factory)
+        conn = sqlite3.connect(self.user_db_path(user_id),
+                               factory=self._connection_factory)
+        if content:
+            attach_content(conn, self.db_path)
+        return conn
+
+    def _connect_path(self, path):
+        """Соединение с файлом базы (основной или шардом) через фабрику
+        соединений, то есть с профилированием, если оно включено"""
+        return sqlite3.connect(path, factory=self._connection_factory)
+
+    @contextmanager
+    def _transaction(self, user_id=None, cursor=None):
+        """Курсор транзакции в шарде пользователя.
+
+        Если передан cursor, операции выполняются в уже открытой
+        транзакции вызывающего кода, и фиксирует ее он сам.
+        """
+        if cursor is not None:
+            yield cursor
+            return
+        conn = self._connect(user_id)
+        try:
             cursor = conn.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                yield cursor
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+        finally:
+            conn.close()
 
-            # Таблица разделов
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS sections (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT NOT NULL UNIQUE
-                )
-            ''')
-
-            # Таблица задач
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS problems (
-                    number TEXT PRIMARY KEY,
-                    problem_text TEXT NOT NULL,
-                    correct_answer TEXT NOT NULL,
-                    section_id INTEGER,
-                    FOREIGN KEY (section_id) REFERENCES sections (id)
-                )
-            ''')
-
-            # Таблица попыток пользователей
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS user_attempts (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    problem_number TEXT NOT NULL,
-                    user_answer TEXT NOT NULL,
-                    correct_answer TEXT NOT NULL,
-                    is_correct BOOLEAN NOT NULL,
-                    solved_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (problem_number) REFERENCES problems (number)
-                )
-            ''')
-
-            # Таблица статистики пользователей
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS user_stats (
-                    user_id INTEGER PRIMARY KEY,
-                    username TEXT,
-                    first_name TEXT,
-                    last_name TEXT,
-                    total_attempts INTEGER DEFAULT 0,
-                    correct_attempts INTEGER DEFAULT 0,
-                    success_rate REAL DEFAULT 0,
-                    last_active DATETIME DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
+    def close(self):
+        """Останавливает потоки параллельных запросов к шардам.
+
+        После этого запросы по всем шардам выполняются последовательно.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def user_db_path(self, user_id):
+        """Файл базы, в котором хранятся данные пользователя"""
+        if self.shard_count == 1:
+            return self.db_path
+        return self.user_db_paths[shard_index(user_id, self.shard_count)]
+
+    def _scatter(self, query):
+        """Выполняет query(cursor) на каждом файле с данными пользователей.
+
+        Возвращает список результатов по шардам.
+        """
+        def run(path):
+            conn = self._connect_path(path)
+            try:
+                return query(conn.cursor())
+            finally:
+                conn.close()
+
+        if self._executor is None:
+            return [run(path) for path in self.user_db_paths]
+        return list(self._executor.map(run, self.user_db_paths))
 
-            conn.commit()
+    def _create_tables(self):
+        """Создает таблицы и индексы, применяя недостающие миграции"""
+        for path in dict.fromkeys([self.db_path, *self.user_db_paths]):
+            conn = self._connect_path(path)
+            try:
+                # Действует только для новой базы: существующую переводит
+                # в этот режим полный VACUUM (см. database/archive.py)
+                conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+                apply_migrations(conn)
+                if path == self.db_path:
+                    check_shard_count(conn, self.shard_count)
+            finally:
+                conn.close()
 
     def get_section_name(self, section_id: int) -> str:
         """Возвращает название раздела по ID"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             cursor.execute('SELECT name FROM sections WHERE id = ?',
                            (section_id,))
             result = cursor.fetchone()
             return result[0] if result else "Неизвестный раздел"
 
-    # ... остальные методы класса остаются без изменений ...
+    @staticmethod
+    def _user_attempts_source(cursor, user_id, columns):
+        """Подзапрос с попытками пользователя из рабочей таблицы и архивов.
 
-    def init_user_stats_table(self):
-        """Инициализирует таблицу статистики пользователей"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS user_stats (
-                user_id INTEGER PRIMARY KEY,
-                username TEXT,
-                first_name TEXT,
-                last_name TEXT,
-                total_attempts INTEGER DEFAULT 0,
-                correct_attempts INTEGER DEFAULT 0,
-                unique_solved_problems INTEGER DEFAULT 0,
-                last_activity TIMESTAMP,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        conn.commit()
-        conn.close()
-
-    def init_user_attempts_table(self):
-        """Инициализирует таблицу всех попыток пользователей"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS user_attempts (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                problem_number INTEGER,
-                user_answer TEXT NOT NULL,
-                correct_answer TEXT NOT NULL,
-                is_correct BOOLEAN,
-                attempt_number INTEGER DEFAULT 1,
-                solved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES user_stats (user_id)
-            )
-        ''')
-        # Создаем индексы для быстрого поиска
-        cursor.execute('''
-            CREATE INDEX IF NOT EXISTS idx_user_attempts 
-            ON user_attempts (user_id, problem_number, solved_at)
-        ''')
-        conn.commit()
-        conn.close()
+        Возвращает текст подзапроса для FROM и его параметры.
+        """
+        tables = ['user_attempts'] + archive_tables(cursor)
+        sql = ' UNION ALL '.join(
+            f'SELECT {columns} FROM {table} WHERE user_id = ?'
+            for table in tables)
+        return f'({sql})', (user_id,) * len(tables)
 
     def update_database_schema(self):
-        """Обновляет схему базы данных, добавляя недостающие колонки"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        # Проверяем существование колонок в user_stats
-        cursor.execute("PRAGMA table_info(user_stats)")
-        columns = [column[1] for column in cursor.fetchall()]
-
-        if 'unique_solved_problems' not in columns:
-            cursor.execute(
-                'ALTER TABLE user_stats ADD COLUMN unique_solved_problems INTEGER DEFAULT 0')
-            logger.info(
-                "Добавлена колонка unique_solved_problems в user_stats")
-
-        conn.commit()
-        conn.close()
+        """Обновляет схему базы данных до последней версии миграций"""
+        self._create_tables()
 
     def update_user_stats(self, user_id, username, first_name, last_name,
-                          is_correct=False, problem_number=None):
-        """Обновляет статистику пользователя"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        # Проверяем существование пользователя
-        cursor.execute('SELECT * FROM user_stats WHERE user_id = ?',
-                       (user_id,))
-        user_exists = cursor.fetchone()
-
-        if user_exists:
-            # Обновляем существующего пользователя
-            if is_correct:
-                cursor.execute('''
-                    UPDATE user_stats 
-                    SET total_attempts = total_attempts + 1,
-                        correct_attempts = correct_attempts + 1,
-                        last_activity = CURRENT_TIMESTAMP,
-                        username = ?, first_name = ?, last_name = ?
-                    WHERE user_id = ?
-                ''', (username, first_name, last_name, user_id))
-
-                # Обновляем счетчик уникальных решенных задач
-                if problem_number:
+                          is_correct=False, problem_number=None,
+                          unique_solved=None, cursor=None):
+        """Обновляет статистику пользователя.
+
+        unique_solved - уже известное число решенных задач; если не передано,
+        оно пересчитывается по user_attempts. cursor - транзакция
+        вызывающего кода (см. _transaction).
+        """
+        with self._transaction(user_id, cursor) as cursor:
+            # Проверяем существование пользователя
+            cursor.execute('SELECT * FROM user_stats WHERE user_id = ?',
+                           (user_id,))
+            user_exists = cursor.fetchone()
+
+            if user_exists:
+                # Обновляем существующего пользователя
+                if is_correct:
                     cursor.execute('''
-                        SELECT COUNT(DISTINCT problem_number) 
-                        FROM user_attempts 
-                        WHERE user_id = ? AND is_correct = 1
-                    ''', (user_id,))
-                    unique_solved = cursor.fetchone()[0] or 0
-
+                        UPDATE user_stats 
+                        SET total_attempts = total_attempts + 1,
+                            correct_attempts = correct_attempts + 1,
+                            last_activity = CURRENT_TIMESTAMP,
+                            username = ?, first_name = ?, last_name = ?
+                        WHERE user_id = ?
+                    ''', (username, first_name, last_name, user_id))
+
+                    # Обновляем счетчик уникальных решенных задач
+                    if problem_number and unique_solved is None:
+                        cursor.execute(UNIQUE_SOLVED_SQL, (user_id, user_id))
+                        unique_solved = cursor.fetchone()[0] or 0
+
+                    if problem_number:
+                        cursor.execute('''
+                            UPDATE user_stats 
+                            SET unique_solved_problems = ?
+                            WHERE user_id = ?
+                        ''', (unique_solved, user_id))
+                else:
                     cursor.execute('''
                         UPDATE user_stats 
-                        SET unique_solved_problems = ?
+                        SET total_attempts = total_attempts + 1,
+                            last_activity = CURRENT_TIMESTAMP,
+                            username = ?, first_name = ?, last_name = ?
                         WHERE user_id = ?
-                    ''', (unique_solved, user_id))
-            else:
-                cursor.execute('''
-                    UPDATE user_stats 
-                    SET total_attempts = total_attempts + 1,
-                        last_activity = CURRENT_TIMESTAMP,
-                        username = ?, first_name = ?, last_name = ?
-                    WHERE user_id = ?
-                ''', (username, first_name, last_name, user_id))
-        else:
-            # Добавляем нового пользователя
-            if is_correct:
-                cursor.execute('''
-                    INSERT INTO user_stats 
-                    (user_id, username, first_name, last_name, total_attempts, correct_attempts, unique_solved_problems, last_activity)
-                    VALUES (?, ?, ?, ?, 1, 1, 1, CURRENT_TIMESTAMP)
-                ''', (user_id, username, first_name, last_name))
+                    ''', (username, first_name, last_name, user_id))
             else:
-                cursor.execute('''
-                    INSERT INTO user_stats 
-                    (user_id, username, first_name, last_name, total_attempts, correct_attempts, unique_solved_problems, last_activity)
-                    VALUES (?, ?, ?, ?, 1, 0, 0, CURRENT_TIMESTAMP)
-                ''', (user_id, username, first_name, last_name))
-
-        conn.commit()
-        conn.close()
+                # Добавляем нового пользователя
+                if is_correct:
+                    cursor.execute('''
+                        INSERT INTO user_stats 
+                        (user_id, username, first_name, last_name, total_attempts, correct_attempts, unique_solved_problems, last_activity)
+                        VALUES (?, ?, ?, ?, 1, 1, 1, CURRENT_TIMESTAMP)
+                    ''', (user_id, username, first_name, last_name))
+                else:
+                    cursor.execute('''
+                        INSERT INTO user_stats 
+                        (user_id, username, first_name, last_name, total_attempts, correct_attempts, unique_solved_problems, last_activity)
+                        VALUES (?, ?, ?, ?, 1, 0, 0, CURRENT_TIMESTAMP)
+                    ''', (user_id, username, first_name, last_name))
 
     def add_user_attempt(self, user_id, problem_number, user_answer,
-                         correct_answer, is_correct, attempt_number=1):
+                         correct_answer, is_correct, attempt_number=1,
+                         cursor=None):
         """Добавляет запись о попытке решения задачи пользователем"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        # Получаем номер попытки для этой задачи
-        cursor.execute('''
-            SELECT COUNT(*) FROM user_attempts 
-            WHERE user_id = ? AND problem_number = ?
-        ''', (user_id, problem_number))
+        with self._transaction(user_id, cursor) as cursor:
+            # Получаем номер попытки одним атомарным обновлением счетчика:
+            # транзакция берет блокировку на запись на первом же операторе,
+            # поэтому параллельные попытки не получат одинаковый номер
+            cursor.execute('''
+                INSERT INTO user_problem_attempts (user_id, problem_number, last_attempt_number)
+                VALUES (?, ?, 1)
+                ON CONFLICT (user_id, problem_number)
+                DO UPDATE SET last_attempt_number = last_attempt_number + 1
+                RETURNING last_attempt_number
+            ''', (user_id, problem_number))
 
-        current_attempt = cursor.fetchone()[0] + 1
+            current_attempt = cursor.fetchone()[0]
 
-        # Добавляем новую запись о попытке
-        cursor.execute('''
-            INSERT INTO user_attempts (user_id, problem_number, user_answer, correct_answer, is_correct, attempt_number)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (user_id, problem_number, user_answer, correct_answer, is_correct,
-              current_attempt))
+            # Добавляем новую запись о попытке
+            cursor.execute('''
+                INSERT INTO user_attempts (user_id, problem_number, user_answer, correct_answer, is_correct, attempt_number)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (user_id, problem_number, user_answer, correct_answer,
+                  is_correct, current_attempt))
 
-        conn.commit()
-        conn.close()
+            # Счетчики задачи для эмпирической сложности
+            cursor.execute('''
+                INSERT INTO problem_stats (problem_number, attempts, correct_attempts)
+                VALUES (?, 1, ?)
+                ON CONFLICT (problem_number) DO UPDATE SET
+                    attempts = attempts + 1,
+                    correct_attempts = correct_attempts + excluded.correct_attempts
+            ''', (problem_number, 1 if is_correct else 0))
 
         return current_attempt
 
     def get_user_attempts_for_problem(self, user_id, problem_number):
         """Получает все попытки пользователя для конкретной задачи"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect(user_id)
         cursor = conn.cursor()
 
-        cursor.execute('''
+        source, params = self._user_attempts_source(
+            cursor, user_id, 'problem_number, user_answer, correct_answer, '
+                             'is_correct, attempt_number, solved_at')
+        cursor.execute(f'''
             SELECT user_answer, correct_answer, is_correct, attempt_number, solved_at 
-            FROM user_attempts 
-            WHERE user_id = ? AND problem_number = ?
+            FROM {source}
+            WHERE problem_number = ?
             ORDER BY attempt_number
-        ''', (user_id, problem_number))
+        ''', (*params, problem_number))
 
         attempts = cursor.fetchall()
         conn.close()
@@ -252,16 +394,19 @@ class MathProblemsDB:
 
     def get_last_user_attempt(self, user_id, problem_number):
         """Получает последнюю попытку пользователя для задачи"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect(user_id)
         cursor = conn.cursor()
 
-        cursor.execute('''
+        source, params = self._user_attempts_source(
+            cursor, user_id, 'problem_number, user_answer, correct_answer, '
+                             'is_correct, attempt_number, solved_at')
+        cursor.execute(f'''
             SELECT user_answer, correct_answer, is_correct, attempt_number, solved_at 
-            FROM user_attempts 
-            WHERE user_id = ? AND problem_number = ?
+            FROM {source}
+            WHERE problem_number = ?
             ORDER BY attempt_number DESC 
             LIMIT 1
-        ''', (user_id, problem_number))
+        ''', (*params, problem_number))
 
         attempt = cursor.fetchone()
         conn.close()
@@ -276,45 +421,43 @@ class MathProblemsDB:
             }
         return None
 
-    def is_problem_solved_by_user(self, user_id, problem_number):
-        """Проверяет, решал ли пользователь уже эту задачу правильно"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT id FROM user_attempts 
-            WHERE user_id = ? AND problem_number = ? AND is_correct = 1
-        ''', (user_id, problem_number))
-        result = cursor.fetchone()
-        conn.close()
-        return result is not None
-
     def get_user_attempts_count(self, user_id, problem_number):
         """Получает количество попыток пользователя для задачи"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect(user_id)
         cursor = conn.cursor()
+        cursor.execute(ATTEMPTS_COUNT_SQL, (user_id, problem_number))
+        count = cursor.fetchone()[0]
         cursor.execute('''
-            SELECT COUNT(*) FROM user_attempts 
+            SELECT attempts FROM user_problem_rollup
             WHERE user_id = ? AND problem_number = ?
         ''', (user_id, problem_number))
-        count = cursor.fetchone()[0]
+        archived = cursor.fetchone()
         conn.close()
-        return count
+        return count + (archived[0] if archived else 0)
 
     def get_user_recent_attempts(self, user_id, limit=10):
         """Получает последние попытки пользователя"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect(user_id, content=True)
         cursor = conn.cursor()
-        cursor.execute('''
-            SELECT ua.problem_number, ua.user_answer, ua.correct_answer, 
-                   ua.is_correct, ua.attempt_number, ua.solved_at, p.problem_text
-            FROM user_attempts ua
-            LEFT JOIN problems p ON ua.problem_number = p.problem_number
-            WHERE ua.user_id = ?
-            ORDER BY ua.solved_at DESC
-            LIMIT ?
-        ''', (user_id, limit))
+        cursor.execute(RECENT_ATTEMPTS_SQL, (user_id, limit))
 
         attempts = cursor.fetchall()
+        if len(attempts) < limit:
+            # Свежих попыток мало - добираем из архивов
+            source, params = self._user_attempts_source(
+                cursor, user_id, 'problem_number, user_answer, '
+                                 'correct_answer, is_correct, '
+                                 'attempt_number, solved_at')
+            cursor.execute(f'''
+                SELECT ua.problem_number, ua.user_answer, ua.correct_answer,
+                       ua.is_correct, ua.attempt_number, ua.solved_at,
+                       p.problem_text
+                FROM {source} ua
+                LEFT JOIN problems p ON ua.problem_number = p.problem_number
+                ORDER BY ua.solved_at DESC
+                LIMIT ?
+            ''', (*params, limit))
+            attempts = cursor.fetchall()
         conn.close()
 
         return [{
@@ -329,15 +472,17 @@ class MathProblemsDB:
 
     def get_user_all_attempts(self, user_id):
         """Получает все попытки пользователя"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect(user_id)
         cursor = conn.cursor()
-        cursor.execute('''
+        source, params = self._user_attempts_source(
+            cursor, user_id, 'problem_number, user_answer, correct_answer, '
+                             'is_correct, attempt_number, solved_at')
+        cursor.execute(f'''
             SELECT problem_number, user_answer, correct_answer, is_correct, 
                    attempt_number, solved_at
-            FROM user_attempts 
-            WHERE user_id = ?
+            FROM {source}
             ORDER BY solved_at DESC
-        ''', (user_id,))
+        ''', params)
 
         attempts = cursor.fetchall()
         conn.close()
@@ -353,7 +498,7 @@ class MathProblemsDB:
 
     def get_user_stats(self, user_id):
         """Получает статистику пользователя"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect(user_id)
         cursor = conn.cursor()
 
         # Основная статистика
@@ -370,21 +515,11 @@ class MathProblemsDB:
         total_attempts, correct_attempts, unique_solved, last_activity = stats
 
         # Дополнительная статистика из попыток
-        cursor.execute('''
-            SELECT COUNT(DISTINCT problem_number) 
-            FROM user_attempts 
-            WHERE user_id = ?
-        ''', (user_id,))
-        total_problems_attempted = cursor.fetchone()[0] or 0
+        cursor.execute(ATTEMPTS_PER_PROBLEM_SQL, (user_id, user_id))
+        attempts_per_problem = cursor.fetchall()
+        total_problems_attempted = len(attempts_per_problem)
 
         # Среднее количество попыток на задачу
-        cursor.execute('''
-            SELECT problem_number, COUNT(*) 
-            FROM user_attempts 
-            WHERE user_id = ? 
-            GROUP BY problem_number
-        ''', (user_id,))
-        attempts_per_problem = cursor.fetchall()
 
         avg_attempts = 0
         if attempts_per_problem:
@@ -393,15 +528,8 @@ class MathProblemsDB:
                 attempts_per_problem)
 
         # Статистика по дням
-        cursor.execute('''
-            SELECT DATE(solved_at), COUNT(*) 
-            FROM user_attempts 
-            WHERE user_id = ? 
-            GROUP BY DATE(solved_at)
-            ORDER BY DATE(solved_at) DESC
-            LIMIT 7
-        ''', (user_id,))
-        last_7_days = cursor.fetchall()
+        last_7_days = [(day, total) for day, total, _ in
+                       self._daily_activity(cursor, user_id, 7)]
 
         conn.close()
 
@@ -445,17 +573,16 @@ class MathProblemsDB:
 
     def get_leaderboard(self, limit=10):
         """Получает таблицу лидеров"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT username, first_name, total_attempts, correct_attempts, unique_solved_problems 
-            FROM user_stats 
-            WHERE total_attempts >= 5 
-            ORDER BY unique_solved_problems DESC, correct_attempts DESC, total_attempts ASC 
-            LIMIT ?
-        ''', (limit,))
-        leaders = cursor.fetchall()
-        conn.close()
+        def query(cursor):
+            cursor.execute(LEADERBOARD_SQL, (limit,))
+            return cursor.fetchall()
+
+        # Лучшие limit из каждого шарда, затем общий порядок
+        leaders = heapq.merge(
+            *self._scatter(query),
+            key=lambda leader: (-(leader[4] or 0), -(leader[3] or 0),
+                                leader[2] or 0))
+        leaders = list(itertools.islice(leaders, limit))
 
         return [{
             'username': leader[0],
@@ -465,10 +592,9 @@ class MathProblemsDB:
             'unique_solved': leader[4]
         } for leader in leaders]
 
-    # Остальные методы остаются без изменений
     def get_all_sections(self):
         """Получить все разделы"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         cursor.execute('SELECT * FROM sections ORDER BY id')
         sections = cursor.fetchall()
@@ -477,7 +603,7 @@ class MathProblemsDB:
 
     def get_problems_by_section(self, section_id):
         """Получить все задачи из определенного раздела"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         cursor.execute('''
             SELECT p.id, p.problem_number, p.problem_text, p.answer 
@@ -489,9 +615,23 @@ class MathProblemsDB:
         conn.close()
         return problems
 
+    def get_catalog_rows(self):
+        """Все задачи для каталога в порядке разделов и номеров"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT p.section_id, p.problem_number, p.problem_text,
+                   p.difficulty_level, p.answer
+            FROM problems p
+            ORDER BY p.section_id, p.problem_number
+        ''')
+        rows = cursor.fetchall()
+        conn.close()
+        return rows
+
     def get_problem_by_number(self, problem_number):
         """Найти задачу по номеру"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         cursor.execute('''
             SELECT p.problem_number, p.problem_text, p.answer, s.name 
@@ -505,7 +645,7 @@ class MathProblemsDB:
 
     def search_problems(self, keyword):
         """Поиск задач по ключевому слову"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         cursor.execute('''
             SELECT p.problem_number, p.problem_text, p.answer, s.name 
@@ -518,9 +658,23 @@ class MathProblemsDB:
         conn.close()
         return problems
 
+    def search_problem_numbers(self, keyword):
+        """Номера задач, подходящих под ключевое слово, без текстов задач"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT problem_number
+            FROM problems
+            WHERE problem_text LIKE ? OR answer LIKE ?
+            ORDER BY problem_number
+        ''', (f'%{keyword}%', f'%{keyword}%'))
+        numbers = [row[0] for row in cursor.fetchall()]
+        conn.close()
+        return numbers
+
     def get_random_problem(self):
         """Получить случайную задачу"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         cursor.execute('''
             SELECT p.problem_number, p.problem_text, p.answer, s.name 
@@ -535,7 +689,7 @@ class MathProblemsDB:
 
     def get_random_unsolved_problem(self, user_id):
         """Получить случайную нерешенную задачу для пользователя"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect(user_id, content=True)
         cursor = conn.cursor()
         cursor.execute('''
             SELECT p.problem_number, p.problem_text, p.answer, s.name 
@@ -543,32 +697,47 @@ class MathProblemsDB:
             JOIN sections s ON p.section_id = s.id 
             WHERE p.problem_number NOT IN (
                 SELECT problem_number FROM user_attempts WHERE user_id = ? AND is_correct = 1
+                UNION
+                SELECT problem_number FROM user_problem_rollup
+                WHERE user_id = ? AND correct_attempts > 0
             )
             ORDER BY RANDOM() 
             LIMIT 1
-        ''', (user_id,))
+        ''', (user_id, user_id))
         problem = cursor.fetchone()
         conn.close()
         return problem
 
-    # ... существующие методы остаются без изменений до этого места ...
+    def get_problem_stats(self):
+        """Попытки по задачам всех пользователей: номер -> (всего, верных)"""
+        def query(cursor):
+            cursor.execute('''
+                SELECT problem_number, attempts, correct_attempts
+                FROM problem_stats
+            ''')
+            return cursor.fetchall()
+
+        stats = {}
+        for rows in self._scatter(query):
+            for problem_number, attempts, correct in rows:
+                total, total_correct = stats.get(problem_number, (0, 0))
+                stats[problem_number] = (total + attempts,
+                                         total_correct + correct)
+        return stats
 
     # ДОБАВЛЕННЫЕ МЕТОДЫ ДЛЯ АДМИНИСТРАТОРА
 
     def get_all_users_stats(self, limit=100):
         """Получает статистику всех пользователей (для админа)"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT user_id, username, first_name, last_name, 
-                   total_attempts, correct_attempts, unique_solved_problems,
-                   last_activity, created_at
-            FROM user_stats 
-            ORDER BY last_activity DESC
-            LIMIT ?
-        ''', (limit,))
-        users = cursor.fetchall()
-        conn.close()
+        def query(cursor):
+            cursor.execute(ALL_USERS_STATS_SQL, (limit,))
+            return cursor.fetchall()
+
+        # Как и в SQLite, пользователи без last_activity идут последними
+        users = heapq.merge(
+            *self._scatter(query), reverse=True,
+            key=lambda user: (user[7] is not None, user[7] or ''))
+        users = list(itertools.islice(users, limit))
 
         return [{
             'user_id': user[0],
@@ -584,25 +753,21 @@ class MathProblemsDB:
 
     def get_user_attempts_by_date(self, user_id, date=None):
         """Получает попытки пользователя за конкретную дату"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect(user_id)
         cursor = conn.cursor()
 
+        source, params = self._user_attempts_source(cursor, user_id,
+                                                    HISTORY_COLUMNS)
         if date:
-            cursor.execute('''
-                SELECT problem_number, user_answer, correct_answer, is_correct, 
-                       attempt_number, solved_at
-                FROM user_attempts 
-                WHERE user_id = ? AND DATE(solved_at) = ?
-                ORDER BY solved_at DESC
-            ''', (user_id, date))
+            cursor.execute(ATTEMPTS_BY_DATE_SQL.format(source=source),
+                           (*params, *day_range(date)))
         else:
-            cursor.execute('''
+            cursor.execute(f'''
                 SELECT problem_number, user_answer, correct_answer, is_correct, 
                        attempt_number, solved_at
-                FROM user_attempts 
-                WHERE user_id = ?
+                FROM {source}
                 ORDER BY solved_at DESC
-            ''', (user_id,))
+            ''', params)
 
         attempts = cursor.fetchall()
         conn.close()
@@ -616,19 +781,36 @@ class MathProblemsDB:
             'solved_at': attempt[5]
         } for attempt in attempts]
 
+    def count_user_attempts_by_date(self, user_id, date):
+        """Возвращает количество попыток пользователя за конкретную дату"""
+        conn = self._connect(user_id)
+        cursor = conn.cursor()
+        start, end = day_range(date)
+        cursor.execute('''
+            SELECT COUNT(*) FROM user_attempts 
+            WHERE user_id = ? AND solved_at >= ? AND solved_at < ?
+        ''', (user_id, start, end))
+        count = cursor.fetchone()[0]
+        cursor.execute('''
+            SELECT attempts FROM user_daily_rollup
+            WHERE user_id = ? AND day = ?
+        ''', (user_id, start))
+        archived = cursor.fetchone()
+        conn.close()
+        return count + (archived[0] if archived else 0)
+
+    @staticmethod
+    def _daily_activity(cursor, user_id, days):
+        """(день, попыток, верных) за последние days дней, включая архив"""
+        start = days_back_start(days)
+        cursor.execute(DAILY_ACTIVITY_SQL, (user_id, start, user_id, start))
+        return cursor.fetchall()
+
     def get_user_daily_activity(self, user_id, days=7):
         """Получает ежедневную активность пользователя"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect(user_id)
         cursor = conn.cursor()
-        cursor.execute('''
-            SELECT DATE(solved_at), COUNT(*), SUM(CASE WHEN is_correct THEN 1 ELSE 0 END)
-            FROM user_attempts 
-            WHERE user_id = ? AND solved_at >= DATE('now', ?)
-            GROUP BY DATE(solved_at)
-            ORDER BY DATE(solved_at) DESC
-        ''', (user_id, f'-{days} days'))
-
-        activity = cursor.fetchall()
+        activity = self._daily_activity(cursor, user_id, days)
         conn.close()
 
         return [{
@@ -639,50 +821,155 @@ class MathProblemsDB:
 
     def delete_user_attempts(self, user_id, problem_number=None, date=None):
         """Удаляет попытки пользователя (для админа)"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect(user_id)
         cursor = conn.cursor()
 
         try:
+            where, params = self._attempts_filter(user_id, problem_number,
+                                                  date)
+            self._uncount_problem_stats(cursor, 'user_attempts', where,
+                                        params)
             if problem_number and date:
                 # Удалить попытки по конкретной задаче за конкретную дату
                 cursor.execute('''
                     DELETE FROM user_attempts 
-                    WHERE user_id = ? AND problem_number = ? AND DATE(solved_at) = ?
-                ''', (user_id, problem_number, date))
+                    WHERE user_id = ? AND problem_number = ?
+                      AND solved_at >= ? AND solved_at < ?
+                ''', (user_id, problem_number, *day_range(date)))
+                deleted_count = cursor.rowcount
             elif problem_number:
                 # Удалить все попытки по конкретной задаче
                 cursor.execute('''
                     DELETE FROM user_attempts 
                     WHERE user_id = ? AND problem_number = ?
                 ''', (user_id, problem_number))
+                deleted_count = cursor.rowcount
+                # Нумерация попыток по задаче начинается заново
+                cursor.execute('''
+                    DELETE FROM user_problem_attempts 
+                    WHERE user_id = ? AND problem_number = ?
+                ''', (user_id, problem_number))
+                cursor.execute('''
+                    DELETE FROM review_schedule
+                    WHERE user_id = ? AND problem_number = ?
+                ''', (user_id, problem_number))
             elif date:
                 # Удалить все попытки за конкретную дату
                 cursor.execute('''
                     DELETE FROM user_attempts 
-                    WHERE user_id = ? AND DATE(solved_at) = ?
-                ''', (user_id, date))
+                    WHERE user_id = ? AND solved_at >= ? AND solved_at < ?
+                ''', (user_id, *day_range(date)))
+                deleted_count = cursor.rowcount
             else:
                 # Удалить все попытки пользователя
                 cursor.execute('DELETE FROM user_attempts WHERE user_id = ?',
                                (user_id,))
+                deleted_count = cursor.rowcount
+                cursor.execute(
+                    'DELETE FROM user_problem_attempts WHERE user_id = ?',
+                    (user_id,))
                 cursor.execute('DELETE FROM user_stats WHERE user_id = ?',
                                (user_id,))
+                for table in ('review_schedule', 'review_plan',
+                              'exam_answers'):
+                    cursor.execute(f'DELETE FROM {table} WHERE user_id = ?',
+                                   (user_id,))
+
+            deleted_count += self._delete_archived_attempts(
+                cursor, user_id, problem_number, date)
 
-            deleted_count = cursor.rowcount
             conn.commit()
             conn.close()
 
-            return deleted_count
-
         except Exception as e:
             conn.rollback()
             conn.close()
             logger.error(f"Ошибка при удалении попыток: {e}")
             return 0
 
+        # Счетчики задач уменьшились - процессы перечитают их из базы
+        self._bump_stats_version()
+        return deleted_count
+
+    def get_stats_version(self):
+        """Версия счетчиков problem_stats: растет при удалении попыток"""
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT value FROM db_settings WHERE key = 'stats_version'"
+            ).fetchone()
+        finally:
+            conn.close()
+        return int(row[0]) if row else 0
+
+    def _bump_stats_version(self):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute('''
+                    INSERT INTO db_settings (key, value)
+                    VALUES ('stats_version', '1')
+                    ON CONFLICT (key) DO UPDATE SET
+                        value = CAST(value AS INTEGER) + 1
+                ''')
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _attempts_filter(user_id, problem_number=None, date=None):
+        """Условие WHERE и параметры для попыток пользователя"""
+        conditions = ['user_id = ?']
+        params = [user_id]
+        if problem_number:
+            conditions.append('problem_number = ?')
+            params.append(problem_number)
+        if date:
+            conditions.append('solved_at >= ? AND solved_at < ?')
+            params.extend(day_range(date))
+        return ' AND '.join(conditions), params
+
+    @staticmethod
+    def _uncount_problem_stats(cursor, table, where, params):
+        """Вычитает из problem_stats попытки, которые будут удалены"""
+        cursor.execute(f'''
+            UPDATE problem_stats
+            SET attempts = problem_stats.attempts - deleted.attempts,
+                correct_attempts = problem_stats.correct_attempts
+                                   - deleted.correct_attempts
+            FROM (
+                SELECT problem_number, COUNT(*) AS attempts,
+                       SUM(CASE WHEN is_correct THEN 1 ELSE 0 END)
+                           AS correct_attempts
+                FROM {table}
+                WHERE {where}
+                GROUP BY problem_number
+            ) AS deleted
+            WHERE problem_stats.problem_number = deleted.problem_number
+        ''', params)
+
+    def _delete_archived_attempts(self, cursor, user_id, problem_number=None,
+                                  date=None):
+        """Удаляет попытки пользователя из архивов и пересчитывает сводки"""
+        where, params = self._attempts_filter(user_id, problem_number, date)
+
+        deleted = 0
+        for table in archive_tables(cursor):
+            self._uncount_problem_stats(cursor, table, where, params)
+            cursor.execute(f'DELETE FROM {table} WHERE {where}', params)
+            if cursor.rowcount:
+                deleted += cursor.rowcount
+                cursor.execute('''
+                    UPDATE attempt_archives SET rows = rows - ?
+                    WHERE table_name = ?
+                ''', (cursor.rowcount, table))
+
+        if deleted:
+            rebuild_user_rollups(cursor, user_id)
+        return deleted
+
     def get_user_detailed_stats(self, user_id):
         """Получает детальную статистику пользователя (для админа)"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect(user_id)
         cursor = conn.cursor()
 
         # Основная статистика
@@ -698,29 +985,33 @@ class MathProblemsDB:
             return None
 
         # Статистика по дням
-        cursor.execute('''
-            SELECT DATE(solved_at), COUNT(*), SUM(CASE WHEN is_correct THEN 1 ELSE 0 END)
-            FROM user_attempts 
-            WHERE user_id = ?
-            GROUP BY DATE(solved_at)
-            ORDER BY DATE(solved_at) DESC
-            LIMIT 30
-        ''', (user_id,))
-        daily_stats = cursor.fetchall()
+        daily_stats = self._daily_activity(cursor, user_id, 30)
 
         # Статистика по задачам
         cursor.execute('''
             SELECT problem_number, 
-                   COUNT(*) as total_attempts,
-                   SUM(CASE WHEN is_correct THEN 1 ELSE 0 END) as correct_attempts,
-                   MIN(solved_at) as first_attempt,
-                   MAX(solved_at) as last_attempt
-            FROM user_attempts 
-            WHERE user_id = ?
+                   SUM(attempts) as total_attempts,
+                   SUM(correct) as correct_attempts,
+                   MIN(first_attempt) as first_attempt,
+                   MAX(last_attempt) as last_attempt
+            FROM (
+                SELECT problem_number, COUNT(*) AS attempts,
+                       SUM(CASE WHEN is_correct THEN 1 ELSE 0 END) AS correct,
+                       MIN(solved_at) AS first_attempt,
+                       MAX(solved_at) AS last_attempt
+                FROM user_attempts
+                WHERE user_id = ?
+                GROUP BY problem_number
+                UNION ALL
+                SELECT problem_number, attempts, correct_attempts,
+                       first_attempt_at, last_attempt_at
+                FROM user_problem_rollup
+                WHERE user_id = ?
+            )
             GROUP BY problem_number
             ORDER BY total_attempts DESC
             LIMIT 20
-        ''', (user_id,))
+        ''', (user_id, user_id))
         problem_stats = cursor.fetchall()
 
         conn.close()
@@ -0,0 +1,267 @@
+import asyncio
+import json
+import logging
+import pickle
+import sqlite3
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+logger = logging.getLogger(__name__)
+
+# Пауза перед повтором записи после ошибки: растет вдвое до максимума
+FLUSH_RETRY_DELAY = 1
+FLUSH_RETRY_MAX_DELAY = 30
+
+
+class SQLitePersistence(BasePersistence):
+    """Хранит user_data, chat_data и состояния диалогов в SQLite.
+
+    Каждая запись (пользователь, чат, диалог) хранится отдельной строкой,
+    поэтому обновление одного пользователя не переписывает данные остальных.
+    Записи, которые не изменились с последнего сохранения, пропускаются,
+    а изменения одного цикла обновления пишутся одной транзакцией.
+    """
+
+    def __init__(self, db_path, store_data: PersistenceInput = None,
+                 update_interval: float = 60):
+        super().__init__(store_data=store_data,
+                         update_interval=update_interval)
+        self.db_path = db_path
+        # Последние записанные в базу значения: (вид, ключ) -> bytes
+        self._snapshots = {}
+        # Изменения, ожидающие записи: (вид, ключ) -> bytes или None (удалить)
+        self._pending = {}
+        # Пачка, которая пишется сейчас: после записи она станет _snapshots
+        self._in_flight = {}
+        self._flush_task = None
+        self._backing_off = False
+        # Идет flush при остановке: ошибки записи не повторяются
+        self._closing = False
+        self._create_tables()
+
+    def _create_tables(self):
+        """Создает таблицу для хранения состояния бота"""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS persistence_data (
+                    kind TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    data BLOB NOT NULL,
+                    PRIMARY KEY (kind, key)
+                ) WITHOUT ROWID
+            ''')
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _load(self, kind):
+        """Загружает все записи указанного вида"""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            rows = conn.execute(
+                'SELECT key, data FROM persistence_data WHERE kind = ?',
+                (kind,)).fetchall()
+        finally:
+            conn.close()
+
+        result = {}
+        for key, data in rows:
+            self._snapshots[(kind, key)] = data
+            result[key] = pickle.loads(data)
+        return result
+
+    def _stage(self, kind, key, value):
+        """Ставит запись в очередь на сохранение, если она изменилась"""
+        record_key = (kind, str(key))
+
+        if value is None:
+            data = None
+        else:
+            try:
+                data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            except Exception as e:
+                logger.error(f"Не удалось сериализовать {kind} {key}: {e}")
+                return
+
+        # Сравниваем с тем, что окажется в базе: пока пачка пишется,
+        # это ее значение, а не прошлый снимок
+        if record_key in self._in_flight:
+            written = self._in_flight[record_key]
+        else:
+            written = self._snapshots.get(record_key)
+        if data == written:
+            self._pending.pop(record_key, None)
+            return
+
+        self._pending[record_key] = data
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        """Запускает запись накопленных изменений, если она еще не запущена"""
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.get_running_loop().create_task(
+                self._flush_pending())
+
+    async def _flush_pending(self):
+        """Записывает накопленные изменения, пока очередь не опустеет.
+
+        Изменения, поставленные во время записи, пишутся следующей
+        транзакцией той же задачи. После ошибки записи задача не
+        завершается, а повторяет запись с растущей паузой (кроме flush
+        при остановке: тогда она оставляет пачку в очереди и выходит).
+        """
+        retry_delay = 0
+        while True:
+            if retry_delay:
+                self._backing_off = True
+                try:
+                    await asyncio.sleep(retry_delay)
+                finally:
+                    self._backing_off = False
+            else:
+                # Даем остальным update_* текущего цикла поставить
+                # свои изменения
+                await asyncio.sleep(0)
+
+            batch, self._pending = self._pending, {}
+            if not batch:
+                return
+
+            self._in_flight = batch
+            try:
+                await asyncio.to_thread(self._write_batch, batch)
+            except Exception as e:
+                # Возвращаем в очередь записи, которые не успели
+                # измениться снова
+                for record_key, data in batch.items():
+                    self._pending.setdefault(record_key, data)
+                if self._closing:
+                    return
+                retry_delay = min(FLUSH_RETRY_MAX_DELAY,
+                                  retry_delay * 2 or FLUSH_RETRY_DELAY)
+                logger.error(f"Ошибка при сохранении состояния бота: {e}; "
+                             f"повтор через {retry_delay} с")
+                continue
+            finally:
+                self._in_flight = {}
+
+            retry_delay = 0
+            self._remember(batch)
+
+    def _remember(self, batch):
+        """Запоминает записанную пачку как содержимое базы"""
+        for record_key, data in batch.items():
+            if data is None:
+                self._snapshots.pop(record_key, None)
+            else:
+                self._snapshots[record_key] = data
+
+    def _write_batch(self, batch):
+        """Применяет пачку изменений к базе"""
+        upserts = [(kind, key, data) for (kind, key), data in batch.items()
+                   if data is not None]
+        deletes = [(kind, key) for (kind, key), data in batch.items()
+                   if data is None]
+
+        conn = sqlite3.connect(self.db_path)
+        try:
+            with conn:
+                conn.executemany('''
+                    INSERT INTO persistence_data (kind, key, data)
+                    VALUES (?, ?, ?)
+                    ON CONFLICT (kind, key) DO UPDATE SET data = excluded.data
+                ''', upserts)
+                conn.executemany(
+                    'DELETE FROM persistence_data WHERE kind = ? AND key = ?',
+                    deletes)
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _conversation_kind(name):
+        return f'conversation:{name}'
+
+    async def get_user_data(self):
+        return {int(key): value for key, value in self._load('user').items()}
+
+    async def get_chat_data(self):
+        return {int(key): value for key, value in self._load('chat').items()}
+
+    async def get_bot_data(self):
+        return self._load('bot').get('bot', {})
+
+    async def get_callback_data(self):
+        return self._load('callback').get('callback')
+
+    async def get_conversations(self, name):
+        # Ключ диалога - кортеж id, храним его в виде JSON-списка
+        return {tuple(json.loads(key)): state for key, state in
+                self._load(self._conversation_kind(name)).items()}
+
+    async def update_conversation(self, name, key, new_state):
+        self._stage(self._conversation_kind(name), json.dumps(list(key)),
+                    new_state)
+
+    async def update_user_data(self, user_id, data):
+        self._stage('user', user_id, data)
+
+    async def update_chat_data(self, chat_id, data):
+        self._stage('chat', chat_id, data)
+
+    async def update_bot_data(self, data):
+        self._stage('bot', 'bot', data)
+
+    async def update_callback_data(self, data):
+        self._stage('callback', 'callback', data)
+
+    async def drop_user_data(self, user_id):
+        self._stage('user', user_id, None)
+
+    async def drop_chat_data(self, chat_id):
+        self._stage('chat', chat_id, None)
+
+    async def refresh_user_data(self, user_id, user_data):
+        # Обновления одного пользователя (из всех его чатов) обрабатывает
+        # один процесс (см. WorkerPool.worker_for), поэтому данные в
+        # памяти всегда актуальны
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    async def flush(self):
+        """Дописывает все изменения при остановке бота.
+
+        Запись пробуется один раз: если база недоступна, изменения
+        теряются с ошибкой в логе, но остановка бота не зависает.
+        """
+        self._closing = True
+        try:
+            if self._flush_task is not None and not self._flush_task.done():
+                if self._backing_off:
+                    # Задача ждет повтора после ошибки, а все ее записи
+                    # уже в _pending - пишем их сами ниже
+                    self._flush_task.cancel()
+                try:
+                    # Если текущая запись задачи не удастся, задача
+                    # вернет пачку в _pending и завершится без повторов
+                    await self._flush_task
+                except asyncio.CancelledError:
+                    pass
+
+            if self._pending:
+                batch, self._pending = self._pending, {}
+                try:
+                    self._write_batch(batch)
+                except Exception as e:
+                    logger.error(f"Не удалось сохранить состояние бота при "
+                                 f"остановке: {e}; потеряно записей: "
+                                 f"{len(batch)}")
+                    return
+                self._remember(batch)
+        finally:
+            self._closing = False
@@ -0,0 +1,224 @@
+import json
+import logging
+import random
+import re
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Отдельный логгер, чтобы медленные запросы можно было направить в свой файл
+slow_query_logger = logging.getLogger('database.slow_queries')
+
+_WHITESPACE = re.compile(r'\s+')
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+_VALUES_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+
+
+def normalize_sql(sql):
+    """Приводит запрос к общему виду: литералы заменяются на ?"""
+    sql = _STRING_LITERAL.sub('?', sql)
+    sql = _NUMBER_LITERAL.sub('?', sql)
+    sql = _WHITESPACE.sub(' ', sql).strip()
+    return _VALUES_LIST.sub('(?)', sql)
+
+
+class QueryStats:
+    """Накопленная статистика одного нормализованного запроса"""
+
+    __slots__ = ('sql', 'count', 'total', 'max', 'rows', 'slow', 'plan')
+
+    def __init__(self, sql):
+        self.sql = sql
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+        self.slow = 0
+        self.plan = None
+
+    def as_dict(self):
+        return {
+            'sql': self.sql,
+            'count': self.count,
+            'total_ms': round(self.total * 1000, 3),
+            'avg_ms': round(self.total / self.count * 1000, 3)
+            if self.count else 0,
+            'max_ms': round(self.max * 1000, 3),
+            'rows': self.rows,
+            'slow': self.slow,
+            'plan': self.plan,
+        }
+
+
+class QueryProfiler:
+    """Профилировщик запросов MathProblemsDB.
+
+    Для каждого запроса учитывает время выполнения (вместе с чтением строк)
+    и число возвращенных строк. Запросы медленнее slow_threshold_ms пишутся
+    в лог database.slow_queries в виде JSON, а для доли explain_sample_rate
+    из них сохраняется EXPLAIN QUERY PLAN.
+    """
+
+    def __init__(self, db_path, slow_threshold_ms=50, explain_sample_rate=0.1):
+        self.db_path = db_path
+        self.slow_threshold = slow_threshold_ms / 1000
+        self.explain_sample_rate = explain_sample_rate
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def record(self, sql, params, duration, rows):
+        normalized = normalize_sql(sql)
+        is_slow = duration >= self.slow_threshold
+
+        with self._lock:
+            stats = self._stats.get(normalized)
+            if stats is None:
+                stats = self._stats[normalized] = QueryStats(normalized)
+            stats.count += 1
+            stats.total += duration
+            stats.max = max(stats.max, duration)
+            stats.rows += rows
+            if is_slow:
+                stats.slow += 1
+            need_plan = is_slow and (
+                stats.plan is None or
+                random.random() < self.explain_sample_rate)
+
+        if not is_slow:
+            return
+
+        plan = self._explain(sql, params) if need_plan else None
+        if plan is not None:
+            stats.plan = plan
+
+        slow_query_logger.warning(json.dumps({
+            'event': 'slow_query',
+            'sql': normalized,
+            'duration_ms': round(duration * 1000, 3),
+            'rows': rows,
+            'plan': plan,
+        }, ensure_ascii=False))
+
+    def _explain(self, sql, params):
+        """План запроса; для запросов, которые нельзя объяснить, - None"""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            return [row[3] for row in
+                    conn.execute(f'EXPLAIN QUERY PLAN {sql}', params or ())]
+        except sqlite3.Error:
+            return None
+        finally:
+            conn.close()
+
+    def top(self, limit=10, key='total'):
+        """Самые затратные запросы по total, max, count или slow"""
+        with self._lock:
+            stats = list(self._stats.values())
+        stats.sort(key=lambda item: getattr(item, key), reverse=True)
+        return [item.as_dict() for item in stats[:limit]]
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+class ProfilingCursor(sqlite3.Cursor):
+    """Курсор, передающий профилировщику время и число строк запросов"""
+
+    profiler = None
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        started = time.perf_counter()
+        result = super().execute(sql, parameters)
+        self._query = (sql, parameters)
+        self._elapsed = time.perf_counter() - started
+        self._rows = 0
+        return result
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        started = time.perf_counter()
+        result = super().executemany(sql, seq_of_parameters)
+        self._query = (sql, None)
+        self._elapsed = time.perf_counter() - started
+        self._rows = 0
+        return result
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._add_fetch(started, 0 if row is None else 1)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._add_fetch(started, len(rows))
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._add_fetch(started, len(rows))
+        self._finish()
+        return rows
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def _add_fetch(self, started, rows):
+        if getattr(self, '_query', None) is not None:
+            self._elapsed += time.perf_counter() - started
+            self._rows += rows
+
+    def _finish(self):
+        """Передает профилировщику данные о последнем запросе курсора"""
+        query = getattr(self, '_query', None)
+        if query is None:
+            return
+        self._query = None
+        sql, parameters = query
+        self.profiler.record(sql, parameters, self._elapsed, self._rows)
+
+
+class ProfilingConnection(sqlite3.Connection):
+    """Соединение, все курсоры которого профилируются"""
+
+    cursor_class = ProfilingCursor
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._cursors = []
+
+    def cursor(self, factory=None):
+        cursor = super().cursor(factory or self.cursor_class)
+        self._cursors.append(cursor)
+        return cursor
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def close(self):
+        # Запросы, строки которых дочитывались через fetchone,
+        # учитываются при закрытии соединения
+        for cursor in self._cursors:
+            if isinstance(cursor, ProfilingCursor):
+                cursor._finish()
+        self._cursors.clear()
+        super().close()
+
+
+def profiling_connection_factory(profiler):
+    """Класс соединения для sqlite3.connect(..., factory=...)"""
+    cursor_class = type('ProfilingCursor', (ProfilingCursor,),
+                        {'profiler': profiler})
+    return type('ProfilingConnection', (ProfilingConnection,),
+                {'cursor_class': cursor_class})
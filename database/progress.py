@@ -0,0 +1,250 @@
+import hashlib
+import logging
+import random
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Сколько секунд процесс доверяет прогрессу в памяти при чтении: сброс
+# прогресса в другом процессе будет замечен позже. Запись попытки
+# сверяет версию всегда
+PROGRESS_CHECK_TTL = 5
+
+
+def _to_blob(bits):
+    return bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+
+
+def _from_blob(blob):
+    return int.from_bytes(blob, 'little')
+
+
+class UserProgress:
+    """Прогресс пользователя: битовые множества решенных и начатых задач.
+
+    Бит с номером i соответствует задаче с порядковым номером i в каталоге.
+    """
+
+    __slots__ = ('solved', 'attempted')
+
+    def __init__(self, solved=0, attempted=0):
+        self.solved = solved
+        self.attempted = attempted
+
+    def is_solved(self, ordinal):
+        return bool(self.solved >> ordinal & 1)
+
+    def is_attempted(self, ordinal):
+        return bool(self.attempted >> ordinal & 1)
+
+    def mark(self, ordinal, is_correct):
+        """Отмечает попытку. Возвращает True, если задача решена впервые"""
+        bit = 1 << ordinal
+        self.attempted |= bit
+        if is_correct and not self.solved & bit:
+            self.solved |= bit
+            return True
+        return False
+
+    @property
+    def solved_count(self):
+        return self.solved.bit_count()
+
+    @property
+    def attempted_count(self):
+        return self.attempted.bit_count()
+
+    def solved_in(self, mask):
+        """Сколько задач из маски решено"""
+        return (self.solved & mask).bit_count()
+
+
+class ProgressStore:
+    """Прогресс пользователей в виде битовых множеств.
+
+    Множества хранятся в таблице user_progress_bits как BLOB вместе с
+    отпечатком каталога, по которому назначены порядковые номера задач.
+    Если каталог изменился, прогресс пересчитывается из user_attempts.
+    В памяти хранятся данные не более max_users последних активных
+    пользователей. Обработчики вызывают хранилище из пула потоков, поэтому
+    кэш в памяти защищен блокировкой. Версия строки в базе растет при
+    сбросе прогресса, по ней процессы узнают, что их кэш устарел.
+    """
+
+    def __init__(self, db, catalog, max_users=10000):
+        # Прогресс хранится рядом с попытками, в шарде пользователя
+        self.db = db
+        self.max_users = max_users
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Плотные порядковые номера задач: номер задачи -> бит
+        self.problem_numbers = sorted(catalog.problems)
+        self.ordinals = {problem_number: ordinal for ordinal, problem_number
+                         in enumerate(self.problem_numbers)}
+        self.fingerprint = hashlib.sha1(
+            ','.join(map(str, self.problem_numbers)).encode()).hexdigest()
+
+        # id раздела -> маска задач раздела
+        self.section_masks = {}
+        for section_id, problems in catalog.section_problems.items():
+            mask = 0
+            for problem in problems:
+                mask |= 1 << self.ordinals[problem.problem_number]
+            self.section_masks[section_id] = mask
+        self.all_mask = (1 << len(self.problem_numbers)) - 1
+
+    def get(self, user_id, cursor=None, verify=False):
+        """Прогресс пользователя (из памяти, из базы или пересчитанный).
+
+        Прогресс в памяти сверяется с версией в базе не чаще раза в
+        PROGRESS_CHECK_TTL секунд, а с verify - при каждом вызове.
+        cursor - транзакция вызывающего кода (см. MathProblemsDB._transaction).
+        """
+        now = time.monotonic()
+        with self._lock:
+            cached = self._users.get(user_id)
+            if cached is not None:
+                self._users.move_to_end(user_id)
+                if not verify and now - cached[2] < PROGRESS_CHECK_TTL:
+                    return cached[0]
+
+        if cursor is None:
+            conn = self.db._connect(user_id)
+            try:
+                with conn:
+                    progress, version = self._fetch(conn.cursor(), user_id,
+                                                    cached)
+            finally:
+                conn.close()
+        else:
+            progress, version = self._fetch(cursor, user_id, cached)
+
+        with self._lock:
+            # Другой поток мог загрузить ту же версию раньше - оставляем ее
+            current = self._users.get(user_id)
+            if current is not None and current[1] == version:
+                progress = current[0]
+            self._users[user_id] = (progress, version, now)
+            self._users.move_to_end(user_id)
+            if len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        return progress
+
+    def _fetch(self, cursor, user_id, cached=None):
+        """(прогресс, версия) из базы; устаревший прогресс пересчитывается.
+
+        Если версия в базе совпадает с версией cached, возвращается он.
+        """
+        if cached is not None:
+            row = cursor.execute(
+                'SELECT version FROM user_progress_bits WHERE user_id = ?',
+                (user_id,)).fetchone()
+            if row is not None and row[0] == cached[1]:
+                return cached[0], cached[1]
+
+        row = cursor.execute('''
+            SELECT fingerprint, solved, attempted, version
+            FROM user_progress_bits
+            WHERE user_id = ?
+        ''', (user_id,)).fetchone()
+        version = row[3] if row else 0
+        if row is not None and row[0] == self.fingerprint:
+            return UserProgress(_from_blob(row[1]), _from_blob(row[2])), version
+
+        progress = self._rebuild(cursor, user_id)
+        self._save(cursor, user_id, progress)
+        return progress, version
+
+    def _rebuild(self, cursor, user_id):
+        """Пересчитывает прогресс по истории попыток"""
+        # Архивные попытки учитываются по сводке user_problem_rollup
+        rows = cursor.execute('''
+            SELECT problem_number, MAX(is_correct)
+            FROM user_attempts
+            WHERE user_id = ?
+            GROUP BY problem_number
+            UNION ALL
+            SELECT problem_number, correct_attempts > 0
+            FROM user_problem_rollup
+            WHERE user_id = ?
+        ''', (user_id, user_id)).fetchall()
+
+        progress = UserProgress()
+        for problem_number, is_correct in rows:
+            ordinal = self.ordinals.get(problem_number)
+            if ordinal is not None:
+                progress.mark(ordinal, bool(is_correct))
+        return progress
+
+    def _save(self, cursor, user_id, progress):
+        cursor.execute('''
+            INSERT INTO user_progress_bits
+                (user_id, fingerprint, solved, attempted)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (user_id) DO UPDATE SET
+                fingerprint = excluded.fingerprint,
+                solved = excluded.solved,
+                attempted = excluded.attempted
+        ''', (user_id, self.fingerprint, _to_blob(progress.solved),
+              _to_blob(progress.attempted)))
+
+    def record_attempt(self, user_id, problem_number, is_correct,
+                       cursor=None):
+        """Учитывает попытку. Возвращает прогресс пользователя.
+
+        Версия прогресса сверяется в транзакции записи, поэтому прогресс,
+        сброшенный в другом процессе, не перезаписывается битами из памяти.
+        """
+        ordinal = self.ordinals.get(int(problem_number))
+        if ordinal is None:
+            return self.get(user_id, cursor)
+
+        with self.db._transaction(user_id, cursor) as cursor:
+            progress = self.get(user_id, cursor, verify=True)
+            attempted_before = progress.attempted
+            newly_solved = progress.mark(ordinal, is_correct)
+            # Повторные попытки уже начатой задачи битов не меняют
+            if newly_solved or progress.attempted != attempted_before:
+                self._save(cursor, user_id, progress)
+        return progress
+
+    def section_solved_counts(self, user_id):
+        """id раздела -> сколько задач раздела решил пользователь"""
+        progress = self.get(user_id)
+        return {section_id: progress.solved_in(mask)
+                for section_id, mask in self.section_masks.items()}
+
+    def random_unsolved(self, user_id):
+        """Номер случайной нерешенной задачи или None, если решены все"""
+        unsolved = self.all_mask & ~self.get(user_id).solved
+        if not unsolved:
+            return None
+        ordinals = [ordinal for ordinal in range(unsolved.bit_length())
+                    if unsolved >> ordinal & 1]
+        return self.problem_numbers[random.choice(ordinals)]
+
+    def drop(self, user_id):
+        """Убирает прогресс пользователя из памяти; в базе он остается"""
+        with self._lock:
+            self._users.pop(user_id, None)
+
+    def forget(self, user_id):
+        """Сбрасывает прогресс пользователя (после удаления его попыток).
+
+        Прогресс пересчитается при следующем обращении, а процессы, у
+        которых он в памяти, заметят сброс по версии.
+        """
+        self.drop(user_id)
+        conn = self.db._connect(user_id)
+        try:
+            with conn:
+                conn.execute('''
+                    UPDATE user_progress_bits
+                    SET fingerprint = '', version = version + 1
+                    WHERE user_id = ?
+                ''', (user_id,))
+        finally:
+            conn.close()
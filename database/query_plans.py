@@ -0,0 +1,59 @@
+"""Проверка планов частых запросов через EXPLAIN QUERY PLAN.
+
+Тексты запросов берутся из database.models, поэтому проверяются именно
+те запросы, которые выполняет бот, вместе с подзапросами по сводкам и
+архивам попыток.
+"""
+from .models import MathProblemsDB, HISTORY_COLUMNS, ATTEMPTS_COUNT_SQL, \
+    UNIQUE_SOLVED_SQL, ATTEMPTS_PER_PROBLEM_SQL, \
+    DAILY_ACTIVITY_SQL, RECENT_ATTEMPTS_SQL, ATTEMPTS_BY_DATE_SQL, \
+    LEADERBOARD_SQL, ALL_USERS_STATS_SQL
+
+
+def _attempts_by_date(cursor):
+    source, params = MathProblemsDB._user_attempts_source(cursor, 1,
+                                                          HISTORY_COLUMNS)
+    return (ATTEMPTS_BY_DATE_SQL.format(source=source),
+            (*params, '2024-01-15', '2024-01-16'))
+
+
+# Имя запроса -> функция (cursor) -> (текст запроса, параметры)
+HOT_QUERIES = [
+    ('get_user_attempts_count',
+     lambda cursor: (ATTEMPTS_COUNT_SQL, (1, 1))),
+    ('unique_solved_problems',
+     lambda cursor: (UNIQUE_SOLVED_SQL, (1, 1))),
+    ('attempts_per_problem',
+     lambda cursor: (ATTEMPTS_PER_PROBLEM_SQL, (1, 1))),
+    ('daily_activity',
+     lambda cursor: (DAILY_ACTIVITY_SQL, (1, '2024-01-09', 1, '2024-01-09'))),
+    ('get_user_recent_attempts',
+     lambda cursor: (RECENT_ATTEMPTS_SQL, (1, 10))),
+    ('get_user_attempts_by_date', _attempts_by_date),
+    ('get_leaderboard',
+     lambda cursor: (LEADERBOARD_SQL, (10,))),
+    ('get_all_users_stats',
+     lambda cursor: (ALL_USERS_STATS_SQL, (100,))),
+]
+
+
+def is_full_scan(detail):
+    """Полный скан таблицы в строке плана.
+
+    Сканирование по индексу (с LIMIT) и обход уже отобранных строк
+    подзапроса полным сканом не считаются.
+    """
+    return detail.startswith('SCAN') and 'USING' not in detail \
+        and 'subquery' not in detail
+
+
+def check_query_plans(conn):
+    """Возвращает список (имя запроса, строки плана, есть ли полный скан)"""
+    cursor = conn.cursor()
+    results = []
+    for name, build in HOT_QUERIES:
+        sql, params = build(cursor)
+        plan = [row[3] for row in
+                conn.execute(f'EXPLAIN QUERY PLAN {sql}', params)]
+        results.append((name, plan, any(map(is_full_scan, plan))))
+    return results
@@ -0,0 +1,162 @@
+"""Интервальное повторение задач по алгоритму SM-2.
+
+Для каждой задачи, которую пользователь решал, в review_schedule
+хранятся число успешных повторений подряд, интервал в днях, коэффициент
+легкости и дата следующего повторения. Каждая попытка сдвигает дату:
+верный ответ - на растущий интервал, неверный - на следующий день.
+
+Индекс (user_id, due_at) позволяет найти ближайшую задачу к повторению
+одним запросом, а фоновая задача заранее считает план повторений на
+завтра (review_plan), чтобы /review не пересчитывал его.
+"""
+import logging
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EASE = 2.5
+MIN_EASE = 1.3
+# Сколько дней хранятся посчитанные планы
+PLAN_KEEP_DAYS = 7
+
+# Оценки ответа по шкале SM-2 (0-5)
+QUALITY_CORRECT = 5
+QUALITY_WRONG = 2
+
+_TIMESTAMP = '%Y-%m-%d %H:%M:%S'
+
+
+def next_review(repetitions, interval_days, ease, quality):
+    """Новые (повторений подряд, интервал в днях, легкость) по SM-2"""
+    if quality < 3:
+        repetitions, interval_days = 0, 1
+    else:
+        if repetitions == 0:
+            interval_days = 1
+        elif repetitions == 1:
+            interval_days = 6
+        else:
+            interval_days = round(interval_days * ease)
+        repetitions += 1
+    ease += 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02)
+    return repetitions, interval_days, max(MIN_EASE, ease)
+
+
+def _day_start(day):
+    return datetime.combine(day, datetime.min.time()).strftime(_TIMESTAMP)
+
+
+class ReviewScheduler:
+    """Расписание повторений пользователей в их шардах базы"""
+
+    def __init__(self, db):
+        self.db = db
+
+    def record(self, user_id, problem_number, is_correct, now=None,
+               cursor=None):
+        """Сдвигает дату повторения задачи после попытки.
+
+        Оценивается первая попытка за день; повторные попытки в тот же
+        день только возвращают задачу на завтра, если ответ неверный.
+        cursor - транзакция вызывающего кода (см. MathProblemsDB._transaction).
+        """
+        now = now or datetime.utcnow()
+
+        with self.db._transaction(user_id, cursor) as cursor:
+            cursor.execute('''
+                SELECT repetitions, interval_days, ease, reviewed_at
+                FROM review_schedule
+                WHERE user_id = ? AND problem_number = ?
+            ''', (user_id, problem_number))
+            row = cursor.fetchone()
+            if row is None or row[3] < _day_start(now.date()):
+                state = row[:3] if row else (0, 0, DEFAULT_EASE)
+                quality = QUALITY_CORRECT if is_correct else QUALITY_WRONG
+                repetitions, interval_days, ease = next_review(*state,
+                                                               quality)
+            elif not is_correct:
+                repetitions, interval_days, ease = 0, 1, row[2]
+            else:
+                return
+
+            due_at = now + timedelta(days=interval_days)
+            cursor.execute('''
+                INSERT INTO review_schedule
+                    (user_id, problem_number, repetitions, interval_days,
+                     ease, due_at, reviewed_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (user_id, problem_number) DO UPDATE SET
+                    repetitions = excluded.repetitions,
+                    interval_days = excluded.interval_days,
+                    ease = excluded.ease,
+                    due_at = excluded.due_at,
+                    reviewed_at = excluded.reviewed_at
+            ''', (user_id, problem_number, repetitions, interval_days,
+                  ease, due_at.strftime(_TIMESTAMP),
+                  now.strftime(_TIMESTAMP)))
+
+    def next_due(self, user_id, today=None):
+        """Номер задачи, которую пора повторить сегодня, или None"""
+        today = today or datetime.utcnow().date()
+        conn = self.db._connect(user_id)
+        try:
+            row = conn.execute('''
+                SELECT problem_number FROM review_schedule
+                WHERE user_id = ? AND due_at < ?
+                ORDER BY due_at
+                LIMIT 1
+            ''', (user_id, _day_start(today + timedelta(days=1)))).fetchone()
+        finally:
+            conn.close()
+        return row[0] if row else None
+
+    def due_counts(self, user_id, today=None):
+        """(задач к повторению сейчас, план на сегодня или None)"""
+        today = today or datetime.utcnow().date()
+        conn = self.db._connect(user_id)
+        try:
+            due = conn.execute('''
+                SELECT COUNT(*) FROM review_schedule
+                WHERE user_id = ? AND due_at < ?
+            ''', (user_id, _day_start(today + timedelta(days=1)))).fetchone()
+            plan = conn.execute('''
+                SELECT planned FROM review_plan WHERE user_id = ? AND day = ?
+            ''', (user_id, today.isoformat())).fetchone()
+        finally:
+            conn.close()
+        return due[0], plan[0] if plan else None
+
+    def build_plans(self, today=None):
+        """Считает планы повторений на завтра для всех пользователей.
+
+        План на сегодня дописывается только для тех, у кого его еще нет:
+        уже повторенные сегодня задачи не должны уменьшать план.
+        Возвращает число задач в планах на завтра.
+        """
+        today = today or datetime.utcnow().date()
+        tomorrow = today + timedelta(days=1)
+        planned = 0
+        for path in self.db.user_db_paths:
+            conn = self.db._connect_path(path)
+            try:
+                with conn:
+                    for day, replace in ((today, False), (tomorrow, True)):
+                        verb = 'INSERT OR REPLACE' if replace \
+                            else 'INSERT OR IGNORE'
+                        conn.execute(f'''
+                            {verb} INTO review_plan (user_id, day, planned)
+                            SELECT user_id, ?, COUNT(*)
+                            FROM review_schedule
+                            WHERE due_at < ?
+                            GROUP BY user_id
+                        ''', (day.isoformat(),
+                              _day_start(day + timedelta(days=1))))
+                    conn.execute('DELETE FROM review_plan WHERE day < ?', (
+                        (today - timedelta(days=PLAN_KEEP_DAYS)).isoformat(),))
+                    planned += conn.execute(
+                        'SELECT COALESCE(SUM(planned), 0) FROM review_plan '
+                        'WHERE day = ?', (tomorrow.isoformat(),)).fetchone()[0]
+            finally:
+                conn.close()
+        logger.info(f"План повторений на {tomorrow}: {planned} задач")
+        return planned
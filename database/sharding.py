@@ -0,0 +1,302 @@
+"""Распределение данных пользователей по нескольким файлам базы.
+
+Разделы и задачи хранятся в основной базе, а таблицы пользователей
+(попытки, статистика, прогресс, архивы) - в шардах
+math_problems.shard0.db ... math_problems.shardN-1.db. Шард выбирается
+по хешу user_id, поэтому запись идет в N файлов параллельно.
+
+При одном шарде все данные остаются в основной базе, как раньше.
+Число шардов записывается в основную базу; изменить его можно только
+перераспределением данных при остановленном боте:
+
+    python -m database.sharding [база] --shards N
+"""
+import argparse
+import logging
+import os
+import sqlite3
+from pathlib import Path
+
+from .adaptive import rebuild_problem_stats
+from .migrations import apply_migrations
+
+logger = logging.getLogger(__name__)
+
+# Таблицы с данными пользователей; архивы попыток добавляются к ним
+# по реестру attempt_archives
+USER_TABLES = [
+    'user_stats',
+    'user_attempts',
+    'user_problem_attempts',
+    'user_progress_bits',
+    'user_problem_rollup',
+    'user_daily_rollup',
+    'review_schedule',
+    'review_plan',
+    'exam_answers',
+]
+
+# Множитель хеша Кнута: соседние user_id попадают в разные шарды
+_HASH = 2654435761
+
+
+def shard_index(user_id, shard_count):
+    """Номер шарда пользователя"""
+    return (int(user_id) * _HASH & 0xFFFFFFFF) % shard_count
+
+
+def shard_paths(db_path, shard_count):
+    """Файлы с данными пользователей: сама база или ее шарды"""
+    if shard_count <= 1:
+        return [db_path]
+    path = Path(db_path)
+    return [str(path.with_name(f"{path.stem}.shard{i}{path.suffix}"))
+            for i in range(shard_count)]
+
+
+def adopt_legacy_database(db_path, legacy_path):
+    """Переносит базу со старого места, если на новом ее еще нет.
+
+    До появления каталога данных база лежала в другом файле (в
+    docker-compose - в файле, смонтированном в /app). Без переноса бот
+    запустился бы на новой пустой базе, а попытки пользователей остались
+    бы в старом файле. Старый файл может быть смонтирован отдельно,
+    поэтому база копируется backup API, а сам файл остается на месте.
+    Возвращает True, если база перенесена.
+    """
+    if not legacy_path or os.path.exists(db_path) \
+            or not os.path.isfile(legacy_path) \
+            or os.path.abspath(legacy_path) == os.path.abspath(db_path):
+        return False
+
+    partial = f"{db_path}.adopting"
+    source = sqlite3.connect(legacy_path)
+    dest = sqlite3.connect(partial)
+    try:
+        source.backup(dest)
+    finally:
+        dest.close()
+        source.close()
+    # Незаконченная копия не должна выглядеть как готовая база
+    os.replace(partial, db_path)
+    logger.warning(f"База перенесена из {legacy_path} в {db_path}. "
+                   f"Старый файл больше не используется, его можно удалить")
+    return True
+
+
+def get_shard_count(conn):
+    """Число шардов, под которое разложены данные базы"""
+    row = conn.execute(
+        "SELECT value FROM db_settings WHERE key = 'shard_count'").fetchone()
+    return int(row[0]) if row else 1
+
+
+def set_shard_count(conn, shard_count):
+    with conn:
+        conn.execute('''
+            INSERT INTO db_settings (key, value) VALUES ('shard_count', ?)
+            ON CONFLICT (key) DO UPDATE SET value = excluded.value
+        ''', (str(shard_count),))
+
+
+def check_shard_count(conn, shard_count):
+    """Проверяет, что данные разложены под shard_count шардов.
+
+    Новая пустая база сразу размечается под заданное число шардов.
+    """
+    row = conn.execute(
+        "SELECT value FROM db_settings WHERE key = 'shard_count'").fetchone()
+    if row is None and not _has_user_data(conn):
+        set_shard_count(conn, shard_count)
+        return
+    stored = int(row[0]) if row else 1
+    if stored != shard_count:
+        raise ValueError(
+            f"Данные пользователей разложены по {stored} шардам, а в "
+            f"настройках указано {shard_count}. Остановите бота и "
+            f"выполните python -m database.sharding --shards {shard_count}")
+
+
+def _has_user_data(conn):
+    return any(conn.execute(f'SELECT 1 FROM {table} LIMIT 1').fetchone()
+               for table in ('user_stats', 'user_attempts'))
+
+
+def attach_content(conn, db_path):
+    """Делает разделы, задачи и экзамены основной базы видимыми в шарде.
+
+    Временные представления имеют приоритет над пустыми таблицами
+    шарда, поэтому запросы с JOIN problems работают без изменений.
+    """
+    conn.execute('ATTACH DATABASE ? AS content', (db_path,))
+    conn.execute(
+        'CREATE TEMP VIEW problems AS SELECT * FROM content.problems')
+    conn.execute(
+        'CREATE TEMP VIEW sections AS SELECT * FROM content.sections')
+    conn.execute(
+        'CREATE TEMP VIEW exam_sessions AS '
+        'SELECT * FROM content.exam_sessions')
+    return conn
+
+
+def _user_tables(conn):
+    """Таблицы пользователей в базе, включая архивы попыток"""
+    tables = list(USER_TABLES)
+    tables += [row[0] for row in conn.execute(
+        'SELECT table_name FROM attempt_archives ORDER BY period')]
+    return tables
+
+
+def _copy_columns(conn, table):
+    """Колонки для переноса; id попыток выдается заново в новом файле"""
+    columns = [row[1] for row in conn.execute(f'PRAGMA table_info({table})')]
+    if table == 'user_attempts':
+        columns.remove('id')
+    return ', '.join(columns)
+
+
+def reshard(db_path, shard_count):
+    """Перераспределяет данные пользователей под shard_count шардов.
+
+    Новые шарды собираются во временных файлах и заменяют старые только
+    после того, как все данные перенесены. Бот должен быть остановлен.
+    """
+    from database.archive import ensure_archive_table
+    from database.models import MathProblemsDB
+
+    conn = sqlite3.connect(db_path)
+    try:
+        apply_migrations(conn)
+        old_count = get_shard_count(conn)
+    finally:
+        conn.close()
+    if old_count == shard_count:
+        logger.info(f"Данные уже разложены по {shard_count} шардам")
+        return
+
+    old_paths = shard_paths(db_path, old_count)
+    new_paths = shard_paths(db_path, shard_count)
+    # Один шард - это сама основная база, в нее пишем напрямую
+    targets = [db_path] if shard_count == 1 else \
+        [f"{path}.new" for path in new_paths]
+
+    for target in targets:
+        if target == db_path:
+            continue
+        if os.path.exists(target):
+            os.remove(target)
+        # Создает схему по миграциям
+        MathProblemsDB(target)
+
+    for source in old_paths:
+        conn = sqlite3.connect(source)
+        conn.create_function('shard_index', 1,
+                             lambda user_id: shard_index(user_id, shard_count),
+                             deterministic=True)
+        try:
+            tables = _user_tables(conn)
+            archives = dict(conn.execute(
+                'SELECT table_name, period FROM attempt_archives'))
+            for i, target in enumerate(targets):
+                conn.execute('ATTACH DATABASE ? AS target', (target,))
+                cursor = conn.cursor()
+                cursor.execute('BEGIN IMMEDIATE')
+                for table in tables:
+                    if table in archives:
+                        # Таблица архива создается и регистрируется
+                        # в целевой базе так же, как при архивации
+                        ensure_archive_table(cursor, archives[table],
+                                             schema='target')
+                    columns = _copy_columns(conn, table)
+                    order = ' ORDER BY id' if table == 'user_attempts' else ''
+                    cursor.execute(f'''
+                        INSERT INTO target.{table} ({columns})
+                        SELECT {columns} FROM main.{table}
+                        WHERE shard_index(user_id) = ?{order}
+                    ''', (i,))
+                cursor.execute('COMMIT')
+                conn.execute('DETACH DATABASE target')
+        finally:
+            conn.close()
+
+    for target in targets:
+        _recount_archives(target)
+        _rebuild_problem_stats(target)
+
+    if shard_count > 1:
+        for new_path, target in zip(new_paths, targets):
+            os.replace(target, new_path)
+
+    # Данные перенесены: очищаем старое место хранения
+    if old_count == 1:
+        _clear_user_tables(db_path)
+    else:
+        for path in old_paths:
+            if path not in new_paths:
+                os.remove(path)
+
+    conn = sqlite3.connect(db_path)
+    try:
+        set_shard_count(conn, shard_count)
+    finally:
+        conn.close()
+    logger.info(f"Данные пользователей разложены по {shard_count} шардам")
+
+
+def _recount_archives(db_path):
+    """Пересчитывает число строк в реестре архивов"""
+    conn = sqlite3.connect(db_path)
+    try:
+        with conn:
+            for (table,) in conn.execute(
+                    'SELECT table_name FROM attempt_archives').fetchall():
+                conn.execute(f'''
+                    UPDATE attempt_archives
+                    SET rows = (SELECT COUNT(*) FROM {table})
+                    WHERE table_name = ?
+                ''', (table,))
+    finally:
+        conn.close()
+
+
+def _rebuild_problem_stats(db_path):
+    """Счетчики задач пересчитываются по перенесенным попыткам шарда"""
+    conn = sqlite3.connect(db_path)
+    try:
+        with conn:
+            rebuild_problem_stats(conn.cursor())
+    finally:
+        conn.close()
+
+
+def _clear_user_tables(db_path):
+    """Удаляет данные пользователей из основной базы после переноса"""
+    conn = sqlite3.connect(db_path)
+    try:
+        with conn:
+            for table in _user_tables(conn):
+                if table.startswith('user_attempts_archive_'):
+                    conn.execute(f'DROP TABLE {table}')
+                else:
+                    conn.execute(f'DELETE FROM {table}')
+            conn.execute('DELETE FROM attempt_archives')
+            conn.execute('DELETE FROM problem_stats')
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('db_path', nargs='?', default='math_problems.db')
+    parser.add_argument('--shards', type=int, required=True)
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    reshard(args.db_path, args.shards)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""Каталог задач в разделяемой памяти для нескольких процессов бота.
+
+Основной процесс один раз кодирует каталог в блок
+multiprocessing.shared_memory: массивы номеров задач, разделов и уровней
+сложности и общий буфер текстов и ответов в UTF-8. Рабочие процессы подключаются к
+блоку по имени и читают задачи прямо из него, поэтому каталог не
+копируется в память каждого процесса.
+
+Устройство блока: длина заголовка (4 байта), заголовок JSON (разделы,
+уровни сложности, смещения массивов), затем массивы int32 и буфер текстов.
+"""
+import json
+import struct
+from bisect import bisect_left
+from collections import Counter
+from collections.abc import Mapping, Sequence
+from multiprocessing import shared_memory
+
+from .catalog import CatalogProblem, ProblemCatalog
+
+_HEADER_SIZE = struct.Struct('<I')
+
+
+def _align(offset):
+    return (offset + 7) & ~7
+
+
+def encode_catalog(catalog):
+    """Кодирует каталог в bytes для разделяемой памяти"""
+    # Задачи лежат по разделам, как в каталоге: задачи раздела -
+    # непрерывный отрезок массивов
+    problems = []
+    sections = []
+    for section_id, (name, description) in catalog.sections.items():
+        section_problems = catalog.section_problems.get(section_id, [])
+        sections.append([section_id, name, description, len(problems),
+                         len(problems) + len(section_problems)])
+        problems.extend(section_problems)
+
+    difficulties = sorted({problem.difficulty_level for problem in problems},
+                          key=lambda level: (level is None, str(level)))
+    difficulty_index = {level: i for i, level in enumerate(difficulties)}
+
+    # Текст и ответ задачи i - строки 2i и 2i + 1 буфера
+    texts = [value.encode('utf-8') for problem in problems
+             for value in (problem.problem_text, problem.answer)]
+    text_offsets = [0]
+    for text in texts:
+        text_offsets.append(text_offsets[-1] + len(text))
+
+    # Позиции задач в порядке номеров - для поиска задачи по номеру
+    by_number = sorted(range(len(problems)),
+                       key=lambda i: problems[i].problem_number)
+
+    count = len(problems)
+    arrays = {
+        'numbers': ('i', [problem.problem_number for problem in problems]),
+        'sorted_numbers': ('i', [problems[i].problem_number
+                                 for i in by_number]),
+        'by_number': ('i', by_number),
+        'text_offsets': ('I', text_offsets),
+        'difficulty': ('B', [difficulty_index[problem.difficulty_level]
+                             for problem in problems]),
+    }
+    layout = {}
+    offset = 0
+    for name, (fmt, values) in arrays.items():
+        layout[name] = offset
+        offset = _align(offset + struct.calcsize(fmt) * len(values))
+    layout['texts'] = offset
+
+    header = json.dumps({
+        'count': count,
+        'sections': sections,
+        'difficulties': difficulties,
+        'layout': layout,
+    }, ensure_ascii=False).encode('utf-8')
+    start = _align(_HEADER_SIZE.size + len(header))
+
+    body = bytearray(layout['texts'] + text_offsets[-1])
+    for name, (fmt, values) in arrays.items():
+        struct.pack_into(f'<{len(values)}{fmt}', body, layout[name], *values)
+    body[layout['texts']:] = b''.join(texts)
+
+    data = bytearray(start)
+    _HEADER_SIZE.pack_into(data, 0, len(header))
+    data[_HEADER_SIZE.size:_HEADER_SIZE.size + len(header)] = header
+    return bytes(data + body)
+
+
+class _ProblemsByNumber(Mapping):
+    """Номер задачи -> CatalogProblem, с чтением из разделяемой памяти"""
+
+    def __init__(self, catalog):
+        self._catalog = catalog
+
+    def __getitem__(self, problem_number):
+        catalog = self._catalog
+        numbers = catalog._sorted_numbers
+        i = bisect_left(numbers, problem_number)
+        if i == len(numbers) or numbers[i] != problem_number:
+            raise KeyError(problem_number)
+        return catalog._problem(catalog._by_number[i])
+
+    def __iter__(self):
+        return iter(self._catalog._sorted_numbers.tolist())
+
+    def __len__(self):
+        return len(self._catalog._sorted_numbers)
+
+
+class _SectionProblems(Sequence):
+    """Задачи раздела: отрезок [start, stop) массивов каталога"""
+
+    def __init__(self, catalog, start, stop):
+        self._catalog = catalog
+        self._start = start
+        self._stop = stop
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._catalog._problem(self._start + i)
+                    for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return self._catalog._problem(self._start + index)
+
+    def __len__(self):
+        return self._stop - self._start
+
+
+class SharedProblemCatalog(ProblemCatalog):
+    """Каталог, читающий задачи из блока разделяемой памяти.
+
+    Разделы и счетчики небольшие и разбираются при подключении, задачи
+    собираются из массивов при обращении к ним.
+    """
+
+    def __init__(self, shm):
+        self._shm = shm
+        buf = shm.buf
+        (header_size,) = _HEADER_SIZE.unpack_from(buf, 0)
+        header = json.loads(bytes(
+            buf[_HEADER_SIZE.size:_HEADER_SIZE.size + header_size]))
+        start = _align(_HEADER_SIZE.size + header_size)
+        count = header['count']
+        layout = header['layout']
+
+        def array(name, fmt, length):
+            offset = start + layout[name]
+            size = struct.calcsize(fmt) * length
+            return buf[offset:offset + size].cast(fmt)
+
+        self._numbers = array('numbers', 'i', count)
+        self._sorted_numbers = array('sorted_numbers', 'i', count)
+        self._by_number = array('by_number', 'i', count)
+        self._text_offsets = array('text_offsets', 'I', 2 * count + 1)
+        self._difficulty = array('difficulty', 'B', count)
+        self._texts = buf[start + layout['texts']:]
+        self._difficulties = header['difficulties']
+
+        self._section_ids = []
+        self.sections = {}
+        self.section_problems = {}
+        self.section_counts = {}
+        self.difficulty_histograms = {}
+        for section_id, name, description, first, last in header['sections']:
+            self.sections[section_id] = (name, description)
+            self.section_problems[section_id] = _SectionProblems(
+                self, first, last)
+            self.section_counts[section_id] = last - first
+            self.difficulty_histograms[section_id] = Counter(
+                self._difficulties[level]
+                for level in self._difficulty[first:last])
+            self._section_ids.append((first, section_id))
+        self.problems = _ProblemsByNumber(self)
+
+    def _problem(self, i):
+        # Раздел задачи - тот, в чей отрезок попадает позиция
+        j = bisect_left(self._section_ids, (i + 1,)) - 1
+        return CatalogProblem(
+            self._numbers[i], self._section_ids[j][1], self._string(2 * i),
+            self._difficulties[self._difficulty[i]], self._string(2 * i + 1))
+
+    def _string(self, k):
+        start, stop = self._text_offsets[k], self._text_offsets[k + 1]
+        return str(self._texts[start:stop], 'utf-8')
+
+    @classmethod
+    def publish(cls, catalog):
+        """Создает блок разделяемой памяти с каталогом.
+
+        Блок принадлежит вызывающему: после остановки рабочих процессов
+        его нужно закрыть и удалить (close() и unlink()).
+        """
+        data = encode_catalog(catalog)
+        shm = shared_memory.SharedMemory(create=True, size=len(data))
+        shm.buf[:len(data)] = data
+        return shm
+
+    @classmethod
+    def attach(cls, name):
+        """Подключается к блоку, созданному publish() в другом процессе"""
+        # Рабочие процессы, запущенные через multiprocessing, используют
+        # трекер ресурсов основного процесса, и блок удаляет только он
+        return cls(shared_memory.SharedMemory(name=name))
+
+    def close(self):
+        """Отключается от блока разделяемой памяти"""
+        for view in (self._numbers, self._sorted_numbers, self._by_number,
+                     self._text_offsets, self._difficulty, self._texts):
+            view.release()
+        self._shm.close()
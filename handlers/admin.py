@@ -1,11 +1,14 @@
+import functools
+
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler
 from datetime import datetime, timedelta
 
 from config.settings import Config
-from database.models import MathProblemsDB
-
-db = MathProblemsDB()
+from utils.services import get_services
+from handlers.callbacks import callback_route
+from database.exams import build_exam_sequence
+from database.models import utc_today
 
 
 def is_admin(user_id):
@@ -13,6 +16,21 @@ def is_admin(user_id):
     return user_id in Config.ADMIN_IDS
 
 
+def admin_only(handler):
+    """Пропускает к callback-обработчику только администраторов"""
+    @functools.wraps(handler)
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE,
+                      *args):
+        if not is_admin(update.effective_user.id):
+            await update.callback_query.edit_message_text(
+                "❌ У вас нет прав для доступа к админ-панели")
+            return ConversationHandler.END
+        return await handler(update, context, *args)
+
+    return wrapper
+
+
+@callback_route("admin_panel")
 async def admin_panel(update: Update,
                       context: ContextTypes.DEFAULT_TYPE) -> None:
     """Показывает админ-панель"""
@@ -36,6 +54,10 @@ async def admin_panel(update: Update,
 • Удаление попыток за конкретную дату
 • Удаление попыток по конкретным задачам
 
+📝 **Экзамен для класса:**
+• /exam_start [N] [shuffle] - начать экзамен из N задач
+• /exam_stop - завершить экзамен и показать результаты
+
 Выберите действие:
     """
 
@@ -55,11 +77,15 @@ async def admin_panel(update: Update,
     await update.message.reply_text(admin_text, reply_markup=reply_markup)
 
 
+@callback_route("admin_all_users")
+@admin_only
 async def show_all_users(update: Update,
                          context: ContextTypes.DEFAULT_TYPE) -> None:
     """Показывает список всех пользователей"""
+    services = get_services(context)
+    db = services.db
     query = update.callback_query
-    users = db.get_all_users_stats(limit=50)
+    users = await services.run(db.get_all_users_stats, limit=50)
 
     if not users:
         await query.edit_message_text("📭 В базе нет пользователей")
@@ -89,11 +115,16 @@ async def show_all_users(update: Update,
     await query.edit_message_text(users_text, reply_markup=reply_markup)
 
 
+@callback_route("admin_user_stats")
+@callback_route("admin_date_stats")
+@admin_only
 async def select_user_for_stats(update: Update,
                                 context: ContextTypes.DEFAULT_TYPE) -> int:
     """Запрашивает выбор пользователя для детальной статистики"""
+    services = get_services(context)
+    db = services.db
     query = update.callback_query
-    users = db.get_all_users_stats(limit=20)
+    users = await services.run(db.get_all_users_stats, limit=20)
 
     if not users:
         await query.edit_message_text("📭 В базе нет пользователей")
@@ -119,13 +150,17 @@ async def select_user_for_stats(update: Update,
     return Config.WAITING_FOR_USER_SELECTION
 
 
+@callback_route("admin_user_detail_", params=(int,))
+@admin_only
 async def show_user_detailed_stats(update: Update,
-                                   context: ContextTypes.DEFAULT_TYPE) -> None:
+                                   context: ContextTypes.DEFAULT_TYPE,
+                                   user_id: int) -> None:
     """Показывает детальную статистику пользователя"""
+    services = get_services(context)
+    db = services.db
     query = update.callback_query
-    user_id = int(query.data.split('_')[3])
 
-    stats = db.get_user_detailed_stats(user_id)
+    stats = await services.run(db.get_user_detailed_stats, user_id)
 
     if not stats:
         await query.edit_message_text("❌ Статистика пользователя не найдена")
@@ -146,11 +181,12 @@ async def show_user_detailed_stats(update: Update,
 • Зарегистрирован: {user_info['created_at'][:16]}
 • Последняя активность: {user_info['last_activity'][:16]}
 
-**Активность за последние 7 дней:**
+**Активность за последние 7 дней (UTC):**
 """
 
-    # Активность за последние 7 дней
-    today = datetime.now().date()
+    # Активность за последние 7 дней: дни в базе считаются по UTC,
+    # и подписи должны быть по тем же часам
+    today = utc_today()
     for i in range(7):
         date = today - timedelta(days=i)
         date_str = date.strftime('%Y-%m-%d')
@@ -182,12 +218,16 @@ async def show_user_detailed_stats(update: Update,
     await query.edit_message_text(stats_text, reply_markup=reply_markup)
 
 
+@callback_route("admin_user_date_", params=(int,))
+@admin_only
 async def request_date_for_stats(update: Update,
-                                 context: ContextTypes.DEFAULT_TYPE) -> int:
+                                 context: ContextTypes.DEFAULT_TYPE,
+                                 user_id: int) -> int:
     """Запрашивает дату для просмотра статистики"""
     query = update.callback_query
-    user_id = int(query.data.split('_')[3])
     context.user_data['admin_selected_user'] = user_id
+    # Дата пойдет в просмотр статистики, а не в незавершенную очистку
+    context.user_data.pop('admin_clear_type', None)
 
     await query.edit_message_text(
         "📅 Введите дату в формате ГГГГ-ММ-ДД (например, 2024-01-15):\n"
@@ -200,6 +240,8 @@ async def request_date_for_stats(update: Update,
 async def show_user_stats_by_date(update: Update,
                                   context: ContextTypes.DEFAULT_TYPE) -> int:
     """Показывает статистику пользователя за конкретную дату"""
+    services = get_services(context)
+    db = services.db
     user_id = context.user_data.get('admin_selected_user')
     date_input = update.message.text.strip()
 
@@ -225,8 +267,9 @@ async def show_user_stats_by_date(update: Update,
         return await confirm_clear_by_date(update, context)
 
     # Получаем статистику для отображения
-    attempts = db.get_user_attempts_by_date(user_id, date)
-    user_stats = db.get_user_detailed_stats(user_id)
+    attempts = await services.run(db.get_user_attempts_by_date, user_id,
+                                  date)
+    user_stats = await services.run(db.get_user_detailed_stats, user_id)
 
     if not user_stats:
         await update.message.reply_text("❌ Пользователь не найден")
@@ -271,11 +314,15 @@ async def show_user_stats_by_date(update: Update,
     return ConversationHandler.END
 
 
+@callback_route("admin_clear_stats")
+@admin_only
 async def select_user_for_clearing(update: Update,
                                    context: ContextTypes.DEFAULT_TYPE) -> int:
     """Запрашивает выбор пользователя для очистки статистики"""
+    services = get_services(context)
+    db = services.db
     query = update.callback_query
-    users = db.get_all_users_stats(limit=20)
+    users = await services.run(db.get_all_users_stats, limit=20)
 
     if not users:
         await query.edit_message_text("📭 В базе нет пользователей")
@@ -301,14 +348,19 @@ async def select_user_for_clearing(update: Update,
     return Config.WAITING_FOR_USER_SELECTION
 
 
+@callback_route("admin_clear_select_", params=(int,))
+@callback_route("admin_clear_user_", params=(int,))
+@admin_only
 async def show_clear_options(update: Update,
-                             context: ContextTypes.DEFAULT_TYPE) -> None:
+                             context: ContextTypes.DEFAULT_TYPE,
+                             user_id: int) -> None:
     """Показывает опции очистки статистики"""
+    services = get_services(context)
+    db = services.db
     query = update.callback_query
-    user_id = int(query.data.split('_')[3])
     context.user_data['admin_clear_user'] = user_id
 
-    user_stats = db.get_user_detailed_stats(user_id)
+    user_stats = await services.run(db.get_user_detailed_stats, user_id)
     if not user_stats:
         await query.edit_message_text("❌ Пользователь не найден")
         return
@@ -344,15 +396,19 @@ ID: {user_id}
     await query.edit_message_text(clear_text, reply_markup=reply_markup)
 
 
+@callback_route("admin_clear_all_", params=(int,))
+@admin_only
 async def confirm_clear_all(update: Update,
-                            context: ContextTypes.DEFAULT_TYPE) -> None:
+                            context: ContextTypes.DEFAULT_TYPE,
+                            user_id: int) -> None:
     """Запрашивает подтверждение очистки всей статистики"""
+    services = get_services(context)
+    db = services.db
     query = update.callback_query
-    user_id = int(query.data.split('_')[3])
     context.user_data['admin_clear_user'] = user_id
     context.user_data['admin_clear_type'] = 'all'
 
-    user_stats = db.get_user_detailed_stats(user_id)
+    user_stats = await services.run(db.get_user_detailed_stats, user_id)
     user_info = user_stats['user_info']
     display_name = user_info['first_name'] or user_info[
         'username'] or f"User {user_id}"
@@ -384,11 +440,13 @@ async def confirm_clear_all(update: Update,
     await query.edit_message_text(confirm_text, reply_markup=reply_markup)
 
 
+@callback_route("admin_clear_date_", params=(int,))
+@admin_only
 async def request_date_for_clearing(update: Update,
-                                    context: ContextTypes.DEFAULT_TYPE) -> int:
+                                    context: ContextTypes.DEFAULT_TYPE,
+                                    user_id: int) -> int:
     """Запрашивает дату для очистки статистики"""
     query = update.callback_query
-    user_id = int(query.data.split('_')[3])
     context.user_data['admin_clear_user'] = user_id
     context.user_data['admin_clear_type'] = 'date'
 
@@ -403,6 +461,8 @@ async def request_date_for_clearing(update: Update,
 async def confirm_clear_by_date(update: Update,
                                 context: ContextTypes.DEFAULT_TYPE) -> int:
     """Подтверждает очистку статистики за дату"""
+    services = get_services(context)
+    db = services.db
     date_input = update.message.text.strip()
     user_id = context.user_data.get('admin_clear_user')
 
@@ -416,8 +476,9 @@ async def confirm_clear_by_date(update: Update,
         return Config.WAITING_FOR_DATE
 
     # Получаем количество попыток за эту дату
-    attempts = db.get_user_attempts_by_date(user_id, date)
-    user_stats = db.get_user_detailed_stats(user_id)
+    attempts_count = await services.run(db.count_user_attempts_by_date,
+                                        user_id, date)
+    user_stats = await services.run(db.get_user_detailed_stats, user_id)
     user_info = user_stats['user_info']
     display_name = user_info['first_name'] or user_info[
         'username'] or f"User {user_id}"
@@ -429,7 +490,7 @@ async def confirm_clear_by_date(update: Update,
 **{display_name}** (ID: {user_id})
 
 📅 За дату: {date}
-📊 Будет удалено: {len(attempts)} попыток
+📊 Будет удалено: {attempts_count} попыток
 
 ❌ **Это действие нельзя отменить!**
 
@@ -450,28 +511,39 @@ async def confirm_clear_by_date(update: Update,
     return ConversationHandler.END
 
 
+@callback_route("admin_confirm_clear")
+@admin_only
 async def execute_clear(update: Update,
                         context: ContextTypes.DEFAULT_TYPE) -> None:
     """Выполняет очистку статистики"""
+    services = get_services(context)
+    db = services.db
     query = update.callback_query
     user_id = context.user_data.get('admin_clear_user')
     clear_type = context.user_data.get('admin_clear_type')
     date = context.user_data.get('admin_clear_date')
 
-    user_stats = db.get_user_detailed_stats(user_id)
+    user_stats = await services.run(db.get_user_detailed_stats, user_id)
     user_info = user_stats['user_info']
     display_name = user_info['first_name'] or user_info[
         'username'] or f"User {user_id}"
 
     if clear_type == 'all':
-        deleted_count = db.delete_user_attempts(user_id)
+        deleted_count = await services.run(db.delete_user_attempts, user_id)
         result_text = f"✅ Вся статистика пользователя **{display_name}** удалена!\nУдалено записей: {deleted_count}"
     elif clear_type == 'date' and date:
-        deleted_count = db.delete_user_attempts(user_id, date=date)
+        deleted_count = await services.run(db.delete_user_attempts, user_id,
+                                           date=date)
         result_text = f"✅ Статистика пользователя **{display_name}** за {date} удалена!\nУдалено записей: {deleted_count}"
     else:
         result_text = "❌ Ошибка при очистке статистики"
 
+    if clear_type in ('all', 'date'):
+        # Прогресс пересчитается по оставшимся попыткам; остальные
+        # процессы заметят сброс по версиям в базе
+        await services.run(services.progress.forget, user_id)
+        await services.run(services.reload_adaptive)
+
     keyboard = [
         [InlineKeyboardButton("🔙 Админ-панель", callback_data="admin_panel")],
         [InlineKeyboardButton("🗑️ Ещё очистка",
@@ -492,3 +564,123 @@ async def cancel_admin(update: Update,
     """Отменяет админ-действие"""
     await update.message.reply_text("❌ Действие отменено")
     return ConversationHandler.END
+
+
+async def slow_queries(update: Update,
+                       context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Показывает самые затратные SQL-запросы: /slow_queries [N] [total|max|count|slow]"""
+    if not is_admin(update.effective_user.id):
+        await update.message.reply_text(
+            "❌ У вас нет прав для выполнения этой команды")
+        return
+
+    profiler = get_services(context).db.profiler
+    if profiler is None:
+        await update.message.reply_text(
+            "ℹ️ Профилирование запросов выключено (SQL_PROFILING=1)")
+        return
+
+    args = context.args or []
+    limit = int(args[0]) if args and args[0].isdigit() else 10
+    key = args[1] if len(args) > 1 and args[1] in (
+        'total', 'max', 'count', 'slow') else 'total'
+
+    top = profiler.top(limit, key=key)
+    if not top:
+        await update.message.reply_text("📭 Запросов пока не было")
+        return
+
+    text = f"🐢 Топ-{len(top)} запросов по {key}:\n\n"
+    for i, item in enumerate(top, 1):
+        text += (f"{i}. {item['total_ms']:.1f} мс всего, "
+                 f"{item['avg_ms']:.2f} мс в среднем, "
+                 f"макс {item['max_ms']:.1f} мс, "
+                 f"{item['count']} раз, медленных {item['slow']}\n"
+                 f"{item['sql'][:200]}\n")
+        if item['plan']:
+            text += f"План: {'; '.join(item['plan'])}\n"
+        text += "\n"
+
+    if Config.WORKERS > 1:
+        # Профилировщик у каждого процесса свой, а сообщения админа
+        # всегда обрабатывает один и тот же процесс
+        note = (f"ℹ️ Показаны запросы только одного из {Config.WORKERS} "
+                f"рабочих процессов - того, который обрабатывает ваши "
+                f"сообщения. Медленные запросы всех процессов пишутся в "
+                f"лог database.slow_queries.")
+        text = text[:4000 - len(note) - 2] + "\n\n" + note
+
+    # Ограничение Telegram на длину сообщения
+    await update.message.reply_text(text[:4000])
+
+
+async def exam_start(update: Update,
+                     context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Запускает экзамен для класса: /exam_start [N] [shuffle]"""
+    if not is_admin(update.effective_user.id):
+        await update.message.reply_text(
+            "❌ У вас нет прав для выполнения этой команды")
+        return
+
+    args = context.args or []
+    count = int(args[0]) if args and args[0].isdigit() else 10
+    shuffle = 'shuffle' in args[1:]
+
+    services = get_services(context)
+    problem_numbers = build_exam_sequence(services.adaptive.difficulties,
+                                          count)
+    if not problem_numbers:
+        await update.message.reply_text("❌ В базе нет задач для экзамена")
+        return
+
+    session = await services.run(services.exams.start, problem_numbers,
+                                 shuffle=shuffle)
+    if session is None:
+        await update.message.reply_text(
+            "⚠️ Экзамен уже идет. Завершите его командой /exam_stop")
+        return
+
+    order = "в своем порядке у каждого ученика" if shuffle else \
+        "в одном порядке для всех"
+    await update.message.reply_text(
+        f"📝 Экзамен №{session.id} начат: {len(problem_numbers)} задач, "
+        f"{order}.\n\n"
+        f"Ученики получают задачи экзамена в тестовом режиме (/test).\n"
+        f"Завершить экзамен: /exam_stop")
+
+
+async def exam_stop(update: Update,
+                    context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Завершает экзамен и показывает результаты класса"""
+    if not is_admin(update.effective_user.id):
+        await update.message.reply_text(
+            "❌ У вас нет прав для выполнения этой команды")
+        return
+
+    services = get_services(context)
+    results = await services.run(services.exams.finish)
+    if results is None:
+        await update.message.reply_text("ℹ️ Сейчас экзамен не идет")
+        return
+
+    session = results.session
+    total = len(session.problems)
+    text = (f"📊 **Результаты экзамена №{session.id}**\n"
+            f"Участников: {len(results.pupils)}, задач: {total}\n\n")
+
+    for i, pupil in enumerate(results.pupils, 1):
+        name = pupil['first_name'] or pupil['username'] or \
+            f"ID {pupil['user_id']}"
+        text += (f"{i}. {name}: {pupil['solved']} из {total} "
+                 f"(ответов {pupil['answered']}, "
+                 f"попыток {pupil['attempts']})\n")
+
+    text += "\n**По задачам:**\n"
+    for problem_number in session.problems:
+        answered, solved = results.problems[problem_number]
+        rate = solved / answered * 100 if answered else 0
+        text += (f"• Задача {problem_number}: решили {solved} из "
+                 f"{answered} ({rate:.0f}%)\n")
+
+    # Ограничение Telegram на длину сообщения
+    await update.message.reply_text(text[:4000])
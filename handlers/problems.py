@@ -3,10 +3,8 @@ import re
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler
 from config.settings import Config
-from database.models import MathProblemsDB
-
-# Инициализация базы данных
-db = MathProblemsDB(Config.DB_PATH)
+from utils.services import get_services
+from handlers.callbacks import callback_route
 
 
 def extract_number_from_text(text):
@@ -168,11 +166,13 @@ def check_answer(user_answer, correct_answer):
     return False, f"❌ Неправильно. Ваш ответ: {user_answer}"
 
 
+@callback_route("sections")
 async def sections(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показывает все разделы с задачами"""
-    sections_data = db.get_all_sections()
+    services = get_services(context)
+    catalog = services.catalog
 
-    if not sections_data:
+    if not catalog.sections:
         error_text = "❌ Разделы с задачами не найдены."
         if update.callback_query:
             await update.callback_query.edit_message_text(error_text)
@@ -180,9 +180,14 @@ async def sections(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text(error_text)
         return
 
+    # Количество задач посчитано при загрузке каталога, решенные задачи
+    # пользователя берутся из кэша - агрегирующих запросов к базе нет
+    solved_counts = await services.run(
+        services.progress.section_solved_counts, update.effective_user.id)
+
     keyboard = []
-    for section in sections_data:
-        section_id, section_name, problem_count = section
+    for section_id, (section_name, _) in catalog.sections.items():
+        problem_count = catalog.section_counts[section_id]
         button_text = f"{section_name} ({problem_count} задач)"
         keyboard.append([InlineKeyboardButton(button_text,
                                               callback_data=f"section_{section_id}")])
@@ -201,9 +206,12 @@ async def sections(update: Update, context: ContextTypes.DEFAULT_TYPE):
     reply_markup = InlineKeyboardMarkup(keyboard)
 
     text = "📂 **Выберите раздел:**\n\n"
-    for section in sections_data:
-        section_id, section_name, problem_count = section
-        text += f"• {section_name} - {problem_count} задач\n"
+    for section_id, (section_name, _) in catalog.sections.items():
+        problem_count = catalog.section_counts[section_id]
+        solved = solved_counts.get(section_id, 0)
+        percent = solved * 100 // problem_count if problem_count else 0
+        text += (f"• {section_name} - {problem_count} задач "
+                 f"(решено {solved}, {percent}%)\n")
 
     if update.callback_query:
         await update.callback_query.edit_message_text(text,
@@ -212,51 +220,35 @@ async def sections(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(text, reply_markup=reply_markup)
 
 
-async def show_section_problems(update: Update,
-                                context: ContextTypes.DEFAULT_TYPE,
-                                section_id: int):
-    """Показывает задачи в выбранном разделе"""
-    problems = db.get_problems_by_section(section_id)
-
-    # Получаем название раздела
-    section_name = "Неизвестный раздел"
-    if problems:
-        _, _, _, section_name_from_problem = problems[0]
-        section_name = section_name_from_problem
-    else:
-        sections_data = db.get_all_sections()
-        for section in sections_data:
-            if section[0] == section_id:
-                section_name = section[1]
-                break
-
-    if not problems:
-        keyboard = [
-            [InlineKeyboardButton("🔙 Назад к разделам",
-                                  callback_data="sections")],
-            [InlineKeyboardButton("🏠 Главное меню", callback_data="main_menu")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await update.callback_query.edit_message_text(
-            f"❌ В разделе '{section_name}' нет задач.",
-            reply_markup=reply_markup
-        )
-        return
+def _section_page_keyboard(services, section_page):
+    """Клавиатура страницы раздела (строится один раз на каталог)"""
+    key = ('section', section_page.section_id, section_page.page)
+    reply_markup = services.keyboards.get(key)
+    if reply_markup is not None:
+        return reply_markup
 
     keyboard = []
-    for problem in problems:
-        problem_number, problem_text, correct_answer, _ = problem
-
-        # 🔧 ИСПРАВЛЕНИЕ: приведение типов
-        problem_text = str(problem_text)
-
+    for problem in section_page.problems:
         # Обрезаем длинный текст задачи для кнопки
-        button_text = f"Задача {problem_number}"
-        if len(problem_text) > 30:
-            button_text = f"Задача {problem_number}: {problem_text[:30]}..."
-
-        keyboard.append([InlineKeyboardButton(button_text,
-                                              callback_data=f"problem_{problem_number}")])
+        button_text = f"Задача {problem.problem_number}"
+        if len(problem.problem_text) > 30:
+            button_text = (f"Задача {problem.problem_number}: "
+                           f"{problem.problem_text[:30]}...")
+
+        keyboard.append([InlineKeyboardButton(
+            button_text, callback_data=f"problem_{problem.problem_number}")])
+
+    # Переход между страницами: номер страницы передается в callback data
+    section_id, page = section_page.section_id, section_page.page
+    navigation = []
+    if page > 0:
+        navigation.append(InlineKeyboardButton(
+            "⬅️ Назад", callback_data=f"section_{section_id}_{page - 1}"))
+    if page < section_page.page_count - 1:
+        navigation.append(InlineKeyboardButton(
+            "Вперед ➡️", callback_data=f"section_{section_id}_{page + 1}"))
+    if navigation:
+        keyboard.append(navigation)
 
     # Добавляем кнопки навигации
     keyboard.append([
@@ -270,19 +262,58 @@ async def show_section_problems(update: Update,
     ])
 
     reply_markup = InlineKeyboardMarkup(keyboard)
+    services.keyboards[key] = reply_markup
+    return reply_markup
+
+
+# Кнопки списка разделов передают только id раздела (первая страница)
+@callback_route("section_", params=(int, int), required=1)
+async def show_section_problems(update: Update,
+                                context: ContextTypes.DEFAULT_TYPE,
+                                section_id: int, page: int = 0):
+    """Показывает страницу задач выбранного раздела"""
+    services = get_services(context)
+    section_page = services.catalog.get_page(section_id, page,
+                                             Config.SECTION_PAGE_SIZE)
+
+    if not section_page.problems:
+        keyboard = [
+            [InlineKeyboardButton("🔙 Назад к разделам",
+                                  callback_data="sections")],
+            [InlineKeyboardButton("🏠 Главное меню", callback_data="main_menu")]
+        ]
+        reply_markup = InlineKeyboardMarkup(keyboard)
+        await update.callback_query.edit_message_text(
+            f"❌ В разделе '{section_page.section_name}' нет задач.",
+            reply_markup=reply_markup
+        )
+        return
 
-    text = f"📂 **Раздел: {section_name}**\n\n"
-    text += f"**Доступно задач: {len(problems)}**\n\n"
-    text += "Выберите задачу:"
+    reply_markup = _section_page_keyboard(services, section_page)
+
+    text = f"📂 **Раздел: {section_page.section_name}**\n\n"
+    text += f"**Доступно задач: {section_page.total}**\n"
+    histogram = services.catalog.difficulty_histograms.get(section_id)
+    if histogram:
+        text += "Сложность: " + ", ".join(
+            f"{level} - {count}" for level, count in sorted(histogram.items()))
+        text += "\n"
+    if section_page.page_count > 1:
+        text += (f"Страница {section_page.page + 1} "
+                 f"из {section_page.page_count}\n")
+    text += "\nВыберите задачу:"
 
     await update.callback_query.edit_message_text(text,
                                                   reply_markup=reply_markup)
 
 
+@callback_route("problem_", params=(str,))
 async def show_problem(update: Update, context: ContextTypes.DEFAULT_TYPE,
                        problem_number: str):
     """Показывает конкретную задачу"""
-    problem = db.get_problem_by_number(problem_number)
+    services = get_services(context)
+    problem = await services.run(services.db.get_problem_by_number,
+                                 problem_number)
 
     if not problem:
         keyboard = [
@@ -320,9 +351,21 @@ async def show_problem(update: Update, context: ContextTypes.DEFAULT_TYPE,
                                                   reply_markup=reply_markup)
 
 
+@callback_route("random_problem")
+@callback_route("random")
 async def random_problem(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показывает случайную задачу"""
-    problem = db.get_random_problem()
+    services = get_services(context)
+
+    # Сначала предлагаем задачи, которые пользователь еще не решил
+    problem = None
+    problem_number = await services.run(services.progress.random_unsolved,
+                                        update.effective_user.id)
+    if problem_number is not None:
+        problem = await services.run(services.db.get_problem_by_number,
+                                     problem_number)
+    if not problem:
+        problem = await services.run(services.db.get_random_problem)
 
     if not problem:
         error_text = "❌ Не удалось найти задачу. База данных пуста."
@@ -405,24 +448,9 @@ async def handle_random_answer(update: Update,
     # Проверяем ответ
     is_correct, message = check_answer(user_answer, correct_answer)
 
-    # Сохраняем попытку в базу данных
-    db_attempt_number = db.add_user_attempt(
-        user.id,
-        problem_number,
-        user_answer,
-        correct_answer,
-        is_correct
-    )
-
-    # Обновляем статистику пользователя
-    db.update_user_stats(
-        user.id,
-        user.username,
-        user.first_name,
-        user.last_name,
-        is_correct,
-        problem_number
-    )
+    # Сохраняем попытку, статистику и прогресс пользователя
+    db_attempt_number = await get_services(context).record_attempt(
+        user, problem_number, user_answer, correct_answer, is_correct)
 
     if is_correct:
         message_text = f"""
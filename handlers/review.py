@@ -0,0 +1,161 @@
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.ext import ContextTypes, ConversationHandler
+from config.settings import Config
+from utils.services import get_services
+from handlers.callbacks import callback_route
+
+# Импортируем функцию проверки ответов из problems.py
+from handlers.problems import check_answer
+
+MAX_REVIEW_ATTEMPTS = 3
+
+
+def _finish_review_problem(context):
+    context.user_data.pop('current_review_problem', None)
+    context.user_data.pop('review_attempts', None)
+
+
+def _next_keyboard():
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton("🔁 Следующая задача", callback_data="review")],
+        [InlineKeyboardButton("📊 Моя статистика", callback_data="stats")],
+        [InlineKeyboardButton("🏠 Главное меню", callback_data="main_menu")]
+    ])
+
+
+@callback_route("review")
+async def review(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Показывает следующую задачу, которую пора повторить"""
+    services = get_services(context)
+    user_id = update.effective_user.id
+
+    problem = None
+    problem_number = await services.run(services.reviews.next_due, user_id)
+    if problem_number is not None:
+        problem = await services.run(services.db.get_problem_by_number,
+                                     problem_number)
+
+    if not problem:
+        text = ("🎉 На сегодня повторять нечего!\n\n"
+                "Решайте новые задачи - они появятся в повторении "
+                "через несколько дней.")
+        keyboard = [
+            [InlineKeyboardButton("🎲 Случайная задача",
+                                  callback_data="random_problem")],
+            [InlineKeyboardButton("🏠 Главное меню", callback_data="main_menu")]
+        ]
+        reply_markup = InlineKeyboardMarkup(keyboard)
+        if update.callback_query:
+            await update.callback_query.edit_message_text(
+                text, reply_markup=reply_markup)
+        else:
+            await update.message.reply_text(text, reply_markup=reply_markup)
+        return ConversationHandler.END
+
+    problem_number, problem_text, correct_answer, section_name = problem
+    context.user_data['current_review_problem'] = problem
+    context.user_data['review_attempts'] = 0
+
+    due, planned = await services.run(services.reviews.due_counts, user_id)
+    text = "🔁 **Повторение**\n"
+    if planned:
+        text += f"📅 Повторено сегодня: {max(planned - due, 0)} из {planned}\n"
+    else:
+        text += f"📅 Осталось повторить: {due}\n"
+    text += f"\n**Раздел:** {section_name}\n"
+    text += f"**Задача №{problem_number}:**\n{problem_text}\n\n"
+    text += "💡 *Введите ваш ответ:*"
+    text += f"\n\n🔄 *Попыток осталось: {MAX_REVIEW_ATTEMPTS}*"
+
+    keyboard = [
+        [InlineKeyboardButton("🤔 Не помню, показать ответ",
+                              callback_data="review_reveal")],
+        [InlineKeyboardButton("🏠 Главное меню", callback_data="main_menu")]
+    ]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+
+    if update.callback_query:
+        await update.callback_query.edit_message_text(text,
+                                                      reply_markup=reply_markup)
+    else:
+        await update.message.reply_text(text, reply_markup=reply_markup)
+
+    return Config.WAITING_FOR_REVIEW_ANSWER
+
+
+async def handle_review_answer(update: Update,
+                               context: ContextTypes.DEFAULT_TYPE):
+    """Обрабатывает ответ на задачу из повторения"""
+    user_answer = update.message.text.strip()
+    problem = context.user_data.get('current_review_problem')
+
+    if not problem:
+        await update.message.reply_text(
+            "❌ Ошибка: задача не найдена. Начните повторение заново.",
+            reply_markup=_next_keyboard())
+        return ConversationHandler.END
+
+    context.user_data['review_attempts'] = context.user_data.get(
+        'review_attempts', 0) + 1
+    attempts_count = context.user_data['review_attempts']
+
+    problem_number, problem_text, correct_answer, section_name = problem
+    is_correct, message = check_answer(user_answer, correct_answer)
+
+    # Попытка попадает и в статистику, и в расписание повторений
+    await get_services(context).record_attempt(
+        update.effective_user, problem_number, user_answer, correct_answer,
+        is_correct)
+
+    if is_correct:
+        await update.message.reply_text(
+            f"{message}\n\n🎉 Задача №{problem_number} повторена! "
+            f"Следующее повторение будет позже.",
+            reply_markup=_next_keyboard())
+        _finish_review_problem(context)
+        return ConversationHandler.END
+
+    remaining_attempts = MAX_REVIEW_ATTEMPTS - attempts_count
+    if remaining_attempts > 0:
+        keyboard = [
+            [InlineKeyboardButton("🤔 Не помню, показать ответ",
+                                  callback_data="review_reveal")],
+            [InlineKeyboardButton("🏠 Главное меню", callback_data="main_menu")]
+        ]
+        await update.message.reply_text(
+            f"{message}\n\n🔄 Попробуйте еще раз! "
+            f"Осталось попыток: {remaining_attempts}",
+            reply_markup=InlineKeyboardMarkup(keyboard))
+        return Config.WAITING_FOR_REVIEW_ANSWER
+
+    await update.message.reply_text(
+        f"{message}\n\n❌ **Закончились попытки!**\n"
+        f"**Правильный ответ:** {correct_answer}\n\n"
+        f"Задача №{problem_number} вернется к вам завтра.",
+        reply_markup=_next_keyboard())
+    _finish_review_problem(context)
+    return ConversationHandler.END
+
+
+@callback_route("review_reveal")
+async def review_reveal(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Показывает ответ: задача считается забытой и повторяется завтра"""
+    problem = context.user_data.get('current_review_problem')
+    if not problem:
+        await update.callback_query.edit_message_text(
+            "❌ Задача не найдена. Начните повторение заново.",
+            reply_markup=_next_keyboard())
+        return ConversationHandler.END
+
+    problem_number, problem_text, correct_answer, section_name = problem
+    services = get_services(context)
+    await services.run(services.reviews.record, update.effective_user.id,
+                       problem_number, False)
+    _finish_review_problem(context)
+
+    await update.callback_query.edit_message_text(
+        f"🔍 **Ответ к задаче №{problem_number}:** {correct_answer}\n\n"
+        f"**Задача:** {problem_text}\n\n"
+        f"Задача вернется к вам завтра.",
+        reply_markup=_next_keyboard())
+    return ConversationHandler.END
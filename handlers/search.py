@@ -1,12 +1,12 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler
 
-from database.models import MathProblemsDB
+from utils.services import get_services
 from config.settings import Config
-
-db = MathProblemsDB()
+from handlers.callbacks import callback_route
 
 
+@callback_route("search")
 async def search(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     await update.message.reply_text(
         "🔍 Введите ключевое слово для поиска задач:\n"
@@ -15,38 +15,89 @@ async def search(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     return Config.WAITING_FOR_SEARCH
 
 
+def _search_page(services, session, page):
+    """Текст и клавиатура страницы результатов поиска"""
+    page_size = Config.SEARCH_PAGE_SIZE
+    total = len(session.problem_numbers)
+    page_count = max(1, -(-total // page_size))
+    page = min(max(page, 0), page_count - 1)
+    start = page * page_size
+    numbers = session.problem_numbers[start:start + page_size]
+
+    message_text = f"🔍 Найдено задач: {total}\n"
+    if page_count > 1:
+        message_text += f"Страница {page + 1} из {page_count}\n"
+    message_text += "\n"
+
+    keyboard = []
+    for i, problem_number in enumerate(numbers, start + 1):
+        problem = services.catalog.problems.get(problem_number)
+        problem_text = problem.problem_text if problem else ""
+        message_text += f"{i}. Задача {problem_number}: {problem_text[:50]}...\n"
+        keyboard.append([InlineKeyboardButton(
+            f"📝 Задача {problem_number}",
+            callback_data=f"problem_{problem_number}"
+        )])
+
+    # Листание по сохраненному списку, без повторного запроса к базе
+    navigation = []
+    if page > 0:
+        navigation.append(InlineKeyboardButton(
+            "⬅️ Назад",
+            callback_data=f"search_page_{session.session_id}_{page - 1}"))
+    if page < page_count - 1:
+        navigation.append(InlineKeyboardButton(
+            "Вперед ➡️",
+            callback_data=f"search_page_{session.session_id}_{page + 1}"))
+    if navigation:
+        keyboard.append(navigation)
+
+    keyboard.append(
+        [InlineKeyboardButton("🔙 Назад", callback_data="main_menu")])
+
+    return message_text, InlineKeyboardMarkup(keyboard)
+
+
 async def handle_search(update: Update,
                         context: ContextTypes.DEFAULT_TYPE) -> int:
+    services = get_services(context)
     keyword = update.message.text
-    results = db.search_problems(keyword)
+    problem_numbers = await services.run(services.db.search_problem_numbers,
+                                         keyword)
 
-    if not results:
+    if not problem_numbers:
         await update.message.reply_text(
             f"❌ По запросу '{keyword}' ничего не найдено")
     else:
-        # Показываем первые 5 результатов
-        message_text = f"🔍 Найдено задач: {len(results)}\n\n"
-        for i, problem in enumerate(results[:5], 1):
-            message_text += f"{i}. Задача {problem[0]}: {problem[1][:50]}...\n"
+        session = services.search_sessions.create(
+            update.effective_user.id, keyword, problem_numbers)
+        message_text, reply_markup = _search_page(services, session, 0)
+        await update.message.reply_text(message_text,
+                                        reply_markup=reply_markup)
 
-        if len(results) > 5:
-            message_text += f"\n... и еще {len(results) - 5} задач"
+    return ConversationHandler.END
 
-        keyboard = []
-        for problem in results[:10]:  # Ограничиваем 10 кнопками
-            keyboard.append([InlineKeyboardButton(
-                f"📝 Задача {problem[0]}",
-                callback_data=f"problem_{problem[0]}"
-            )])
 
-        keyboard.append(
-            [InlineKeyboardButton("🔙 Назад", callback_data="main_menu")])
+@callback_route("search_page_", params=(int, int))
+async def show_search_page(update: Update,
+                           context: ContextTypes.DEFAULT_TYPE,
+                           session_id: int, page: int = 0) -> None:
+    """Показывает страницу сохраненных результатов поиска"""
+    services = get_services(context)
+    query = update.callback_query
+    session = services.search_sessions.get(update.effective_user.id,
+                                            session_id)
 
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await update.message.reply_text(message_text,
-                                        reply_markup=reply_markup)
+    if session is None:
+        keyboard = [[InlineKeyboardButton("🔙 Назад",
+                                          callback_data="main_menu")]]
+        await query.edit_message_text(
+            "⌛ Результаты поиска устарели. Повторите поиск: /search",
+            reply_markup=InlineKeyboardMarkup(keyboard))
+        return
 
-    return ConversationHandler.END
+    message_text, reply_markup = _search_page(services, session, page)
+    await query.edit_message_text(message_text, reply_markup=reply_markup)
 
 
 async def search_from_callback(update: Update,
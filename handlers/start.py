@@ -1,12 +1,10 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-from database.models import MathProblemsDB
 from config.settings import Config
-
-# Инициализация базы данных
-db = MathProblemsDB(Config.DB_PATH)
+from handlers.callbacks import callback_route
 
 
+@callback_route("main_menu")
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обрабатывает команду /start и показывает главное меню"""
     user = update.effective_user
@@ -22,6 +20,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 • 🎲 Выдавать случайные задачи  
 • 🔍 Искать задачи по ключевым словам
 • 📝 Проверять знания в тестовом режиме
+• 🔁 Напоминать, какие задачи пора повторить
 • 📊 Вести статистику твоих успехов
 
 Выбери действие из меню ниже:
@@ -41,8 +40,11 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
                                  callback_data="test_mode"),
             InlineKeyboardButton("📊 Моя статистика", callback_data="stats")
         ],
-        [InlineKeyboardButton("🏆 Таблица лидеров",
-                              callback_data="leaderboard")],
+        [
+            InlineKeyboardButton("🔁 Повторение", callback_data="review"),
+            InlineKeyboardButton("🏆 Таблица лидеров",
+                                 callback_data="leaderboard")
+        ],
     ]
 
     # Добавляем кнопку админ-панели только для администратора
@@ -80,6 +82,7 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 • /random - Случайная задача
 • /search - Поиск задач
 • /test - Тестовый режим
+• /review - Повторение решенных задач
 • /stats - Ваша статистика
 • /leaderboard - Таблица лидеров
 • /help - Эта справка
@@ -95,6 +98,10 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 • Получайте оценку ваших знаний
 • Можно завершить тест в любой момент
 
+**Повторение:**
+• Решенные задачи возвращаются к вам через растущие промежутки времени
+• Ошибка в задаче - повторение уже на следующий день
+
 📊 **Статистика:**
 Бот ведет учет всех ваших попыток и рассчитывает успеваемость.
 
@@ -1,15 +1,16 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 
-from database.models import MathProblemsDB
-
-db = MathProblemsDB()
+from utils.services import get_services
+from handlers.callbacks import callback_route
 
 
+@callback_route("stats")
 async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Показывает статистику пользователя"""
+    services = get_services(context)
     user = update.effective_user
-    user_stats = db.get_user_stats(user.id)
+    user_stats = await services.run(services.db.get_user_stats, user.id)
 
     if user_stats:
         stats_text = f"""
@@ -60,14 +61,14 @@ async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         await update.message.reply_text(stats_text, reply_markup=reply_markup)
 
 
-# ... остальные функции stats.py без изменений ...
-
-
+@callback_route("attempts_history")
 async def attempts_history(update: Update,
                            context: ContextTypes.DEFAULT_TYPE) -> None:
     """Показывает историю попыток пользователя"""
+    services = get_services(context)
     user = update.effective_user
-    recent_attempts = db.get_user_recent_attempts(user.id, limit=10)
+    recent_attempts = await services.run(
+        services.db.get_user_recent_attempts, user.id, limit=10)
 
     if recent_attempts:
         history_text = f"""
@@ -106,10 +107,12 @@ async def attempts_history(update: Update,
                                         reply_markup=reply_markup)
 
 
+@callback_route("leaderboard")
 async def leaderboard(update: Update,
                       context: ContextTypes.DEFAULT_TYPE) -> None:
     """Показывает таблицу лидеров"""
-    leaders = db.get_leaderboard(10)
+    services = get_services(context)
+    leaders = await services.run(services.db.get_leaderboard, 10)
 
     if leaders:
         leaderboard_text = "🏆 **Таблица лидеров**\n\n"
@@ -2,15 +2,89 @@ import random
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler
 from config.settings import Config
-from database.models import MathProblemsDB
-
-# Инициализация базы данных
-db = MathProblemsDB(Config.DB_PATH)
+from utils.services import get_services
+from handlers.callbacks import callback_route
+from database.adaptive import DEFAULT_ABILITY, update_ability
 
 # Импортируем функцию проверки ответов из problems.py
 from handlers.problems import check_answer, normalize_answer
 
 
+async def next_test_problem(context):
+    """Следующая задача теста около уровня ученика, без повторов в тесте"""
+    services = get_services(context)
+    if 'exam_session' in context.user_data:
+        return await next_exam_problem(context)
+    seen = context.user_data.setdefault('test_seen', set())
+    ability = context.user_data.get('test_ability', DEFAULT_ABILITY)
+
+    problem_number = services.adaptive.pick(ability, exclude=seen)
+    if problem_number is None and seen:
+        # Все задачи уже были в этом тесте - начинаем круг заново
+        seen.clear()
+        problem_number = services.adaptive.pick(ability)
+    if problem_number is None:
+        return None
+    seen.add(problem_number)
+    return services.catalog.get_problem(problem_number)
+
+
+async def next_exam_problem(context):
+    """Следующая задача экзамена по порядку ученика или None.
+
+    None и в случае, если экзамен уже завершен учителем.
+    """
+    services = get_services(context)
+    session = await services.run(services.exams.active)
+    if session is None or session.id != context.user_data['exam_session']:
+        return None
+    position = context.user_data['exam_position']
+    order = context.user_data['exam_order']
+    if position >= len(order):
+        return None
+    context.user_data['exam_position'] = position + 1
+    # Задачи экзамена составлены заранее и все есть в каталоге
+    return services.catalog.get_problem(session.problems[order[position]])
+
+
+async def record_test_result(context, user_id, problem_number, attempts,
+                             is_correct):
+    """Учитывает итог задачи теста: уровень ученика и ответ на экзамене"""
+    services = get_services(context)
+    session_id = context.user_data.get('exam_session')
+    # Ответы на уже завершенный экзамен ExamStore.record не записывает
+    if session_id is not None:
+        await services.run(services.exams.record, session_id, user_id,
+                           context.user_data['exam_position'] - 1,
+                           problem_number, attempts, is_correct)
+
+    difficulty = services.adaptive.difficulties.get(problem_number)
+    if difficulty is None:
+        return
+    # С первой попытки уровень растет сильнее
+    score = 1 / attempts if is_correct else 0
+    context.user_data['test_ability'] = update_ability(
+        context.user_data.get('test_ability', DEFAULT_ABILITY), difficulty,
+        score)
+
+
+def _next_keyboard():
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton("⏭️ Следующая задача",
+                              callback_data="test_next")],
+        [InlineKeyboardButton("🔚 Завершить тест",
+                              callback_data="test_stop")]
+    ])
+
+
+def _clear_test(context):
+    for key in ('test_score', 'test_attempts', 'current_test_problem',
+                'current_problem_number', 'test_seen', 'exam_session',
+                'exam_order', 'exam_position'):
+        context.user_data.pop(key, None)
+
+
+@callback_route("test_mode")
 async def test_mode(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Начинает тестовый режим"""
     # Инициализируем статистику теста
@@ -21,12 +95,32 @@ async def test_mode(update: Update, context: ContextTypes.DEFAULT_TYPE):
     }
     context.user_data['test_attempts'] = {}  # Счетчик попыток по задачам
     context.user_data['current_test_problem'] = None
+    # Задачи этого теста; уровень ученика (test_ability) сохраняется
+    # между тестами
+    context.user_data['test_seen'] = set()
+
+    # Во время экзамена все ученики получают задачи экзамена; ученик,
+    # вернувшийся в тест, продолжает с того места, где остановился
+    services = get_services(context)
+    session = await services.run(services.exams.active)
+    if session is not None:
+        user_id = update.effective_user.id
+        context.user_data['exam_session'] = session.id
+        context.user_data['exam_order'] = session.order_for(user_id)
+        context.user_data['exam_position'] = await services.run(
+            services.exams.resume_position, session.id, user_id)
+    else:
+        for key in ('exam_session', 'exam_order', 'exam_position'):
+            context.user_data.pop(key, None)
 
-    # Получаем случайную задачу для начала теста
-    problem = db.get_random_problem()
+    # Первая задача - по уровню ученика или следующая задача экзамена
+    problem = await next_test_problem(context)
 
     if not problem:
         error_text = "❌ Не удалось найти задачу для теста. База данных пуста."
+        if session is not None:
+            error_text = "✅ Вы уже ответили на все задачи экзамена."
+            _clear_test(context)
         if update.callback_query:
             await update.callback_query.edit_message_text(error_text)
         else:
@@ -55,6 +149,10 @@ async def show_test_problem(update: Update, context: ContextTypes.DEFAULT_TYPE,
     remaining_attempts = max_attempts - attempts_count
 
     text = f"📝 **Тестовый режим**\n\n"
+    order = context.user_data.get('exam_order')
+    if order is not None:
+        text = (f"📝 **Экзамен:** задача {context.user_data['exam_position']}"
+                f" из {len(order)}\n\n")
     text += f"**Раздел:** {section_name}\n"
     text += f"**Задача №{problem_number}:**\n{problem_text}\n\n"
     text += f"🔄 *Попыток осталось: {remaining_attempts}*"
@@ -79,6 +177,13 @@ async def handle_test_answer(update: Update,
     problem = context.user_data.get('current_test_problem')
 
     if not problem:
+        if 'test_score' in context.user_data:
+            # Задача уже решена или попытки закончились - новые ответы
+            # не засчитываются до перехода к следующей задаче
+            await update.message.reply_text(
+                "ℹ️ Эта задача уже завершена. Перейдите к следующей "
+                "задаче или завершите тест.", reply_markup=_next_keyboard())
+            return Config.WAITING_FOR_TEST_ANSWER
         await update.message.reply_text("❌ Ошибка: задача не найдена.")
         return ConversationHandler.END
 
@@ -93,27 +198,14 @@ async def handle_test_answer(update: Update,
     # Проверяем ответ
     is_correct, message = check_answer(user_answer, correct_answer)
 
-    # Сохраняем попытку в базу данных
-    db_attempt_number = db.add_user_attempt(
-        user.id,
-        problem_number,
-        user_answer,
-        correct_answer,
-        is_correct
-    )
-
-    # Обновляем статистику пользователя
-    db.update_user_stats(
-        user.id,
-        user.username,
-        user.first_name,
-        user.last_name,
-        is_correct,
-        problem_number
-    )
+    # Сохраняем попытку, статистику и прогресс пользователя
+    db_attempt_number = await get_services(context).record_attempt(
+        user, problem_number, user_answer, correct_answer, is_correct)
 
     if is_correct:
-        # Правильный ответ
+        context.user_data.pop('current_test_problem', None)
+        await record_test_result(context, user.id, problem_number,
+                                 attempts_count, True)
         context.user_data['test_score']['total'] += 1
         context.user_data['test_score']['correct'] += 1
         context.user_data['test_score']['problems_solved'] += 1
@@ -135,16 +227,8 @@ async def handle_test_answer(update: Update,
 Выберите действие:
         """
 
-        keyboard = [
-            [InlineKeyboardButton("⏭️ Следующая задача",
-                                  callback_data="test_next")],
-            [InlineKeyboardButton("🔚 Завершить тест",
-                                  callback_data="test_stop")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-
         await update.message.reply_text(message_text,
-                                        reply_markup=reply_markup)
+                                        reply_markup=_next_keyboard())
         return Config.WAITING_FOR_TEST_ANSWER
 
     else:
@@ -167,6 +251,9 @@ async def handle_test_answer(update: Update,
 
         else:
             # Закончились попытки
+            context.user_data.pop('current_test_problem', None)
+            await record_test_result(context, user.id, problem_number,
+                                     attempts_count, False)
             context.user_data['test_score']['total'] += 1
 
             score = context.user_data['test_score']
@@ -187,39 +274,35 @@ async def handle_test_answer(update: Update,
 Выберите действие:
             """
 
-            keyboard = [
-                [InlineKeyboardButton("⏭️ Следующая задача",
-                                      callback_data="test_next")],
-                [InlineKeyboardButton("🔚 Завершить тест",
-                                      callback_data="test_stop")]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-
             await update.message.reply_text(message_text,
-                                            reply_markup=reply_markup)
+                                            reply_markup=_next_keyboard())
             return Config.WAITING_FOR_TEST_ANSWER
 
 
+@callback_route("test_next")
+@callback_route("test_stop")
 async def handle_test_callback(update: Update,
                                context: ContextTypes.DEFAULT_TYPE):
     """Обрабатывает callback от кнопок в тестовом режиме"""
+    # На callback уже ответил диспетчер маршрутов
     query = update.callback_query
-    await query.answer()
 
     data = query.data
 
     if data == "test_next":
-        # Получаем следующую случайную задачу
-        problem = db.get_random_problem()
+        # Следующая задача - по уточненному уровню ученика
+        problem = await next_test_problem(context)
         if problem:
             await show_test_problem(update, context, problem)
             return Config.WAITING_FOR_TEST_ANSWER
-        else:
+        elif 'exam_session' not in context.user_data:
             await query.edit_message_text(
                 "❌ Не удалось найти следующую задачу.")
             return ConversationHandler.END
+        # Задачи экзамена закончились (или экзамен завершен) -
+        # показываем результаты, как при завершении теста
 
-    elif data == "test_stop":
+    if data in ("test_next", "test_stop"):
         # Завершаем тест и показываем результаты
         score = context.user_data.get('test_score', {'total': 0, 'correct': 0,
                                                      'problems_solved': 0})
@@ -260,10 +343,7 @@ async def handle_test_callback(update: Update,
         await query.edit_message_text(result_text, reply_markup=reply_markup)
 
         # Очищаем данные теста
-        context.user_data.pop('test_score', None)
-        context.user_data.pop('test_attempts', None)
-        context.user_data.pop('current_test_problem', None)
-        context.user_data.pop('current_problem_number', None)
+        _clear_test(context)
 
         return ConversationHandler.END
 
@@ -1,20 +1,53 @@
+import asyncio
 import logging
+import signal
 import sys
+import time
 from pathlib import Path
+
+# Момент начала запуска: от него считается время до готовности бота
+STARTED_AT = time.perf_counter()
+
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, \
-    MessageHandler, filters, ConversationHandler
-from telegram import BotCommand, BotCommandScopeAllPrivateChats
+    MessageHandler, filters, ConversationHandler, PersistenceInput, Updater
+from telegram import Bot, BotCommand, BotCommandScopeAllPrivateChats
 
 from config.settings import Config
-from database.models import MathProblemsDB
-from database.init_db import DatabaseInitializer
-from handlers.start import start, help_command
-from handlers.problems import sections, random_problem, handle_random_answer
-from handlers.search import search, handle_search
-from handlers.test_mode import test_mode, handle_test_answer
-from handlers.stats import stats, leaderboard
-from handlers.callbacks import button_handler
-from handlers.admin import admin_panel, show_user_stats_by_date, cancel_admin
+from database.persistence import SQLitePersistence
+from utils.update_processor import PerChatUpdateProcessor
+from utils.outbound import OutboundRateLimiter
+from utils.services import Services, SERVICES_KEY, get_services
+from utils.startup import StartupProfiler, lazy_handler, import_time_report
+from utils.metrics import registry, instrument_application, \
+    MetricsServer
+
+# Модули обработчиков импортируются при первом обращении к ним: через
+# обертки ниже или при первом callback, маршрута которого еще нет (см.
+# handlers.callbacks). Фоновые задачи, рабочие процессы и каталог в
+# разделяемой памяти импортируются там, где они запускаются.
+button_handler = lazy_handler('handlers.callbacks:button_handler')
+conversation_callback = lazy_handler(
+    'handlers.callbacks:conversation_callback')
+start = lazy_handler('handlers.start:start')
+help_command = lazy_handler('handlers.start:help_command')
+sections = lazy_handler('handlers.problems:sections')
+random_problem = lazy_handler('handlers.problems:random_problem')
+handle_random_answer = lazy_handler('handlers.problems:handle_random_answer')
+search = lazy_handler('handlers.search:search')
+handle_search = lazy_handler('handlers.search:handle_search')
+test_mode = lazy_handler('handlers.test_mode:test_mode')
+handle_test_answer = lazy_handler('handlers.test_mode:handle_test_answer')
+review = lazy_handler('handlers.review:review')
+handle_review_answer = lazy_handler('handlers.review:handle_review_answer')
+stats = lazy_handler('handlers.stats:stats')
+leaderboard = lazy_handler('handlers.stats:leaderboard')
+admin_panel = lazy_handler('handlers.admin:admin_panel')
+show_user_stats_by_date = lazy_handler(
+    'handlers.admin:show_user_stats_by_date')
+cancel_admin = lazy_handler('handlers.admin:cancel_admin')
+slow_queries = lazy_handler('handlers.admin:slow_queries')
+exam_start = lazy_handler('handlers.admin:exam_start')
+exam_stop = lazy_handler('handlers.admin:exam_stop')
 
 # Настройка логирования
 logging.basicConfig(
@@ -23,18 +56,29 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Замеры этапов запуска (подробный отчет - с флагом --profile-startup)
+startup_profiler = StartupProfiler(STARTED_AT)
+PROFILE_STARTUP_KEY = 'profile_startup'
+METRICS_SERVER_KEY = 'metrics_server'
+MAINTENANCE_KEY = 'maintenance'
+BACKUP_KEY = 'backup'
+REVIEW_PLAN_KEY = 'review_plan'
 
-def initialize_database_if_needed():
-    """Проверяет и инициализирует базу данных при необходимости"""
-    db_path = Config.DB_PATH
+# Имена состояний диалогов для меток метрик
+STATE_NAMES = {value: name for name, value in vars(Config).items()
+               if name.startswith('WAITING_FOR_')}
 
-    # Сначала создаем объект БД - он создаст пустые таблицы
-    db = MathProblemsDB(db_path)
+
+def initialize_database_if_needed(db):
+    """Проверяет и инициализирует базу данных при необходимости"""
+    db_path = db.db_path
 
     # Проверяем, есть ли данные в базе
     sections = db.get_all_sections()
     if not sections:
         logger.info("База данных пуста, начинаем загрузку данных...")
+        # Парсер сборника нужен только для пустой базы
+        from database.init_db import DatabaseInitializer
         initializer = DatabaseInitializer(db_path=db_path)
         if initializer.initialize_database():
             logger.info("Данные успешно загружены в базу")
@@ -47,7 +91,7 @@ def initialize_database_if_needed():
     return True
 
 
-async def set_bot_commands(application):
+async def set_bot_commands(bot):
     """Устанавливает меню команд для бота"""
     commands = [
         BotCommand("start", "🚀 Начать работу с ботом"),
@@ -55,23 +99,88 @@ async def set_bot_commands(application):
         BotCommand("search", "🔍 Поиск задач по ключевому слову"),
         BotCommand("random", "🎲 Получить случайную задачу"),
         BotCommand("test", "📝 Режим проверки знаний"),
+        BotCommand("review", "🔁 Повторение решенных задач"),
         BotCommand("stats", "📊 Моя статистика и прогресс"),
         BotCommand("leaderboard", "🏆 Таблица лидеров"),
         BotCommand("help", "ℹ️ Получить справку по использованию"),
         BotCommand("admin", "🔧 Админ-панель (только для администраторов)"),
     ]
-    await application.bot.set_my_commands(
+    await bot.set_my_commands(
         commands,
         scope=BotCommandScopeAllPrivateChats()
     )
     logger.info("Меню команд бота установлено")
 
 
+async def start_background_tasks(db, tasks, metrics_port):
+    """Запускает сервер метрик и фоновые задачи, складывая их в tasks"""
+    from utils.maintenance import MaintenanceScheduler, BackupScheduler, \
+        ReviewPlanScheduler
+    from database.backup import BackupManager
+
+    if metrics_port:
+        metrics_server = MetricsServer(Config.METRICS_HOST, metrics_port)
+        await metrics_server.start()
+        tasks[METRICS_SERVER_KEY] = metrics_server
+
+    if Config.ARCHIVE_AFTER_DAYS or Config.VACUUM_PAGES:
+        maintenance = MaintenanceScheduler(
+            db.user_db_paths,
+            archive_after_days=Config.ARCHIVE_AFTER_DAYS,
+            interval=Config.MAINTENANCE_INTERVAL,
+            vacuum_pages=Config.VACUUM_PAGES,
+            batch_size=Config.ARCHIVE_BATCH_SIZE)
+        await maintenance.start()
+        tasks[MAINTENANCE_KEY] = maintenance
+
+    if Config.BACKUP_INTERVAL:
+        backup = BackupScheduler(
+            [BackupManager(db_path, Config.BACKUP_DIR,
+                           keep=Config.BACKUP_KEEP,
+                           pages=Config.BACKUP_PAGES,
+                           step_sleep=Config.BACKUP_STEP_SLEEP)
+             for db_path in dict.fromkeys([db.db_path, *db.user_db_paths])],
+            interval=Config.BACKUP_INTERVAL)
+        await backup.start()
+        tasks[BACKUP_KEY] = backup
+
+    if Config.REVIEW_PLAN_INTERVAL:
+        review_plan = ReviewPlanScheduler(
+            db, interval=Config.REVIEW_PLAN_INTERVAL)
+        await review_plan.start()
+        tasks[REVIEW_PLAN_KEY] = review_plan
+
+
+async def stop_background_tasks(tasks):
+    for key in (METRICS_SERVER_KEY, MAINTENANCE_KEY, BACKUP_KEY,
+                REVIEW_PLAN_KEY):
+        task = tasks.get(key)
+        if task is not None:
+            await task.stop()
+
+
 async def post_init(application):
     """Функция, выполняемая после инициализации бота"""
-    await set_bot_commands(application)
+    with startup_profiler.phase("set_bot_commands"):
+        await set_bot_commands(application.bot)
     logger.info("Бот успешно инициализирован и готов к работе")
 
+    await start_background_tasks(get_services(application).db,
+                                 application.bot_data, Config.METRICS_PORT)
+
+    if application.bot_data.get(PROFILE_STARTUP_KEY):
+        print(startup_profiler.report())
+        print(import_time_report())
+    else:
+        total = time.perf_counter() - startup_profiler.started_at
+        logger.info(f"Запуск занял {total:.2f} с")
+
+
+async def post_shutdown(application):
+    """Функция, выполняемая при остановке бота"""
+    await stop_background_tasks(application.bot_data)
+    get_services(application).db.close()
+
 
 async def init_db_command(update, context):
     """Команда для принудительной переинициализации базы данных"""
@@ -86,8 +195,19 @@ async def init_db_command(update, context):
     await update.message.reply_text(
         "🔄 Начинаю переинициализацию базы данных...")
 
-    initializer = DatabaseInitializer()
-    if initializer.initialize_database():
+    from database.init_db import DatabaseInitializer
+    initializer = DatabaseInitializer(db_path=Config.DB_PATH)
+    services = get_services(context)
+    if await services.run(initializer.initialize_database):
+        if Config.WORKERS > 1:
+            # Каталог в разделяемой памяти общий для всех процессов,
+            # новый будет опубликован при следующем запуске
+            await update.message.reply_text(
+                "✅ База данных успешно переинициализирована! "
+                "Перезапустите бота, чтобы обновить каталог задач.")
+            return
+        # Задачи могли измениться - перечитываем каталог
+        await services.run(services.load_catalog)
         await update.message.reply_text(
             "✅ База данных успешно переинициализирована!")
     else:
@@ -114,18 +234,69 @@ async def error_handler(update, context):
         )
 
 
-def main():
-    # Проверяем и инициализируем базу данных
-    if not initialize_database_if_needed():
-        logger.error(
-            "Не удалось инициализировать базу данных. Завершаем работу.")
-        sys.exit(1)
+def bot_api_urls(bot_api_url):
+    """Адреса другого сервера Bot API (например, тестового) для Bot"""
+    if not bot_api_url:
+        return {}
+    return {'base_url': f"{bot_api_url}/bot",
+            'base_file_url': f"{bot_api_url}/file/bot"}
+
+
+def build_application(services, bot_api_url=None, updater=True,
+                      global_rate=None):
+    """Создает приложение бота и регистрирует все обработчики.
+
+    bot_api_url - адрес другого сервера Bot API (например, тестового).
+    updater=False - обновления передаются в application.update_queue
+    извне (рабочий процесс).
+    global_rate - лимит исходящих запросов в секунду для этого процесса
+    (по умолчанию SEND_GLOBAL_RATE).
+    """
+    if global_rate is None:
+        global_rate = Config.SEND_GLOBAL_RATE
+
+    # Состояние диалогов и user_data переживает перезапуск бота
+    persistence = SQLitePersistence(
+        Config.PERSISTENCE_DB_PATH,
+        store_data=PersistenceInput(bot_data=False, chat_data=False,
+                                    callback_data=False),
+        update_interval=Config.PERSISTENCE_UPDATE_INTERVAL
+    )
 
-    # Создание приложения
-    application = Application.builder().token(Config.BOT_TOKEN).build()
+    # Обновления разных пользователей обрабатываются параллельно,
+    # обновления одного пользователя - по порядку
+    update_processor = PerChatUpdateProcessor(
+        Config.MAX_CONCURRENT_UPDATES,
+        max_pending_updates=Config.MAX_PENDING_UPDATES
+    )
+
+    # Все исходящие запросы идут через очередь с лимитами Telegram
+    rate_limiter = OutboundRateLimiter(
+        global_rate=global_rate,
+        chat_rate=Config.SEND_CHAT_RATE,
+        chat_burst=Config.SEND_CHAT_BURST,
+        group_rate=Config.SEND_GROUP_RATE_PER_MINUTE / 60,
+        max_retries=Config.SEND_MAX_RETRIES
+    )
 
-    # Установка функции post_init
+    # Создание приложения
+    builder = Application.builder().token(Config.BOT_TOKEN) \
+        .persistence(persistence) \
+        .concurrent_updates(update_processor) \
+        .rate_limiter(rate_limiter)
+    for name, url in bot_api_urls(bot_api_url).items():
+        builder = getattr(builder, name)(url)
+    if not updater:
+        builder = builder.updater(None)
+    application = builder.build()
+
+    # Общие сервисы доступны обработчикам через context.bot_data
+    # (bot_data не сохраняется в persistence)
+    application.bot_data[SERVICES_KEY] = services
+
+    # Установка функций post_init и post_shutdown
     application.post_init = post_init
+    application.post_shutdown = post_shutdown
 
     # ОБРАТИТЕ ВНИМАНИЕ: Порядок добавления обработчиков ВАЖЕН!
     # Сначала добавляем специфичные обработчики, затем общие
@@ -145,7 +316,8 @@ def main():
         },
         fallbacks=[CommandHandler("cancel", cancel)],
         allow_reentry=True,
-        name="random_conversation"
+        name="random_conversation",
+        persistent=True
     )
 
     application.add_handler(random_conv_handler)
@@ -161,18 +333,42 @@ def main():
                 MessageHandler(filters.TEXT & ~filters.COMMAND,
                                handle_test_answer),
                 CommandHandler("cancel", cancel),
-                CallbackQueryHandler(button_handler,
+                CallbackQueryHandler(conversation_callback,
                                      pattern="^(test_next|test_stop|show_answer_)"),
             ],
         },
         fallbacks=[CommandHandler("cancel", cancel)],
         allow_reentry=True,
-        name="test_conversation"
+        name="test_conversation",
+        persistent=True
     )
 
     application.add_handler(test_conv_handler)
 
-    # 3. ConversationHandler для поиска
+    # 3. ConversationHandler для интервального повторения
+    review_conv_handler = ConversationHandler(
+        entry_points=[
+            CommandHandler("review", review),
+            CallbackQueryHandler(review, pattern="^review$"),
+        ],
+        states={
+            Config.WAITING_FOR_REVIEW_ANSWER: [
+                MessageHandler(filters.TEXT & ~filters.COMMAND,
+                               handle_review_answer),
+                CommandHandler("cancel", cancel),
+                CallbackQueryHandler(conversation_callback,
+                                     pattern="^review_reveal$"),
+            ],
+        },
+        fallbacks=[CommandHandler("cancel", cancel)],
+        allow_reentry=True,
+        name="review_conversation",
+        persistent=True
+    )
+
+    application.add_handler(review_conv_handler)
+
+    # 4. ConversationHandler для поиска
     search_conv_handler = ConversationHandler(
         entry_points=[
             CommandHandler("search", search),
@@ -186,16 +382,20 @@ def main():
         },
         fallbacks=[CommandHandler("cancel", cancel)],
         allow_reentry=True,
-        name="search_conversation"
+        name="search_conversation",
+        persistent=True
     )
 
     application.add_handler(search_conv_handler)
 
-    # 4. ConversationHandler для админ-панели
+    # 5. ConversationHandler для админ-панели
     admin_conv_handler = ConversationHandler(
         entry_points=[
             CommandHandler("admin", admin_panel),
             CallbackQueryHandler(admin_panel, pattern="^admin_panel$"),
+            # Ввод даты для статистики или очистки начинается с кнопки
+            CallbackQueryHandler(conversation_callback,
+                                 pattern=r"^admin_(user|clear)_date_\d+$"),
         ],
         states={
             Config.WAITING_FOR_DATE: [
@@ -206,25 +406,228 @@ def main():
         },
         fallbacks=[CommandHandler("cancel", cancel_admin)],
         allow_reentry=True,
-        name="admin_conversation"
+        name="admin_conversation",
+        persistent=True
     )
 
     application.add_handler(admin_conv_handler)
 
-    # 5. Обработчики команд (которые не требуют состояний)
+    # 6. Обработчики команд (которые не требуют состояний)
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("sections", sections))
     application.add_handler(CommandHandler("stats", stats))
     application.add_handler(CommandHandler("leaderboard", leaderboard))
     application.add_handler(CommandHandler("help", help_command))
     application.add_handler(CommandHandler("init_db", init_db_command))
+    application.add_handler(CommandHandler("slow_queries", slow_queries))
+    application.add_handler(CommandHandler("exam_start", exam_start))
+    application.add_handler(CommandHandler("exam_stop", exam_stop))
 
-    # 6. Обработчик всех callback запросов (должен быть ПОСЛЕДНИМ среди CallbackQueryHandler)
+    # 7. Обработчик всех callback запросов (должен быть ПОСЛЕДНИМ среди CallbackQueryHandler)
     application.add_handler(CallbackQueryHandler(button_handler))
 
-    # 7. Обработчик ошибок
+    # 8. Обработчик ошибок
     application.add_error_handler(error_handler)
 
+    # Замеры времени всех обработчиков и запросов к базе
+    instrument_application(application, STATE_NAMES)
+    services.instrument()
+    registry.add_collector(lambda: {
+        f'bot_outbound_{name}': value
+        for name, value in rate_limiter.metrics().items()})
+    registry.add_collector(lambda: {
+        f'bot_outbound_{name}': value
+        for name, value in rate_limiter.counters().items()}, 'counter')
+
+    return application
+
+
+def webhook_settings():
+    """Параметры webhook для run_webhook и Updater.start_webhook"""
+    # Telegram сам доставляет обновления на наш HTTP-сервер,
+    # без задержки на циклы getUpdates
+    logger.info(f"Запуск в режиме webhook на "
+                f"{Config.WEBHOOK_LISTEN}:{Config.WEBHOOK_PORT}")
+    return {
+        'listen': Config.WEBHOOK_LISTEN,
+        'port': Config.WEBHOOK_PORT,
+        'url_path': Config.WEBHOOK_PATH,
+        'webhook_url':
+            f"{Config.WEBHOOK_URL.rstrip('/')}/{Config.WEBHOOK_PATH}",
+        'secret_token': Config.WEBHOOK_SECRET_TOKEN,
+    }
+
+
+def run_application(application):
+    """Запускает получение обновлений в выбранном режиме"""
+    if Config.RUN_MODE == 'webhook':
+        application.run_webhook(**webhook_settings())
+    else:
+        application.run_polling()
+
+
+def build_services():
+    """Сервисы приложения по настройкам из Config"""
+    from database.sharding import adopt_legacy_database
+    adopt_legacy_database(Config.DB_PATH, Config.LEGACY_DB_PATH)
+    return Services.build(
+        Config.DB_PATH,
+        search_session_ttl=Config.SEARCH_SESSION_TTL,
+        profile_sql=Config.SQL_PROFILING,
+        slow_query_ms=Config.SLOW_QUERY_MS,
+        explain_sample_rate=Config.SQL_EXPLAIN_SAMPLE_RATE,
+        shard_count=Config.DB_SHARDS)
+
+
+def run_worker(index, count, updates, catalog_name, bot_api_url=None,
+               profile_startup=False):
+    """Рабочий процесс: обрабатывает обновления своей доли пользователей"""
+    from utils.workers import ignore_interrupts
+    ignore_interrupts()
+    asyncio.run(serve_worker(index, count, updates, catalog_name,
+                             bot_api_url, profile_startup))
+
+
+async def serve_worker(index, count, updates, catalog_name, bot_api_url,
+                       profile_startup=False):
+    from utils.maintenance import AdaptiveReloader
+    from utils.workers import serve_updates
+    from database.shared_catalog import SharedProblemCatalog
+
+    with startup_profiler.phase("инициализация БД"):
+        services = build_services()
+    with startup_profiler.phase("подключение каталога"):
+        catalog = SharedProblemCatalog.attach(catalog_name)
+        services.use_catalog(catalog)
+    with startup_profiler.phase("регистрация обработчиков"):
+        # Лимит исходящих сообщений общий на бота - делим его
+        # между процессами
+        application = build_application(
+            services, bot_api_url, updater=False,
+            global_rate=Config.SEND_GLOBAL_RATE / count)
+
+    # Метрики каждого процесса - на своем порту после основного
+    metrics_server = None
+    if Config.METRICS_PORT:
+        metrics_server = MetricsServer(Config.METRICS_HOST,
+                                       Config.METRICS_PORT + 1 + index)
+        await metrics_server.start()
+
+    await application.initialize()
+    await application.start()
+    adaptive_reloader = AdaptiveReloader(
+        services, interval=Config.ADAPTIVE_RELOAD_INTERVAL)
+    await adaptive_reloader.start()
+    logger.info(f"Рабочий процесс {index} готов к работе")
+    if profile_startup:
+        print(f"Рабочий процесс {index}\n{startup_profiler.report()}")
+    try:
+        await serve_updates(application, updates)
+    finally:
+        await adaptive_reloader.stop()
+        await application.stop()
+        await application.shutdown()
+        if metrics_server is not None:
+            await metrics_server.stop()
+        services.catalog = None
+        catalog.close()
+        services.db.close()
+
+
+def run_workers(services, bot_api_url=None, profile_startup=False):
+    """Запускает бота в режиме нескольких процессов (Config.WORKERS > 1)"""
+    asyncio.run(serve_workers(services, bot_api_url,
+                              profile_startup=profile_startup))
+
+
+async def serve_workers(services, bot_api_url=None, stop_event=None,
+                        profile_startup=False):
+    """Основной процесс: принимает обновления и раздает их рабочим.
+
+    Рабочие процессы сами отвечают в Telegram, а каталог задач читают из
+    общего блока разделяемой памяти. Фоновые задачи обслуживания базы
+    выполняются только здесь. Останавливается по SIGINT/SIGTERM или
+    по stop_event.
+    """
+    from utils.workers import WorkerPool
+    from database.shared_catalog import SharedProblemCatalog
+
+    if stop_event is None:
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, stop_event.set)
+
+    catalog_memory = SharedProblemCatalog.publish(services.catalog)
+    # Каждый рабочий процесс с --profile-startup печатает свой отчет
+    pool = WorkerPool(Config.WORKERS, run_worker,
+                      (catalog_memory.name, bot_api_url, profile_startup))
+    update_queue = asyncio.Queue()
+    updater = Updater(Bot(Config.BOT_TOKEN, **bot_api_urls(bot_api_url)),
+                      update_queue)
+    tasks = {}
+
+    async def forward():
+        while True:
+            pool.dispatch(await update_queue.get())
+
+    pool.start()
+    forwarder = asyncio.create_task(forward())
+    try:
+        await updater.initialize()
+        await set_bot_commands(updater.bot)
+        await start_background_tasks(services.db, tasks, Config.METRICS_PORT)
+        if Config.RUN_MODE == 'webhook':
+            await updater.start_webhook(**webhook_settings())
+        else:
+            await updater.start_polling()
+        logger.info("Бот успешно инициализирован и готов к работе")
+        if profile_startup:
+            print(startup_profiler.report())
+            print(import_time_report())
+        await stop_event.wait()
+    finally:
+        if updater.running:
+            await updater.stop()
+        # Полученные обновления уже подтверждены Telegram -
+        # передаем их рабочим процессам до остановки
+        forwarder.cancel()
+        while not update_queue.empty():
+            pool.dispatch(update_queue.get_nowait())
+        await asyncio.to_thread(pool.stop)
+        await updater.shutdown()
+        await stop_background_tasks(tasks)
+        catalog_memory.close()
+        catalog_memory.unlink()
+        services.db.close()
+
+
+def main():
+    profile_startup = '--profile-startup' in sys.argv[1:]
+    startup_profiler.add_phase("импорт модулей",
+                               time.perf_counter() - STARTED_AT)
+
+    with startup_profiler.phase("инициализация БД"):
+        # Единственный экземпляр базы данных на все приложение
+        services = build_services()
+
+        # Проверяем и инициализируем базу данных
+        if not initialize_database_if_needed(services.db):
+            logger.error(
+                "Не удалось инициализировать базу данных. Завершаем работу.")
+            sys.exit(1)
+
+    with startup_profiler.phase("загрузка каталога"):
+        services.load_catalog()
+
+    application = None
+    # В режиме нескольких процессов обработчики работают в рабочих
+    # процессах, а основной только принимает обновления
+    if Config.WORKERS <= 1:
+        with startup_profiler.phase("регистрация обработчиков"):
+            application = build_application(services)
+        application.bot_data[PROFILE_STARTUP_KEY] = profile_startup
+
     # Запуск бота
     print("=" * 50)
     print("🤖 Математический бот для 6 класса запущен!")
@@ -235,6 +638,7 @@ def main():
     print("   /search - 🔍 Поиск задач по ключевому слову")
     print("   /random - 🎲 Получить случайную задачу")
     print("   /test - 📝 Режим проверки знаний")
+    print("   /review - 🔁 Повторение решенных задач")
     print("   /stats - 📊 Моя статистика и прогресс")
     print("   /leaderboard - 🏆 Таблица лидеров")
     print("   /help - ℹ️ Получить справку по использованию")
@@ -242,7 +646,10 @@ def main():
     print("=" * 50)
     print("Нажмите на кнопку 'Menu' в чате чтобы увидеть все команды!")
 
-    application.run_polling()
+    if application is None:
+        run_workers(services, profile_startup=profile_startup)
+    else:
+        run_application(application)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,32 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+
+# config.settings требует токен уже при импорте
+os.environ.setdefault('BOT_TOKEN', '1:test')
+
+
+@pytest.fixture
+def fake_update():
+    """Нажатие кнопки пользователем 1 (id можно поменять в тесте).
+
+    Ответы обработчика - edit_message_text и reply_text - складываются
+    в update.replies парами (текст, клавиатура).
+    """
+    replies = []
+
+    async def reply(text, reply_markup=None, **kwargs):
+        replies.append((text, reply_markup))
+
+    return SimpleNamespace(
+        replies=replies,
+        effective_user=SimpleNamespace(id=1),
+        callback_query=SimpleNamespace(edit_message_text=reply),
+        message=SimpleNamespace(reply_text=reply))
+
+
+@pytest.fixture
+def fake_context():
+    """Контекст обработчика; сервисы тест кладет в bot_data сам"""
+    return SimpleNamespace(bot_data={}, user_data={})
@@ -0,0 +1,116 @@
+"""Подбор задач теста по уровню ученика."""
+import asyncio
+import random
+from types import SimpleNamespace
+
+import pytest
+
+from database.adaptive import (ABILITY_RATE, AdaptiveSelector,
+                               update_ability)
+from handlers.test_mode import next_test_problem
+from utils.services import SERVICES_KEY, Services
+
+# номер задачи -> уровень; без попыток сложность 0.2 / 0.4 / 0.6
+LEVELS = {1: 'легкая', 2: 'средняя', 3: 'сложная', 4: 'легкая',
+          5: 'сложная'}
+
+
+@pytest.fixture
+def selector():
+    catalog = SimpleNamespace(problems={
+        number: SimpleNamespace(difficulty_level=level)
+        for number, level in LEVELS.items()})
+    return AdaptiveSelector(catalog, {})
+
+
+@pytest.fixture
+def candidates(monkeypatch):
+    """Кандидаты последнего pick по порядку близости; берется первый"""
+    seen = []
+
+    def first(candidates):
+        seen[:] = candidates
+        return candidates[0]
+
+    monkeypatch.setattr(random, 'choice', first)
+    return seen
+
+
+def test_ability_moves_up_and_down():
+    # При равных уровнях ожидается половина успеха
+    assert update_ability(0.5, 0.5, 1) == pytest.approx(
+        0.5 + ABILITY_RATE / 2)
+    assert update_ability(0.5, 0.5, 0) == pytest.approx(
+        0.5 - ABILITY_RATE / 2)
+    assert update_ability(0.5, 0.5, 0.5) == pytest.approx(0.5)
+    # Решенная трудная задача поднимает сильнее легкой,
+    # нерешенная легкая опускает сильнее трудной
+    assert update_ability(0.5, 0.8, 1) > update_ability(0.5, 0.2, 1) > 0.5
+    assert update_ability(0.5, 0.2, 0) < update_ability(0.5, 0.8, 0) < 0.5
+
+
+def test_ability_stays_in_range():
+    ability = 0.35
+    for _ in range(20):
+        ability = update_ability(ability, 1.0, 1)
+    assert ability == 1.0
+    for _ in range(20):
+        ability = update_ability(ability, 0.0, 0)
+    assert ability == 0.0
+
+
+def test_pick_nearest_first(selector, candidates):
+    assert selector.pick(0.45, choices=5) == 2
+    assert candidates == [2, 3, 5, 4, 1]
+    assert selector.pick(0.45, choices=2) == 2
+    assert candidates == [2, 3]
+
+
+def test_pick_excludes(selector, candidates):
+    assert selector.pick(0.45, exclude={2, 3}, choices=2) == 5
+    assert candidates == [5, 4]
+    assert selector.pick(0.45, exclude=set(LEVELS)) is None
+
+
+def test_pick_past_the_ends(selector, candidates):
+    # За краем шкалы кандидаты берутся только с одной стороны
+    selector.pick(1.0, choices=3)
+    assert candidates == [5, 3, 2]
+    selector.pick(0.0, choices=3)
+    assert candidates == [1, 4, 2]
+    selector.pick(1.0, exclude={2, 3, 5}, choices=3)
+    assert candidates == [4, 1]
+
+
+def test_record_keeps_order_sorted(selector, candidates):
+    for _ in range(30):
+        selector.record(1, False)
+    assert selector.difficulties[1] > selector.difficulties[3]
+    assert selector._order == sorted(selector._order)
+    assert selector.pick(1.0, choices=1) == 1
+    # Задачи не из каталога не учитываются
+    selector.record(99, True)
+    assert 99 not in selector.difficulties
+
+
+def test_test_mode_starts_over_after_all_seen(tmp_path, candidates):
+    services = Services.build(str(tmp_path / 'math_problems.db'))
+    conn = services.db._connect()
+    with conn:
+        conn.execute("INSERT INTO sections (id, name) VALUES (1, 'Дроби')")
+        conn.executemany(
+            'INSERT INTO problems (section_id, problem_number, problem_text, '
+            'answer, difficulty_level) VALUES (1, ?, ?, ?, ?)',
+            [(number, f'Задача {number}', str(number), LEVELS[number])
+             for number in (1, 2, 3)])
+    conn.close()
+    services.load_catalog()
+    context = SimpleNamespace(user_data={'test_ability': 0.45},
+                              bot_data={SERVICES_KEY: services})
+
+    async def take(count):
+        return [(await next_test_problem(context))[0] for _ in range(count)]
+
+    assert asyncio.run(take(4)) == [2, 3, 1, 2]
+    assert context.user_data['test_seen'] == {2}
+    services.db.close()
@@ -0,0 +1,140 @@
+"""Архивация попыток: статистика до и после переноса в архив совпадает.
+
+Две одинаковые базы получают одни и те же попытки, одна из них
+архивируется; после одинаковых удалений статистика баз должна
+оставаться равной.
+"""
+import pytest
+
+from database.archive import AttemptArchiver
+from database.models import MathProblemsDB
+
+USER_ID = 42
+OTHER_USER_ID = 7
+CUTOFF = '2024-06-01 00:00:00'
+
+# (пользователь, задача, верно, время попытки)
+ATTEMPTS = [
+    (USER_ID, 1, False, '2024-01-15 09:00:00'),
+    (USER_ID, 1, True, '2024-01-15 09:05:00'),
+    (USER_ID, 2, False, '2024-01-15 10:00:00'),
+    (USER_ID, 2, False, '2024-02-03 18:30:00'),
+    (USER_ID, 3, True, '2024-02-03 18:40:00'),
+    (USER_ID, 2, True, '2024-07-01 12:00:00'),
+    (USER_ID, 3, False, '2024-07-01 12:10:00'),
+    (OTHER_USER_ID, 1, True, '2024-01-15 11:00:00'),
+    (OTHER_USER_ID, 2, True, '2024-07-01 13:00:00'),
+]
+DAYS = ('2024-01-15', '2024-02-03', '2024-07-01')
+
+
+def _make_db(path):
+    db = MathProblemsDB(str(path))
+    conn = db._connect()
+    with conn:
+        conn.execute("INSERT INTO sections (id, name) VALUES (1, 'Дроби')")
+        conn.executemany(
+            'INSERT INTO problems (section_id, problem_number, problem_text, '
+            'answer) VALUES (1, ?, ?, ?)',
+            [(number, f'Задача {number}', str(number)) for number in (1, 2, 3)])
+    conn.close()
+
+    for user_id, problem_number, is_correct, solved_at in ATTEMPTS:
+        with db._transaction(user_id) as cursor:
+            db.add_user_attempt(user_id, problem_number, '1', '1', is_correct,
+                                cursor=cursor)
+            cursor.execute('''
+                UPDATE user_attempts SET solved_at = ?
+                WHERE id = (SELECT MAX(id) FROM user_attempts)
+            ''', (solved_at,))
+        db.update_user_stats(user_id, 'pupil', 'Вася', None,
+                             is_correct=is_correct,
+                             problem_number=problem_number)
+    return db
+
+
+def _stats(db, user_id=USER_ID):
+    """Все, что бот показывает о попытках пользователя"""
+    stats = db.get_user_stats(user_id)
+    detailed = db.get_user_detailed_stats(user_id)
+    return {
+        'attempts': {number: db.get_user_attempts_count(user_id, number)
+                     for number in (1, 2, 3)},
+        'by_date': {day: db.count_user_attempts_by_date(user_id, day)
+                    for day in DAYS},
+        'history': {day: db.get_user_attempts_by_date(user_id, day)
+                    for day in DAYS},
+        'problems_attempted': stats['total_problems_attempted'],
+        'avg_attempts': stats['avg_attempts_per_problem'],
+        'problem_stats': sorted(
+            (problem['problem_number'], problem['total_attempts'],
+             problem['correct_attempts'], problem['first_attempt'],
+             problem['last_attempt'])
+            for problem in detailed['problem_stats']),
+        'all_problems': db.get_problem_stats(),
+    }
+
+
+@pytest.fixture
+def databases(tmp_path):
+    """(база без архива, та же база с архивом старых попыток)"""
+    live = _make_db(tmp_path / 'live.db')
+    archived = _make_db(tmp_path / 'archived.db')
+    assert AttemptArchiver(archived.db_path).archive_before(CUTOFF) == 6
+    yield live, archived
+    live.close()
+    archived.close()
+
+
+def test_archive_keeps_stats(databases):
+    live, archived = databases
+    conn = archived._connect()
+    assert conn.execute('SELECT COUNT(*) FROM user_attempts').fetchone()[0] == 3
+    conn.close()
+
+    assert _stats(archived) == _stats(live)
+    assert _stats(archived, OTHER_USER_ID) == _stats(live, OTHER_USER_ID)
+
+
+@pytest.mark.parametrize('deletion', [
+    {'problem_number': 2},
+    {'problem_number': 1},
+    {'date': '2024-01-15'},
+    {'date': '2024-07-01'},
+    {},
+])
+def test_delete_after_archive_keeps_stats(databases, deletion):
+    live, archived = databases
+
+    assert archived.delete_user_attempts(USER_ID, **deletion) == \
+        live.delete_user_attempts(USER_ID, **deletion)
+
+    if deletion:
+        assert _stats(archived) == _stats(live)
+    else:
+        assert archived.get_user_stats(USER_ID) is None
+        assert archived.count_user_attempts_by_date(USER_ID, DAYS[0]) == 0
+    # Попытки другого пользователя не затронуты
+    assert _stats(archived, OTHER_USER_ID) == _stats(live, OTHER_USER_ID)
+    assert archived.get_problem_stats() == live.get_problem_stats()
+
+
+def test_delete_with_archived_attempt_without_problem(tmp_path):
+    db = _make_db(tmp_path / 'math_problems.db')
+    conn = db._connect()
+    with conn:
+        conn.execute('''
+            INSERT INTO user_attempts
+                (user_id, problem_number, user_answer, correct_answer,
+                 is_correct, attempt_number, solved_at)
+            VALUES (?, NULL, '1', '1', 0, 1, '2024-01-15 12:00:00')
+        ''', (USER_ID,))
+    conn.close()
+    AttemptArchiver(db.db_path).archive_before(CUTOFF)
+
+    # Сводка по задачам пересчитывается без строки без задачи
+    assert db.delete_user_attempts(USER_ID, problem_number=1) == 2
+    assert db.get_user_attempts_count(USER_ID, 1) == 0
+    assert db.get_user_attempts_count(USER_ID, 2) == 3
+    assert db.count_user_attempts_by_date(USER_ID, '2024-01-15') == 2
+    db.close()
@@ -0,0 +1,77 @@
+"""Номера попыток при одновременных ответах одного пользователя."""
+import threading
+
+import pytest
+
+from database.models import MathProblemsDB
+
+USER_ID = 42
+THREADS = 8
+ATTEMPTS = 25
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = MathProblemsDB(str(tmp_path / 'math_problems.db'))
+    yield db
+    db.close()
+
+
+def _answer_concurrently(db, problem_numbers):
+    """Каждый поток отвечает ATTEMPTS раз на свою задачу из списка"""
+    barrier = threading.Barrier(len(problem_numbers))
+    numbers = {problem_number: [] for problem_number in problem_numbers}
+    errors = []
+
+    def answer(problem_number):
+        barrier.wait()
+        try:
+            for i in range(ATTEMPTS):
+                numbers[problem_number].append(db.add_user_attempt(
+                    USER_ID, problem_number, str(i), '1', i % 5 == 0))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=answer, args=(problem_number,))
+               for problem_number in problem_numbers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    return numbers
+
+
+def test_concurrent_attempts_get_distinct_numbers(db):
+    numbers = _answer_concurrently(db, [1] * THREADS)
+    total = THREADS * ATTEMPTS
+    assert sorted(numbers[1]) == list(range(1, total + 1))
+
+    conn = db._connect(USER_ID)
+    try:
+        stored = [row[0] for row in conn.execute('''
+            SELECT attempt_number FROM user_attempts
+            WHERE user_id = ? AND problem_number = 1
+            ORDER BY attempt_number
+        ''', (USER_ID,))]
+        counter = conn.execute('''
+            SELECT last_attempt_number FROM user_problem_attempts
+            WHERE user_id = ? AND problem_number = 1
+        ''', (USER_ID,)).fetchone()[0]
+        stats = conn.execute('''
+            SELECT attempts, correct_attempts FROM problem_stats
+            WHERE problem_number = 1
+        ''').fetchone()
+    finally:
+        conn.close()
+    assert stored == list(range(1, total + 1))
+    assert counter == total
+    assert stats == (total, THREADS * 5)
+    assert db.get_user_attempts_count(USER_ID, 1) == total
+
+
+def test_counters_are_per_problem(db):
+    numbers = _answer_concurrently(db, list(range(1, THREADS + 1)))
+    for problem_number, attempt_numbers in numbers.items():
+        # Внутри одного потока номера идут подряд
+        assert attempt_numbers == list(range(1, ATTEMPTS + 1)), problem_number
@@ -0,0 +1,166 @@
+"""Резервные копии: снятие, восстановление и ротация."""
+import gzip
+import logging
+import sqlite3
+
+import pytest
+
+from database.backup import BACKUP_SUFFIX, BackupManager, BackupRestarted
+
+ROWS = 200
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    db_path = str(tmp_path / 'math_problems.db')
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.execute('CREATE TABLE notes (id INTEGER PRIMARY KEY, body TEXT)')
+        # Несколько десятков страниц, чтобы копирование шло в несколько шагов
+        conn.executemany('INSERT INTO notes (body) VALUES (?)',
+                         [(f'заметка {i} ' * 20,) for i in range(ROWS)])
+    conn.close()
+    return db_path
+
+
+def _rows(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute('SELECT id, body FROM notes ORDER BY id').fetchall()
+    finally:
+        conn.close()
+
+
+def _write(db_path, body):
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.execute('INSERT INTO notes (body) VALUES (?)', (body,))
+    conn.close()
+
+
+def test_backup_restore_round_trip(db_path, tmp_path):
+    manager = BackupManager(db_path, tmp_path / 'backups', pages=4,
+                            step_sleep=0)
+    expected = _rows(db_path)
+    path = manager.backup()
+    assert path.name.endswith(BACKUP_SUFFIX)
+    with gzip.open(path, 'rb') as backup:
+        assert backup.read(16) == b'SQLite format 3\x00'
+
+    # База меняется после копии, восстановление возвращает ее состояние
+    _write(db_path, 'после копии')
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.execute('DELETE FROM notes WHERE id <= 10')
+    conn.close()
+
+    assert manager.restore() == path
+    assert _rows(db_path) == expected
+
+
+def test_restore_rejects_damaged_backup(db_path, tmp_path):
+    manager = BackupManager(db_path, tmp_path / 'backups')
+    with pytest.raises(FileNotFoundError):
+        manager.restore()
+
+    damaged = tmp_path / f'damaged{BACKUP_SUFFIX}'
+    with gzip.open(damaged, 'wb') as dst:
+        dst.write(b'not a database' * 100)
+    expected = _rows(db_path)
+    with pytest.raises(sqlite3.DatabaseError):
+        manager.restore(damaged)
+    assert _rows(db_path) == expected
+
+
+def test_restart_guard():
+    progress = BackupManager._restart_guard()
+    progress(0, 10, 12)
+    progress(0, 6, 12)
+    with pytest.raises(BackupRestarted):
+        progress(0, 12, 13)
+
+
+def _writing_guard(monkeypatch, db_path, writes):
+    """Записывает в базу на каждом третьем шаге копирования (всего writes
+    раз), заставляя его начаться заново; возвращает счетчик перезапусков.
+
+    Перезапуск после первого же шага охранник не замечает (страниц
+    остается столько же), но и повторять там почти нечего.
+    """
+    original = BackupManager._restart_guard
+    state = {'steps': 0, 'writes': 0, 'restarts': 0}
+
+    def guard():
+        progress = original()
+
+        def wrapped(status, remaining, total):
+            try:
+                progress(status, remaining, total)
+            except BackupRestarted:
+                state['restarts'] += 1
+                raise
+            state['steps'] += 1
+            if state['writes'] < writes and remaining \
+                    and state['steps'] % 3 == 0:
+                state['writes'] += 1
+                _write(db_path, f'во время копии {state["writes"]}')
+
+        return wrapped
+
+    monkeypatch.setattr(BackupManager, '_restart_guard', staticmethod(guard))
+    return state
+
+
+def test_backup_retries_after_concurrent_write(db_path, tmp_path,
+                                               monkeypatch):
+    state = _writing_guard(monkeypatch, db_path, writes=1)
+    manager = BackupManager(db_path, tmp_path / 'backups', pages=1,
+                            step_sleep=0)
+    path = manager.backup()
+    assert state['restarts'] == 1
+
+    # Копия содержит запись, сделанную во время копирования
+    restored = str(tmp_path / 'restored.db')
+    sqlite3.connect(restored).close()
+    BackupManager(restored, tmp_path / 'backups').restore(path)
+    assert _rows(restored) == _rows(db_path)
+    assert len(_rows(restored)) == ROWS + 1
+
+
+def test_backup_falls_back_to_one_step(db_path, tmp_path, monkeypatch,
+                                       caplog):
+    state = _writing_guard(monkeypatch, db_path, writes=1000)
+    manager = BackupManager(db_path, tmp_path / 'backups', pages=1,
+                            step_sleep=0, max_restarts=2)
+    caplog.set_level(logging.WARNING, 'database.backup')
+    path = manager.backup()
+
+    assert state['restarts'] == 2
+    assert 'копируем за один шаг' in caplog.text
+    restored = str(tmp_path / 'restored.db')
+    BackupManager(restored, tmp_path / 'backups').restore(path)
+    assert _rows(restored) == _rows(db_path)
+
+
+def test_rotate_keeps_own_backups_only(tmp_path):
+    backup_dir = tmp_path / 'backups'
+    backup_dir.mkdir()
+    own = [backup_dir / f'math_problems-20240301-10000{i}-000000'
+           f'{BACKUP_SUFFIX}' for i in range(5)]
+    shards = [backup_dir / f'math_problems.shard{n}-20240301-100000-000000'
+              f'{BACKUP_SUFFIX}' for n in range(2)]
+    other = backup_dir / 'notes.txt'
+    for path in own + shards + [other]:
+        path.write_bytes(b'')
+
+    manager = BackupManager(str(tmp_path / 'math_problems.db'), backup_dir,
+                            keep=2)
+    assert manager.list_backups() == own[::-1]
+    assert sorted(manager.rotate()) == own[:3]
+    assert sorted(backup_dir.iterdir()) == sorted(own[3:] + shards + [other])
+
+    shard = BackupManager(str(tmp_path / 'math_problems.shard0.db'),
+                          backup_dir, keep=0)
+    assert shard.rotate() == [shards[0]]
+    assert sorted(backup_dir.iterdir()) == sorted(own[3:] + shards[1:]
+                                                  + [other])
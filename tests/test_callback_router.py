@@ -0,0 +1,102 @@
+"""Маршрутизация callback data к обработчикам."""
+import logging
+
+import pytest
+
+from handlers.callbacks import router as bot_router
+from utils.callback_router import CallbackRouter
+
+
+def _handler(name):
+    async def handler(update, context, *args):
+        return name, args
+    handler.__name__ = name
+    return handler
+
+
+SEARCH = _handler('search')
+SEARCH_PAGE = _handler('search_page')
+SECTION = _handler('section')
+ITEM = _handler('item')
+ITEM_NOTE = _handler('item_note')
+
+
+@pytest.fixture
+def router():
+    router = CallbackRouter()
+    router.add_exact('search', SEARCH)
+    router.add_prefix('search_page_', SEARCH_PAGE, (int, int))
+    router.add_prefix('section_', SECTION, (int, int), required=1)
+    router.add_prefix('item_', ITEM, (str,))
+    router.add_prefix('item_note_', ITEM_NOTE, (int,))
+    return router
+
+
+def test_exact_and_prefix_do_not_overlap(router):
+    assert router.resolve('search') == (SEARCH, ())
+    assert router.resolve('search_page_7_2') == (SEARCH_PAGE, (7, 2))
+    assert router.resolve('search_') is None
+    assert router.resolve('searchx') is None
+
+
+def test_missing_required_params_do_not_match(router, caplog):
+    caplog.set_level(logging.WARNING, 'utils.callback_router')
+    # Раньше zip молча отбрасывал недостающий номер страницы
+    assert router.resolve('search_page_7') is None
+    assert router.resolve('search_page_') is None
+    assert 'ожидалось параметров 2..2, получено 1' in caplog.text
+
+
+def test_optional_params(router):
+    assert router.resolve('section_3') == (SECTION, (3,))
+    assert router.resolve('section_3_1') == (SECTION, (3, 1))
+    assert router.resolve('section_') is None
+    assert router.resolve('section_x') is None
+
+
+def test_last_param_takes_the_rest(router):
+    assert router.resolve('item_a_b_c') == (ITEM, ('a_b_c',))
+
+
+def test_longest_prefix_falls_back_to_shorter(router):
+    assert router.resolve('item_note_5') == (ITEM_NOTE, (5,))
+    # item_note_ не разбирается (не число) - подходит более короткий item_
+    assert router.resolve('item_note_x') == (ITEM, ('note_x',))
+    assert router.resolve('item_note_') == (ITEM, ('note_',))
+
+
+def test_invalid_registrations(router):
+    with pytest.raises(ValueError):
+        router.add_exact('search', SEARCH)
+    with pytest.raises(ValueError):
+        router.add_prefix('item_', ITEM, (str,))
+    with pytest.raises(ValueError):
+        router.add_prefix('other_', ITEM, (int,), required=2)
+    with pytest.raises(ValueError):
+        router.route(data='a', prefix='b')
+
+
+def test_deferred_modules_are_loaded_on_miss():
+    router = CallbackRouter()
+    router.defer('handlers.search')
+    assert router.resolve('unknown') is None
+    assert router._deferred == []
+
+
+def test_bot_routes():
+    # Все кнопки бота разбираются маршрутами, которые их ожидают
+    expected = {
+        'section_4': ('show_section_problems', (4,)),
+        'section_4_2': ('show_section_problems', (4, 2)),
+        'search_page_12_3': ('show_search_page', (12, 3)),
+        'problem_17': ('show_problem', ('17',)),
+        'show_answer_17': ('show_answer', ('17',)),
+        'admin_clear_select_5': ('show_clear_options', (5,)),
+        'admin_clear_user_5': ('show_clear_options', (5,)),
+        'admin_clear_all_5': ('confirm_clear_all', (5,)),
+        'admin_user_detail_5': ('show_user_detailed_stats', (5,)),
+    }
+    for data, (name, args) in expected.items():
+        handler, resolved_args = bot_router.resolve(data)
+        assert (handler.__name__, resolved_args) == (name, args), data
+    assert bot_router.resolve('search_page_12') is None
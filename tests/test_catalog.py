@@ -0,0 +1,116 @@
+"""Страницы разделов из каталога задач в памяти."""
+import asyncio
+
+import pytest
+
+from config.settings import Config
+from database.catalog import CatalogProblem, ProblemCatalog
+from handlers.problems import show_section_problems
+from utils.services import SERVICES_KEY, Services
+
+PAGE_SIZE = 10
+# id раздела -> число задач
+SECTIONS = {1: 23, 2: 20, 3: 0}
+
+
+def _problems():
+    number = 0
+    for section_id, count in SECTIONS.items():
+        for _ in range(count):
+            number += 1
+            yield section_id, number
+
+
+@pytest.fixture
+def catalog():
+    sections = [(section_id, f'Раздел {section_id}', '')
+                for section_id in SECTIONS]
+    return ProblemCatalog(sections, [
+        CatalogProblem(number, section_id, f'Задача {number}', 'средняя',
+                       str(number))
+        for section_id, number in _problems()])
+
+
+def _numbers(section_page):
+    return [problem.problem_number for problem in section_page.problems]
+
+
+def test_pages_cover_section(catalog):
+    assert catalog.page_count(1, PAGE_SIZE) == 3
+    pages = [catalog.get_page(1, page, PAGE_SIZE) for page in range(3)]
+    assert [_numbers(page) for page in pages] == [
+        list(range(1, 11)), list(range(11, 21)), [21, 22, 23]]
+    assert {(page.page_count, page.total, page.section_name)
+            for page in pages} == {(3, 23, 'Раздел 1')}
+
+    # Размер раздела кратен размеру страницы - лишней пустой страницы нет
+    assert catalog.page_count(2, PAGE_SIZE) == 2
+    assert _numbers(catalog.get_page(2, 1, PAGE_SIZE)) == list(range(34, 44))
+
+
+@pytest.mark.parametrize('page, expected', [
+    (-1, 0), (-100, 0), (3, 2), (100, 2)])
+def test_page_out_of_range_is_clamped(catalog, page, expected):
+    section_page = catalog.get_page(1, page, PAGE_SIZE)
+    assert section_page.page == expected
+    assert section_page == catalog.get_page(1, expected, PAGE_SIZE)
+
+
+@pytest.mark.parametrize('section_id', [3, 99])
+def test_empty_and_unknown_sections(catalog, section_id):
+    assert catalog.page_count(section_id, PAGE_SIZE) == 1
+    section_page = catalog.get_page(section_id, 5, PAGE_SIZE)
+    assert (section_page.problems, section_page.page,
+            section_page.page_count, section_page.total) == ([], 0, 1, 0)
+
+
+def test_load_orders_problems_by_number(tmp_path):
+    services = Services.build(str(tmp_path / 'math_problems.db'))
+    conn = services.db._connect()
+    with conn:
+        conn.execute("INSERT INTO sections (id, name) VALUES (1, 'Дроби')")
+        conn.executemany(
+            'INSERT INTO problems (section_id, problem_number, problem_text, '
+            'answer) VALUES (1, ?, ?, ?)',
+            [(number, f'Задача {number}', str(number)) for number in (5, 2, 9)])
+    conn.close()
+    catalog = services.load_catalog()
+    services.db.close()
+    assert _numbers(catalog.get_page(1, 0, PAGE_SIZE)) == [2, 5, 9]
+
+
+def _show(update, context, *args):
+    update.replies.clear()
+    asyncio.run(show_section_problems(update, context, *args))
+    [(text, reply_markup)] = update.replies
+    buttons = [button.callback_data for row in reply_markup.inline_keyboard
+               for button in row]
+    return text, buttons
+
+
+def test_section_navigation_buttons(catalog, monkeypatch, fake_update,
+                                    fake_context):
+    monkeypatch.setattr(Config, 'SECTION_PAGE_SIZE', PAGE_SIZE)
+    services = Services(None)
+    services.catalog = catalog
+    fake_context.bot_data[SERVICES_KEY] = services
+
+    text, buttons = _show(fake_update, fake_context, 1)
+    assert 'Страница 1 из 3' in text
+    assert 'section_1_1' in buttons and 'section_1_-1' not in buttons
+    assert buttons[:PAGE_SIZE] == [f'problem_{n}' for n in range(1, 11)]
+
+    text, buttons = _show(fake_update, fake_context, 1, 1)
+    assert 'section_1_0' in buttons and 'section_1_2' in buttons
+
+    # Номер страницы из старой кнопки за пределами раздела
+    text, buttons = _show(fake_update, fake_context, 1, 7)
+    assert 'Страница 3 из 3' in text
+    assert buttons[:3] == ['problem_21', 'problem_22', 'problem_23']
+    assert 'section_1_1' in buttons and 'section_1_3' not in buttons
+    assert set(services.keyboards) == {('section', 1, page)
+                                       for page in range(3)}
+
+    text, buttons = _show(fake_update, fake_context, 3)
+    assert 'нет задач' in text
+    assert not any(data.startswith('section_') for data in buttons)
@@ -0,0 +1,64 @@
+"""Статистика по дням: границы дней и подписи считаются по UTC."""
+import asyncio
+from datetime import date
+
+import pytest
+
+import database.models
+import handlers.admin
+from config.settings import Config
+from handlers.admin import show_user_detailed_stats
+from utils.services import SERVICES_KEY, Services
+
+ADMIN_ID = 1
+USER_ID = 42
+TODAY = date(2024, 3, 10)
+
+# solved_at по UTC, как его пишет CURRENT_TIMESTAMP
+SOLVED_AT = [
+    '2024-03-10 23:30:00',
+    '2024-03-10 00:00:00',
+    '2024-03-09 23:59:59',
+    '2024-03-04 00:10:00',
+    '2024-03-03 23:59:59',
+]
+
+
+@pytest.fixture
+def services(tmp_path, monkeypatch):
+    for module in (database.models, handlers.admin):
+        monkeypatch.setattr(module, 'utc_today', lambda: TODAY)
+    services = Services.build(str(tmp_path / 'math_problems.db'))
+    db = services.db
+    for solved_at in SOLVED_AT:
+        with db._transaction(USER_ID) as cursor:
+            db.add_user_attempt(USER_ID, 1, '1', '1', True, cursor=cursor)
+            cursor.execute('''
+                UPDATE user_attempts SET solved_at = ?
+                WHERE id = (SELECT MAX(id) FROM user_attempts)
+            ''', (solved_at,))
+        db.update_user_stats(USER_ID, 'pupil', 'Вася', None, True, 1)
+    yield services
+    db.close()
+
+
+def test_daily_activity_uses_utc_days(services):
+    activity = services.db.get_user_daily_activity(USER_ID, days=7)
+    assert [(day['date'], day['total_attempts']) for day in activity] == [
+        ('2024-03-10', 2), ('2024-03-09', 1), ('2024-03-04', 1)]
+    assert services.db.count_user_attempts_by_date(USER_ID, TODAY) == 2
+
+
+def test_admin_labels_match_stored_days(services, monkeypatch, fake_update,
+                                        fake_context):
+    monkeypatch.setattr(Config, 'ADMIN_IDS', [ADMIN_ID])
+    fake_update.effective_user.id = ADMIN_ID
+    fake_context.bot_data[SERVICES_KEY] = services
+    asyncio.run(show_user_detailed_stats(fake_update, fake_context, USER_ID))
+
+    [(text, _)] = fake_update.replies
+    assert '• 2024-03-10: 2 попыток' in text
+    assert '• 2024-03-09: 1 попыток' in text
+    assert '• 2024-03-04: 1 попыток' in text
+    assert '• 2024-03-05: Нет активности' in text
+    assert '2024-03-03' not in text
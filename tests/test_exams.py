@@ -0,0 +1,175 @@
+"""Экзамены класса: запуск, ответы учеников и итоги.
+
+Два экземпляра ExamStore над одной базой ведут себя как два рабочих
+процесса бота.
+"""
+import asyncio
+import sqlite3
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from handlers.test_mode import next_exam_problem, record_test_result
+from utils.services import SERVICES_KEY, Services
+
+PROBLEMS = [3, 1, 2]
+
+
+@pytest.fixture
+def services(tmp_path):
+    services = Services.build(str(tmp_path / 'math_problems.db'))
+    conn = services.db._connect()
+    with conn:
+        conn.execute("INSERT INTO sections (id, name) VALUES (1, 'Дроби')")
+        conn.executemany(
+            'INSERT INTO problems (section_id, problem_number, problem_text, '
+            'answer) VALUES (1, ?, ?, ?)',
+            [(number, f'Задача {number}', str(number * 10))
+             for number in (1, 2, 3)])
+    conn.close()
+    services.load_catalog()
+    yield services
+    services.db.close()
+
+
+def _other_worker(services):
+    return Services(services.db).exams
+
+
+def test_start_only_one_exam(services):
+    session = services.exams.start(PROBLEMS)
+    assert list(session.problems) == PROBLEMS
+    assert services.exams.start([1]) is None
+    assert _other_worker(services).start([1]) is None
+    assert _other_worker(services).active() == session
+
+
+class _SlowCheckCursor(sqlite3.Cursor):
+    """Задерживает проверку активного экзамена, расширяя окно гонки"""
+
+    def execute(self, sql, parameters=()):
+        result = super().execute(sql, parameters)
+        if sql.startswith('SELECT 1 FROM exam_sessions'):
+            time.sleep(0.2)
+        return result
+
+
+class _SlowCheckConnection(sqlite3.Connection):
+    def cursor(self, factory=_SlowCheckCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+
+def test_concurrent_starts_give_one_exam(services, monkeypatch):
+    monkeypatch.setattr(services.db, '_connection_factory',
+                        _SlowCheckConnection)
+    stores = [_other_worker(services) for _ in range(2)]
+    barrier = threading.Barrier(len(stores))
+    started = []
+
+    def start(store):
+        barrier.wait()
+        started.append(store.start(PROBLEMS))
+
+    threads = [threading.Thread(target=start, args=(store,))
+               for store in stores]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len([session for session in started if session]) == 1
+    conn = services.db._connect()
+    assert conn.execute('SELECT COUNT(*) FROM exam_sessions').fetchone()[0] == 1
+    conn.close()
+
+
+def test_order_for_is_a_stable_permutation(services):
+    session = services.exams.start(PROBLEMS, shuffle=True)
+    order = session.order_for(42)
+    assert sorted(order) == [0, 1, 2]
+    assert _other_worker(services).active().order_for(42) == order
+    assert services.exams.finish().session.order_for(42) == order
+
+
+def test_record_keeps_first_result_and_resumes(services):
+    exams = services.exams
+    session = exams.start(PROBLEMS)
+    assert exams.resume_position(session.id, 42) == 0
+
+    assert exams.record(session.id, 42, 0, 3, 1, True)
+    assert not exams.record(session.id, 42, 0, 3, 2, False)
+    assert exams.record(session.id, 42, 1, 1, 3, False)
+    assert exams.record(session.id, 7, 0, 3, 2, True)
+    assert exams.resume_position(session.id, 42) == 2
+
+    results = exams.finish()
+    assert results.session.id == session.id
+    assert [(pupil['user_id'], pupil['answered'], pupil['solved'],
+             pupil['attempts']) for pupil in results.pupils] == \
+        [(7, 1, 1, 2), (42, 2, 1, 4)]
+    assert results.problems == {3: [2, 2], 1: [1, 0], 2: [0, 0]}
+    assert exams.active() is None
+    assert exams.finish() is None
+
+
+def test_answers_after_finish_are_rejected(services):
+    pupil_worker = _other_worker(services)
+    session = services.exams.start(PROBLEMS)
+    # Процесс ученика запомнил экзамен до его завершения
+    assert pupil_worker.active() == session
+
+    services.exams.finish()
+    assert pupil_worker.active() == session
+    assert not pupil_worker.record(session.id, 42, 0, 3, 1, True)
+    assert pupil_worker.resume_position(session.id, 42) == 0
+
+
+def _context(services, session, user_id=42):
+    user_data = {'exam_session': session.id,
+                 'exam_order': session.order_for(user_id),
+                 'exam_position': 0}
+    return SimpleNamespace(user_data=user_data,
+                           bot_data={SERVICES_KEY: services})
+
+
+def test_exam_problems_come_from_catalog(services, monkeypatch):
+    session = services.exams.start(PROBLEMS)
+    context = _context(services, session)
+
+    def no_db(*args):
+        raise AssertionError("задача экзамена прочитана из базы")
+
+    monkeypatch.setattr(services.db, 'get_problem_by_number', no_db)
+
+    async def take_all():
+        problems = []
+        while (problem := await next_exam_problem(context)) is not None:
+            problems.append(problem)
+        return problems
+
+    assert asyncio.run(take_all()) == [
+        (number, f'Задача {number}', str(number * 10), 'Дроби')
+        for number in PROBLEMS]
+
+
+def test_record_test_result_after_finish(services):
+    session = services.exams.start(PROBLEMS)
+    context = _context(services, session)
+
+    async def answer():
+        problem = await next_exam_problem(context)
+        await record_test_result(context, 42, problem[0], 1, True)
+
+    asyncio.run(answer())
+    asyncio.run(answer())
+    # Учитель завершил экзамен в другом процессе, этот процесс
+    # об этом еще не знает
+    _other_worker(services).finish()
+    asyncio.run(answer())
+
+    assert services.exams.resume_position(session.id, 42) == 2
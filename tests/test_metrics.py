@@ -0,0 +1,145 @@
+"""Метрики процесса: квантили, текстовый формат Prometheus и HTTP."""
+import asyncio
+import threading
+
+import pytest
+
+from utils import metrics
+from utils.metrics import MetricsRegistry, MetricsServer, Summary
+
+
+def test_summary_quantiles():
+    summary = Summary()
+    assert summary.quantiles() == {0.5: 0.0, 0.95: 0.0, 0.99: 0.0}
+
+    for value in range(100, 0, -1):
+        summary.observe(value)
+    assert summary.quantiles() == {0.5: 51, 0.95: 96, 0.99: 100}
+    assert (summary.count, summary.total) == (100, 5050)
+
+    summary = Summary()
+    summary.observe(7)
+    assert summary.quantiles() == {0.5: 7, 0.95: 7, 0.99: 7}
+
+
+def test_summary_window(monkeypatch):
+    monkeypatch.setattr(metrics, 'WINDOW_SIZE', 10)
+    summary = Summary()
+    for value in range(1, 21):
+        summary.observe(value)
+    # Квантили - по последним замерам, число и сумма - по всем
+    assert summary.quantiles() == {0.5: 16, 0.95: 20, 0.99: 20}
+    assert (summary.count, summary.total) == (20, 210)
+
+
+def test_exposition_format():
+    registry = MetricsRegistry()
+    registry.describe('bot_errors_total', 'Ошибки')
+    registry.inc('bot_errors_total', handler='start')
+    registry.inc('bot_errors_total', 2, handler='start')
+    registry.inc('bot_errors_total', handler='say "hi"\\')
+    registry.inc('bot_sent_total')
+    registry.observe('bot_handler_seconds', 0.25, handler='start')
+    registry.observe('bot_handler_seconds', 0.5, handler='start')
+    registry.add_collector(lambda: {'bot_queue_depth': 3})
+    registry.add_collector(lambda: {'bot_retries_total': 5}, 'counter')
+    registry.add_collector(lambda: 1 / 0)
+
+    assert registry.render() == '\n'.join([
+        '# HELP bot_errors_total Ошибки',
+        '# TYPE bot_errors_total counter',
+        'bot_errors_total{handler="say \\"hi\\"\\\\"} 1',
+        'bot_errors_total{handler="start"} 3',
+        '# TYPE bot_sent_total counter',
+        'bot_sent_total 1',
+        '# TYPE bot_handler_seconds summary',
+        'bot_handler_seconds{handler="start",quantile="0.5"} 0.500000',
+        'bot_handler_seconds{handler="start",quantile="0.95"} 0.500000',
+        'bot_handler_seconds{handler="start",quantile="0.99"} 0.500000',
+        'bot_handler_seconds_sum{handler="start"} 0.750000',
+        'bot_handler_seconds_count{handler="start"} 2',
+        '# TYPE bot_queue_depth gauge',
+        'bot_queue_depth 3',
+        '# TYPE bot_retries_total counter',
+        'bot_retries_total 5',
+    ]) + '\n'
+    assert registry.summary('bot_handler_seconds', handler='start').count == 2
+    assert registry.summary('bot_handler_seconds', handler='other') is None
+
+
+def test_concurrent_updates_are_not_lost():
+    registry = MetricsRegistry()
+    threads_count, updates = 8, 2000
+    barrier = threading.Barrier(threads_count)
+
+    def update(i):
+        barrier.wait()
+        for _ in range(updates):
+            registry.inc('bot_updates_total', worker=i % 2)
+            registry.observe('bot_update_seconds', 0.001)
+            if _ % 100 == 0:
+                registry.render()
+
+    threads = [threading.Thread(target=update, args=(i,))
+               for i in range(threads_count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    total = threads_count * updates
+    text = registry.render()
+    assert f'bot_updates_total{{worker="0"}} {total // 2}' in text
+    assert f'bot_updates_total{{worker="1"}} {total // 2}' in text
+    summary = registry.summary('bot_update_seconds')
+    assert summary.count == total
+    assert summary.total == pytest.approx(total * 0.001)
+
+
+def test_timed_handler_counts_errors():
+    registry = MetricsRegistry()
+
+    async def failing(update, context):
+        raise ValueError
+
+    wrapped = metrics.timed_handler(failing, conversation='test',
+                                    state='entry')
+    original = metrics.registry
+    metrics.registry = registry
+    try:
+        with pytest.raises(ValueError):
+            asyncio.run(wrapped(None, None))
+    finally:
+        metrics.registry = original
+    text = registry.render()
+    assert 'bot_handler_errors_total{handler="failing"} 1' in text
+    assert 'bot_conversation_state_total{conversation="test",' \
+           'state="entry"} 1' in text
+    assert 'bot_handler_seconds_count{handler="failing"} 1' in text
+
+
+def test_metrics_server():
+    registry = MetricsRegistry()
+    registry.inc('bot_sent_total')
+
+    async def get(port, path):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(f'GET {path} HTTP/1.1\r\nHost: x\r\n\r\n'.encode())
+        await writer.drain()
+        response = await reader.read()
+        writer.close()
+        return response.decode()
+
+    async def scenario():
+        server = MetricsServer('127.0.0.1', 0, registry)
+        await server.start()
+        port = server._server.sockets[0].getsockname()[1]
+        try:
+            return await get(port, '/metrics?x=1'), await get(port, '/')
+        finally:
+            await server.stop()
+
+    found, missing = asyncio.run(scenario())
+    assert found.startswith('HTTP/1.1 200 OK')
+    assert found.endswith('bot_sent_total 1\n')
+    assert missing.startswith('HTTP/1.1 404')
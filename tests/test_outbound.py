@@ -0,0 +1,265 @@
+"""Очередь исходящих запросов: лимиты, приоритеты, схлопывание и 429."""
+import asyncio
+import logging
+import time
+from types import SimpleNamespace
+
+import pytest
+from telegram.error import RetryAfter
+
+import utils.outbound
+from utils.outbound import OutboundRateLimiter, TokenBucket
+
+# Погрешность таймеров цикла событий, секунд
+SLACK = 0.01
+
+
+class _Api:
+    """Поддельный Bot API: записывает вызовы и отвечает по сценарию"""
+
+    def __init__(self):
+        self.calls = []
+
+    def method(self, errors=()):
+        errors = list(errors)
+
+        async def callback(*args, **kwargs):
+            self.calls.append((time.monotonic(), kwargs.get('text')))
+            if errors:
+                raise errors.pop(0)
+            return kwargs.get('text')
+
+        return callback
+
+    @property
+    def texts(self):
+        return [text for _, text in self.calls]
+
+    def gaps(self):
+        times = [at for at, _ in self.calls]
+        return [later - earlier for earlier, later in zip(times, times[1:])]
+
+
+def _send(limiter, callback, text, chat_id=None, endpoint='sendMessage',
+          **rate_limit_args):
+    data = {} if chat_id is None else {'chat_id': chat_id, 'message_id': 7}
+    return limiter.process_request(callback, (), {'text': text}, endpoint,
+                                   data, rate_limit_args or None)
+
+
+async def _drain(limiter):
+    """Ждет отправки всего, что ушло в фон"""
+    while limiter._tasks or not limiter._queue.empty():
+        await asyncio.sleep(0.005)
+
+
+def _run(scenario, **limits):
+    async def main():
+        limiter = OutboundRateLimiter(**{
+            'global_rate': 1000, 'chat_rate': 1000, 'chat_burst': 1000,
+            **limits})
+        await limiter.initialize()
+        try:
+            return await scenario(limiter, _Api())
+        finally:
+            await limiter.shutdown()
+
+    return asyncio.run(main())
+
+
+def test_token_bucket(monkeypatch):
+    clock = SimpleNamespace(now=100.0)
+    monkeypatch.setattr(utils.outbound, 'time',
+                        SimpleNamespace(monotonic=lambda: clock.now))
+    bucket = TokenBucket(rate=2, capacity=3)
+    for _ in range(3):
+        asyncio.run(bucket.acquire())
+    assert bucket.delay() == pytest.approx(0.5)
+    clock.now += 0.5
+    assert bucket.delay() == 0 and not bucket.is_full()
+    clock.now += 1.5
+    assert bucket.is_full()
+
+    bucket.block(10)
+    assert bucket.is_blocked() and bucket.delay() == pytest.approx(10)
+    clock.now += 10
+    assert not bucket.is_blocked() and bucket.is_full()
+
+
+def test_chat_and_group_buckets():
+    async def scenario(limiter, api):
+        send = api.method()
+        for i in range(4):
+            await _send(limiter, send, f'личный {i}', 1, wait_result=True)
+        private = api.gaps()
+
+        group_api = _Api()
+        send = group_api.method()
+        for i in range(2):
+            await _send(limiter, send, f'группа {i}', -100, wait_result=True)
+        # Другой чат не ждет ведра переполненного
+        started = time.monotonic()
+        await _send(limiter, api.method(), 'другой', 2, wait_result=True)
+        return private, group_api.gaps(), time.monotonic() - started
+
+    private, group, other = _run(scenario, chat_rate=20, chat_burst=2,
+                                 group_rate=10)
+    # Два сообщения с запаса ведра, дальше не чаще 20 в секунду
+    assert private[0] < 0.05 - SLACK
+    assert all(gap >= 0.05 - SLACK for gap in private[1:])
+    # В группе запаса нет
+    assert len(group) == 1 and group[0] >= 0.1 - SLACK
+    assert other < 0.05
+
+
+def test_global_rate():
+    async def scenario(limiter, api):
+        send = api.method()
+        await asyncio.gather(*(_send(limiter, send, str(i))
+                               for i in range(60)))
+        return api.gaps()
+
+    gaps = _run(scenario, global_rate=50)
+    # 50 запросов с запаса ведра, дальше - не чаще 50 в секунду
+    assert len(gaps) == 59
+    assert sum(gaps[:49]) < 0.05
+    assert all(gap >= 0.02 - SLACK for gap in gaps[49:])
+
+
+def test_priority_order():
+    async def scenario(limiter, api):
+        send = api.method()
+        # Пока бот на паузе, запросы копятся в очереди
+        limiter.global_bucket.block(0.05)
+        await asyncio.gather(
+            _send(limiter, send, 'служебный', endpoint='setMyCommands'),
+            _send(limiter, send, 'обычный'),
+            _send(limiter, send, 'кнопка', endpoint='answerCallbackQuery'),
+            _send(limiter, send, 'срочный', priority=0, wait_result=True))
+        return api.texts
+
+    assert _run(scenario) == ['кнопка', 'срочный', 'обычный', 'служебный']
+
+
+def test_edits_of_one_message_are_coalesced():
+    async def scenario(limiter, api):
+        edit = api.method()
+        limiter.global_bucket.block(0.05)
+        results = await asyncio.gather(*(
+            _send(limiter, edit, text, 1, endpoint='editMessageText',
+                  wait_result=True)
+            for text in ('1 из 3', '2 из 3', '3 из 3')))
+        return results, api.texts, limiter.counters()
+
+    results, texts, counters = _run(scenario)
+    # Отправлена только последняя правка, ее результат получают все
+    assert texts == ['3 из 3']
+    assert results == ['3 из 3'] * 3
+    assert counters['coalesced_total'] == 2
+    assert counters['sent_total'] == 1
+
+
+def test_retry_after_is_retried_then_given_up():
+    async def scenario(limiter, api):
+        started = time.monotonic()
+        result = await _send(limiter, api.method([RetryAfter(0.05)]),
+                             'ответ', endpoint='getChat')
+        elapsed = time.monotonic() - started
+
+        failing = _Api()
+        with pytest.raises(RetryAfter):
+            await _send(limiter, failing.method([RetryAfter(0.01)] * 5),
+                        'ответ', endpoint='getChat')
+        return result, elapsed, len(api.calls), len(failing.calls), \
+            limiter.counters()['retries_total']
+
+    result, elapsed, calls, failing_calls, retries = _run(scenario,
+                                                          max_retries=2)
+    assert result == 'ответ' and calls == 2
+    assert elapsed >= 0.05 - SLACK
+    assert failing_calls == 3
+    assert retries == 1 + 2
+
+
+def test_handler_is_released_before_backoff(caplog):
+    async def scenario(limiter, api):
+        send = api.method([RetryAfter(0.2)])
+        started = time.monotonic()
+        first = await _send(limiter, send, 'первое', 1)
+        # Чат на паузе - следующее сообщение тоже уходит в фон
+        second = await _send(limiter, send, 'второе', 1)
+        released = time.monotonic() - started
+        await _drain(limiter)
+
+        lost = _Api()
+        dropped = await _send(limiter, lost.method([RetryAfter(0.01)] * 5),
+                              'потеряно', 2)
+        await _drain(limiter)
+        return (first, second, dropped, released, api.texts, api.gaps(),
+                limiter.counters())
+
+    caplog.set_level(logging.WARNING, 'utils.outbound')
+    first, second, dropped, released, texts, gaps, counters = _run(
+        scenario, max_retries=1)
+    assert (first, second, dropped) == (True, True, True)
+    assert released < 0.1
+    # Порядок в чате сохраняется, повтор - после паузы
+    assert texts == ['первое', 'первое', 'второе']
+    assert gaps[0] >= 0.2 - SLACK
+    assert counters['sent_total'] == 2
+    assert counters['dropped_total'] == 1
+    assert 'не отправлен' in caplog.text
+
+
+def test_detached_sends_keep_chat_order():
+    async def scenario(limiter, api):
+        send = api.method()
+        started = time.monotonic()
+        results = [await _send(limiter, send, f'сообщение {i}', 1)
+                   for i in range(3)]
+        released = time.monotonic() - started
+        # Запрос, результат которого нужен, ждет отправки предыдущих
+        last = await _send(limiter, send, 'документ', 1,
+                           endpoint='sendDocument')
+        return results, released, last, api.texts, api.gaps()
+
+    results, released, last, texts, gaps = _run(scenario, chat_rate=20,
+                                                chat_burst=1)
+    assert results == ['сообщение 0', True, True]
+    assert released < 0.05
+    assert last == 'документ'
+    assert texts == ['сообщение 0', 'сообщение 1', 'сообщение 2', 'документ']
+    assert all(gap >= 0.05 - SLACK for gap in gaps)
+
+
+def test_shutdown_stops_dispatcher_and_fails_pending_sends():
+    async def scenario():
+        limiter = OutboundRateLimiter(global_rate=1000, chat_rate=1000,
+                                      chat_burst=1000)
+        # Application и Updater инициализируют бота каждый по разу
+        await limiter.initialize()
+        await limiter.initialize()
+        started = asyncio.Event()
+
+        async def hanging_send():
+            started.set()
+            await asyncio.Event().wait()
+
+        async def sent():
+            return True
+
+        assert await limiter.process_request(
+            sent, (), {}, 'sendMessage', {'chat_id': 1}, None)
+
+        send = asyncio.create_task(limiter.process_request(
+            hanging_send, (), {}, 'sendMessage', {'chat_id': 1}, None))
+        await started.wait()
+        await limiter.shutdown()
+
+        with pytest.raises(RuntimeError):
+            await send
+        # После остановки не остается задач ограничителя
+        return [task for task in asyncio.all_tasks()
+                if task is not asyncio.current_task()]
+
+    assert asyncio.run(scenario()) == []
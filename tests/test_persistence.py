@@ -0,0 +1,122 @@
+import asyncio
+import sqlite3
+import threading
+
+import pytest
+
+import database.persistence
+from database.persistence import SQLitePersistence
+
+
+def _stored_user_data(db_path):
+    """user_data, которые бот прочитает после перезапуска"""
+    return asyncio.run(SQLitePersistence(db_path).get_user_data())
+
+
+def test_user_data_survives_restart(tmp_path):
+    db_path = str(tmp_path / 'persistence.db')
+
+    async def scenario():
+        persistence = SQLitePersistence(db_path)
+        await persistence.update_user_data(1, {'step': 1})
+        await persistence.update_user_data(2, {'step': 2})
+        await persistence.flush()
+        await persistence.drop_user_data(2)
+        await persistence.flush()
+
+    asyncio.run(scenario())
+    assert _stored_user_data(db_path) == {1: {'step': 1}}
+
+
+def test_change_back_during_write_is_saved(tmp_path):
+    """S0 -> S1 -> S0: возврат к S0 во время записи S1 не теряется"""
+    db_path = str(tmp_path / 'persistence.db')
+    persistence = SQLitePersistence(db_path)
+    write_batch = persistence._write_batch
+    writing = threading.Event()
+    release = threading.Event()
+
+    def slow_write_batch(batch):
+        writing.set()
+        release.wait(10)
+        write_batch(batch)
+
+    async def scenario():
+        await persistence.update_user_data(1, {'state': 0})
+        await persistence.flush()
+
+        persistence._write_batch = slow_write_batch
+        await persistence.update_user_data(1, {'state': 1})
+        await asyncio.to_thread(writing.wait, 10)
+        # Пачка с S1 пишется, а пользователь уже вернулся к S0
+        await persistence.update_user_data(1, {'state': 0})
+        release.set()
+        await persistence.flush()
+
+    asyncio.run(scenario())
+    assert _stored_user_data(db_path) == {1: {'state': 0}}
+
+
+def _failing_write(persistence, failures):
+    """Первые failures записей падают; пока первая запись идет, ждем
+    release. Возвращает (writing, release)"""
+    write_batch = persistence._write_batch
+    writing = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def write(batch):
+        calls.append(batch)
+        if len(calls) == 1:
+            writing.set()
+            release.wait(10)
+        if len(calls) <= failures:
+            raise sqlite3.OperationalError('database is locked')
+        write_batch(batch)
+
+    persistence._write_batch = write
+    return writing, release
+
+
+@pytest.mark.parametrize('failures, stored', [
+    (1, {1: {'step': 1}}),
+    (100, {}),
+])
+def test_flush_during_failing_write_does_not_hang(tmp_path, caplog, failures,
+                                                  stored):
+    db_path = str(tmp_path / 'persistence.db')
+    persistence = SQLitePersistence(db_path)
+    writing, release = _failing_write(persistence, failures)
+
+    async def scenario():
+        await persistence.update_user_data(1, {'step': 1})
+        await asyncio.to_thread(writing.wait, 10)
+        # Остановка бота приходит, пока запись задачи еще идет
+        flush = asyncio.create_task(persistence.flush())
+        await asyncio.sleep(0.01)
+        release.set()
+        await asyncio.wait_for(flush, 5)
+
+    asyncio.run(scenario())
+    # Одна неудачная запись задачи и одна последняя попытка flush
+    assert _stored_user_data(db_path) == stored
+    if not stored:
+        assert 'потеряно записей: 1' in caplog.text
+
+
+def test_flush_while_backing_off(tmp_path, monkeypatch):
+    monkeypatch.setattr(database.persistence, 'FLUSH_RETRY_DELAY', 60)
+    db_path = str(tmp_path / 'persistence.db')
+    persistence = SQLitePersistence(db_path)
+    writing, release = _failing_write(persistence, 1)
+    release.set()
+
+    async def scenario():
+        await persistence.update_user_data(1, {'step': 1})
+        await asyncio.to_thread(writing.wait, 10)
+        while not persistence._backing_off:
+            await asyncio.sleep(0.01)
+        await asyncio.wait_for(persistence.flush(), 5)
+
+    asyncio.run(scenario())
+    assert _stored_user_data(db_path) == {1: {'step': 1}}
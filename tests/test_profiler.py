@@ -0,0 +1,136 @@
+"""Профилировщик SQL-запросов и команда /slow_queries."""
+import asyncio
+import json
+import logging
+from types import SimpleNamespace
+
+import pytest
+
+from config.settings import Config
+from database.models import MathProblemsDB
+from database.profiler import QueryProfiler, normalize_sql
+from handlers.admin import slow_queries
+from utils.services import SERVICES_KEY, Services
+
+ADMIN_ID = 1
+
+PROBLEM_SQL = 'SELECT problem_text FROM problems WHERE problem_number = ?'
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    db_path = str(tmp_path / 'math_problems.db')
+    db = MathProblemsDB(db_path)
+    conn = db._connect()
+    with conn:
+        conn.execute("INSERT INTO sections (id, name) VALUES (1, 'Дроби')")
+        conn.executemany(
+            'INSERT INTO problems (section_id, problem_number, problem_text, '
+            'answer) VALUES (1, ?, ?, ?)',
+            [(number, f'Задача {number}', str(number)) for number in (1, 2, 3)])
+    conn.close()
+    db.close()
+    return db_path
+
+
+def _slow_log(caplog):
+    return [json.loads(record.getMessage()) for record in caplog.records
+            if record.name == 'database.slow_queries']
+
+
+def test_normalize_sql_merges_literals():
+    assert normalize_sql(
+        "SELECT *  FROM t\n WHERE a = 5 AND b = 'x''y' AND c IN (?, ?, ?)") \
+        == 'SELECT * FROM t WHERE a = ? AND b = ? AND c IN (?)'
+    assert normalize_sql('SELECT 1.5') == normalize_sql('SELECT 2')
+
+
+def test_only_queries_over_threshold_are_slow(db_path, caplog):
+    profiler = QueryProfiler(db_path, slow_threshold_ms=50)
+    caplog.set_level(logging.WARNING, 'database.slow_queries')
+
+    profiler.record(PROBLEM_SQL, (1,), 0.049, 1)
+    assert _slow_log(caplog) == []
+
+    profiler.record(PROBLEM_SQL, (2,), 0.05, 1)
+    profiler.record(PROBLEM_SQL, (3,), 0.2, 0)
+    [stats] = profiler.top()
+    assert (stats['count'], stats['slow'], stats['rows']) == (3, 2, 2)
+    assert stats['max_ms'] == 200.0
+    assert stats['total_ms'] == pytest.approx(299.0)
+    assert stats['avg_ms'] == pytest.approx(99.667, abs=0.001)
+
+    logged = _slow_log(caplog)
+    assert [entry['duration_ms'] for entry in logged] == [50.0, 200.0]
+    assert logged[0]['sql'] == PROBLEM_SQL
+    # План первого медленного запроса сохраняется всегда
+    assert logged[0]['plan'] and stats['plan'] == logged[0]['plan']
+
+
+def test_plan_sampling(db_path, caplog, monkeypatch):
+    profiler = QueryProfiler(db_path, slow_threshold_ms=0,
+                             explain_sample_rate=0)
+    caplog.set_level(logging.WARNING, 'database.slow_queries')
+    for number in (1, 2, 3):
+        profiler.record(PROBLEM_SQL, (number,), 0.001, 1)
+    assert [entry['plan'] is not None for entry in _slow_log(caplog)] == \
+        [True, False, False]
+
+    # Запрос, который нельзя объяснить, не ломает учет
+    profiler.record('PRAGMA foo', None, 0.001, 0)
+    assert profiler.top(key='count')[0]['count'] == 3
+
+
+def test_top_orders_and_limits(db_path):
+    profiler = QueryProfiler(db_path, slow_threshold_ms=1000)
+    profiler.record('SELECT 1', None, 0.001, 1)
+    for _ in range(3):
+        profiler.record('SELECT 2 FROM problems', None, 0.002, 5)
+    profiler.record('SELECT 3 FROM sections', None, 0.01, 0)
+
+    assert [item['count'] for item in profiler.top(key='count')] == [3, 1, 1]
+    assert [item['sql'] for item in profiler.top(1, key='max')] == \
+        ['SELECT ? FROM sections']
+    assert profiler.top(1)[0]['total_ms'] == pytest.approx(10.0)
+    profiler.reset()
+    assert profiler.top() == []
+
+
+def test_database_queries_are_profiled(db_path):
+    profiler = QueryProfiler(db_path, slow_threshold_ms=1000)
+    db = MathProblemsDB(db_path, profiler=profiler)
+    profiler.reset()
+
+    assert db.get_problem_by_number(2)[0] == 2
+    assert db.get_problem_by_number(3)[0] == 3
+    assert db.get_problem_by_number(9) is None
+    db.close()
+
+    [stats] = [item for item in profiler.top()
+               if 'FROM problems p' in item['sql']]
+    assert (stats['count'], stats['rows'], stats['slow']) == (3, 2, 0)
+
+
+def test_slow_queries_notes_worker_slice(db_path, monkeypatch):
+    services = Services.build(db_path, profile_sql=True)
+    services.db.get_problem_by_number(1)
+    monkeypatch.setattr(Config, 'ADMIN_IDS', [ADMIN_ID])
+    replies = []
+
+    async def reply_text(text, **kwargs):
+        replies.append(text)
+
+    update = SimpleNamespace(effective_user=SimpleNamespace(id=ADMIN_ID),
+                             message=SimpleNamespace(reply_text=reply_text))
+    context = SimpleNamespace(args=['5'], bot_data={SERVICES_KEY: services})
+
+    monkeypatch.setattr(Config, 'WORKERS', 1)
+    asyncio.run(slow_queries(update, context))
+    monkeypatch.setattr(Config, 'WORKERS', 3)
+    asyncio.run(slow_queries(update, context))
+    services.db.close()
+
+    single, workers = replies
+    assert 'FROM problems p' in single and 'рабочих процессов' not in single
+    assert 'одного из 3 рабочих процессов' in workers
+    assert len(workers) <= 4000
@@ -0,0 +1,75 @@
+"""Сброс статистики пользователя при нескольких процессах бота.
+
+Каждый процесс держит свой прогресс и счетчики задач в памяти; два
+экземпляра хранилищ над одной базой ведут себя как два процесса.
+"""
+import pytest
+
+from database.catalog import ProblemCatalog
+from database.models import MathProblemsDB
+from database.progress import ProgressStore
+from utils.services import Services
+
+USER_ID = 42
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    db_path = str(tmp_path / 'math_problems.db')
+    db = MathProblemsDB(db_path)
+    conn = db._connect()
+    with conn:
+        conn.execute("INSERT INTO sections (id, name) VALUES (1, 'Дроби')")
+        conn.executemany(
+            'INSERT INTO problems (section_id, problem_number, problem_text, '
+            'answer) VALUES (1, ?, ?, ?)',
+            [(number, f'Задача {number}', str(number)) for number in (1, 2, 3)])
+    conn.close()
+    db.close()
+    return db_path
+
+
+def _solve(db, progress, problem_number, is_correct=True):
+    with db._transaction(USER_ID) as cursor:
+        db.add_user_attempt(USER_ID, problem_number, '1', '1', is_correct,
+                            cursor=cursor)
+        progress.record_attempt(USER_ID, problem_number, is_correct,
+                                cursor=cursor)
+
+
+def test_forget_is_seen_by_other_process(db_path):
+    db = MathProblemsDB(db_path)
+    catalog = ProblemCatalog.load(db)
+    pupil_worker = ProgressStore(db, catalog)
+    admin_worker = ProgressStore(db, catalog)
+    first = pupil_worker.ordinals[1]
+
+    _solve(db, pupil_worker, 1)
+    assert pupil_worker.get(USER_ID).is_solved(first)
+
+    db.delete_user_attempts(USER_ID)
+    admin_worker.forget(USER_ID)
+
+    # Следующая попытка в процессе ученика не возвращает старые биты
+    progress = pupil_worker.record_attempt(USER_ID, 2, False)
+    assert not progress.is_solved(first)
+    restarted = ProgressStore(db, catalog)
+    assert not restarted.get(USER_ID).is_solved(first)
+    assert restarted.get(USER_ID).is_attempted(restarted.ordinals[2])
+    db.close()
+
+
+def test_clear_reloads_problem_stats_in_other_process(db_path):
+    pupil_worker = Services.build(db_path)
+    pupil_worker.load_catalog()
+    admin_worker = Services.build(db_path)
+    admin_worker.load_catalog()
+
+    _solve(pupil_worker.db, pupil_worker.progress, 1, is_correct=False)
+    pupil_worker.adaptive.record(1, False)
+    assert pupil_worker.adaptive.counts[1] == [1, 0]
+
+    admin_worker.db.delete_user_attempts(USER_ID)
+    assert pupil_worker.refresh_adaptive().counts[1] == [0, 0]
+    pupil_worker.db.close()
+    admin_worker.db.close()
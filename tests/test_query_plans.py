@@ -0,0 +1,38 @@
+import sqlite3
+
+import pytest
+
+from database.archive import ensure_archive_table
+from database.models import MathProblemsDB
+from database.query_plans import check_query_plans
+
+
+@pytest.fixture
+def conn(tmp_path):
+    """Пустая база со всеми миграциями и одним архивом попыток"""
+    db_path = str(tmp_path / 'math_problems.db')
+    MathProblemsDB(db_path).close()
+    conn = sqlite3.connect(db_path)
+    with conn:
+        ensure_archive_table(conn.cursor(), '2024-01')
+    yield conn
+    conn.close()
+
+
+def test_hot_queries_use_indexes(conn):
+    full_scans = {name: plan for name, plan, full_scan
+                  in check_query_plans(conn) if full_scan}
+    assert full_scans == {}
+
+
+def test_attempts_by_date_reads_archives(conn):
+    plans = {name: plan for name, plan, _ in check_query_plans(conn)}
+    assert any('user_attempts_archive_2024_01' in detail
+               for detail in plans['get_user_attempts_by_date'])
+
+
+def test_full_scan_is_detected(conn):
+    conn.execute('DROP INDEX idx_user_stats_leaderboard')
+    results = {name: full_scan for name, _, full_scan
+               in check_query_plans(conn)}
+    assert results['get_leaderboard']
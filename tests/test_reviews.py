@@ -0,0 +1,129 @@
+"""Интервальное повторение: переходы SM-2 и перенос старых попыток."""
+import sqlite3
+from datetime import date, datetime
+
+import pytest
+
+from database import migrations
+from database.models import MathProblemsDB
+from database.reviews import MIN_EASE, ReviewScheduler, next_review
+
+USER_ID = 42
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = MathProblemsDB(str(tmp_path / 'math_problems.db'))
+    yield db
+    db.close()
+
+
+def _schedule(db, problem_number=1):
+    conn = db._connect(USER_ID)
+    try:
+        return conn.execute('''
+            SELECT repetitions, interval_days, ease, due_at, reviewed_at
+            FROM review_schedule WHERE user_id = ? AND problem_number = ?
+        ''', (USER_ID, problem_number)).fetchone()
+    finally:
+        conn.close()
+
+
+def test_next_review_intervals():
+    assert next_review(0, 0, 2.5, 5) == (1, 1, pytest.approx(2.6))
+    assert next_review(1, 1, 2.6, 5) == (2, 6, pytest.approx(2.7))
+    assert next_review(2, 6, 2.7, 5) == (3, 16, pytest.approx(2.8))
+    # Ошибка сбрасывает серию и снижает легкость
+    assert next_review(3, 16, 2.8, 2) == (0, 1, pytest.approx(2.48))
+    assert next_review(0, 1, MIN_EASE, 2) == (0, 1, MIN_EASE)
+
+
+def test_record_follows_sm2(db):
+    reviews = ReviewScheduler(db)
+    steps = [
+        # (время попытки, верно, повторений, интервал, легкость, срок)
+        (datetime(2024, 3, 1, 10), True, 1, 1, 2.6, '2024-03-02 10:00:00'),
+        (datetime(2024, 3, 2, 9), True, 2, 6, 2.7, '2024-03-08 09:00:00'),
+        (datetime(2024, 3, 8, 20), True, 3, 16, 2.8, '2024-03-24 20:00:00'),
+        (datetime(2024, 3, 24, 8), False, 0, 1, 2.48, '2024-03-25 08:00:00'),
+        (datetime(2024, 3, 25, 8), True, 1, 1, 2.58, '2024-03-26 08:00:00'),
+    ]
+    for now, is_correct, repetitions, interval_days, ease, due_at in steps:
+        reviews.record(USER_ID, 1, is_correct, now=now)
+        assert _schedule(db)[:4] == (repetitions, interval_days,
+                                     pytest.approx(ease), due_at), now
+
+
+def test_same_day_attempts(db):
+    reviews = ReviewScheduler(db)
+    reviews.record(USER_ID, 1, True, now=datetime(2024, 3, 1, 10))
+    first = _schedule(db)
+
+    # Верный ответ в тот же день не оценивается повторно
+    reviews.record(USER_ID, 1, True, now=datetime(2024, 3, 1, 11))
+    assert _schedule(db) == first
+
+    # Неверный - возвращает задачу на завтра без изменения легкости
+    reviews.record(USER_ID, 1, False, now=datetime(2024, 3, 1, 12))
+    assert _schedule(db)[:4] == (0, 1, pytest.approx(2.6),
+                                 '2024-03-02 12:00:00')
+
+
+def test_due_and_plans(db):
+    reviews = ReviewScheduler(db)
+    reviews.record(USER_ID, 1, True, now=datetime(2024, 3, 1, 10))
+    reviews.record(USER_ID, 2, False, now=datetime(2024, 3, 1, 9))
+    reviews.record(USER_ID, 3, True, now=datetime(2024, 3, 2, 9))
+
+    assert reviews.next_due(USER_ID, date(2024, 3, 1)) is None
+    # Задача 2 просрочена раньше задачи 1
+    assert reviews.next_due(USER_ID, date(2024, 3, 2)) == 2
+    assert reviews.due_counts(USER_ID, date(2024, 3, 2)) == (2, None)
+
+    assert reviews.build_plans(date(2024, 3, 2)) == 3
+    assert reviews.due_counts(USER_ID, date(2024, 3, 2)) == (2, 2)
+    assert reviews.due_counts(USER_ID, date(2024, 3, 3)) == (3, 3)
+
+
+def test_migration_backfills_schedule(tmp_path, monkeypatch):
+    conn = sqlite3.connect(str(tmp_path / 'math_problems.db'))
+    monkeypatch.setattr(migrations, 'MIGRATIONS', migrations.MIGRATIONS[:8])
+    migrations.apply_migrations(conn)
+    with conn:
+        conn.executemany('''
+            INSERT INTO user_attempts
+                (user_id, problem_number, user_answer, correct_answer,
+                 is_correct, solved_at)
+            VALUES (?, ?, '1', '1', ?, ?)
+        ''', [
+            (USER_ID, 1, False, '2024-03-01 10:00:00'),
+            (USER_ID, 1, True, '2024-03-01 10:05:00'),
+            (USER_ID, 2, False, '2024-03-02 11:00:00'),
+            (USER_ID, 3, True, None),
+            (USER_ID, None, True, '2024-03-02 12:00:00'),
+        ])
+        # Задача 2 решалась раньше, эти попытки уже в архиве
+        conn.executemany('''
+            INSERT INTO user_problem_rollup
+                (user_id, problem_number, attempts, correct_attempts,
+                 first_attempt_at, last_attempt_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', [(USER_ID, 2, 2, 1, '2024-01-10 09:00:00',
+               '2024-01-10 09:10:00'),
+              (USER_ID, 4, 1, 0, '2024-01-11 09:00:00',
+               '2024-01-11 09:00:00')])
+
+    monkeypatch.undo()
+    migrations.apply_migrations(conn)
+    rows = conn.execute('''
+        SELECT problem_number, repetitions, interval_days, ease, due_at,
+               reviewed_at
+        FROM review_schedule WHERE user_id = ? ORDER BY problem_number
+    ''', (USER_ID,)).fetchall()
+    conn.close()
+
+    assert rows == [
+        (1, 1, 1, 2.5, '2024-03-02 10:05:00', '2024-03-01 10:05:00'),
+        (2, 1, 1, 2.5, '2024-03-03 11:00:00', '2024-03-02 11:00:00'),
+        (4, 0, 1, 2.5, '2024-01-12 09:00:00', '2024-01-11 09:00:00'),
+    ]
@@ -0,0 +1,70 @@
+"""Сохраненные результаты поиска и их срок жизни."""
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import utils.search_sessions
+from handlers.search import show_search_page
+from utils.search_sessions import SearchSessions
+from utils.services import SERVICES_KEY, Services
+
+TTL = 600
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Управляемое время вместо time.monotonic"""
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(utils.search_sessions, 'time',
+                        SimpleNamespace(monotonic=lambda: clock.now))
+    return clock
+
+
+def test_session_expires_after_ttl(clock):
+    sessions = SearchSessions(TTL)
+    session = sessions.create(1, 'скорость', [3, 1, 2])
+    assert session.problem_numbers == (3, 1, 2)
+
+    clock.now += TTL
+    assert sessions.get(1, session.session_id) == session
+    clock.now += 0.001
+    assert sessions.get(1, session.session_id) is None
+    assert sessions._sessions == {}
+
+
+def test_new_search_replaces_old(clock):
+    sessions = SearchSessions(TTL)
+    old = sessions.create(1, 'скорость', [1])
+    new = sessions.create(1, 'площадь', [2])
+    assert new.session_id != old.session_id
+    assert sessions.get(1, old.session_id) is None
+    assert sessions.get(1, new.session_id) == new
+
+
+def test_create_prunes_expired_sessions(clock):
+    sessions = SearchSessions(TTL)
+    for user_id in (1, 2, 3):
+        sessions.create(user_id, 'скорость', [user_id])
+        clock.now += 100
+    # Повторный поиск переставляет пользователя 1 в конец
+    sessions.create(1, 'площадь', [1])
+
+    clock.now += TTL - 150
+    sessions.create(4, 'процент', [4])
+    assert list(sessions._sessions) == [3, 1, 4]
+    clock.now += 100
+    sessions.create(5, 'процент', [5])
+    assert list(sessions._sessions) == [1, 4, 5]
+
+
+def test_expired_page_asks_to_search_again(clock, fake_update, fake_context):
+    services = Services(None, search_session_ttl=TTL)
+    session = services.search_sessions.create(1, 'скорость', [1, 2])
+    fake_context.bot_data[SERVICES_KEY] = services
+
+    clock.now += TTL + 1
+    asyncio.run(show_search_page(fake_update, fake_context,
+                                 session.session_id, 0))
+    [(text, _)] = fake_update.replies
+    assert text == "⌛ Результаты поиска устарели. Повторите поиск: /search"
@@ -0,0 +1,97 @@
+"""Число задач и решенных задач по разделам."""
+import asyncio
+
+import pytest
+
+from database.archive import AttemptArchiver
+from database.progress import ProgressStore
+from handlers.problems import sections
+from utils.services import SERVICES_KEY, Services
+
+USER_ID = 42
+# id раздела -> (название, номера задач)
+SECTIONS = {1: ('Дроби', (1, 2, 3)), 2: ('Проценты', (4, 5)),
+            3: ('Пустой', ())}
+
+
+@pytest.fixture
+def services(tmp_path):
+    services = Services.build(str(tmp_path / 'math_problems.db'))
+    conn = services.db._connect()
+    with conn:
+        conn.executemany('INSERT INTO sections (id, name) VALUES (?, ?)',
+                         [(section_id, name)
+                          for section_id, (name, _) in SECTIONS.items()])
+        conn.executemany(
+            'INSERT INTO problems (section_id, problem_number, problem_text, '
+            'answer) VALUES (?, ?, ?, ?)',
+            [(section_id, number, f'Задача {number}', str(number))
+             for section_id, (_, numbers) in SECTIONS.items()
+             for number in numbers])
+    conn.close()
+    services.load_catalog()
+    yield services
+    services.db.close()
+
+
+def _answer(services, problem_number, is_correct, solved_at=None):
+    db = services.db
+    with db._transaction(USER_ID) as cursor:
+        db.add_user_attempt(USER_ID, problem_number, '1', '1', is_correct,
+                            cursor=cursor)
+        if solved_at:
+            cursor.execute('''
+                UPDATE user_attempts SET solved_at = ?
+                WHERE id = (SELECT MAX(id) FROM user_attempts)
+            ''', (solved_at,))
+        services.progress.record_attempt(USER_ID, problem_number, is_correct,
+                                         cursor=cursor)
+
+
+def test_section_counts(services):
+    assert services.catalog.section_counts == {1: 3, 2: 2, 3: 0}
+
+
+def test_solved_counts_by_section(services):
+    progress = services.progress
+    assert progress.section_solved_counts(USER_ID) == {1: 0, 2: 0, 3: 0}
+
+    _answer(services, 1, False)
+    _answer(services, 1, True)
+    _answer(services, 1, True)
+    _answer(services, 2, False)
+    _answer(services, 5, True)
+    # Задачи нет в каталоге - в разделы она не попадает
+    _answer(services, 99, True)
+    assert progress.section_solved_counts(USER_ID) == {1: 1, 2: 1, 3: 0}
+    assert progress.get(USER_ID).attempted_count == 3
+
+
+def test_solved_counts_rebuilt_from_archive(services):
+    _answer(services, 1, True, '2024-01-10 10:00:00')
+    _answer(services, 4, False, '2024-01-10 10:05:00')
+    _answer(services, 4, True, '2024-01-10 10:10:00')
+    _answer(services, 2, True)
+    AttemptArchiver(services.db.db_path).archive_before('2024-02-01 00:00:00')
+
+    # Новый процесс без прогресса в базе пересчитывает его по попыткам
+    # и сводкам архива
+    conn = services.db._connect(USER_ID)
+    with conn:
+        conn.execute('DELETE FROM user_progress_bits')
+    conn.close()
+    restarted = ProgressStore(services.db, services.catalog)
+    assert restarted.section_solved_counts(USER_ID) == {1: 2, 2: 1, 3: 0}
+
+
+def test_sections_screen(services, fake_update, fake_context):
+    _answer(services, 2, True)
+    _answer(services, 3, False)
+    fake_update.effective_user.id = USER_ID
+    fake_context.bot_data[SERVICES_KEY] = services
+    asyncio.run(sections(fake_update, fake_context))
+
+    [(text, _)] = fake_update.replies
+    assert '• Дроби - 3 задач (решено 1, 33%)' in text
+    assert '• Проценты - 2 задач (решено 0, 0%)' in text
+    assert '• Пустой - 0 задач (решено 0, 0%)' in text
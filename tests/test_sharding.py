@@ -0,0 +1,202 @@
+"""Данные пользователей в нескольких шардах.
+
+Одни и те же пользователи записываются в базу из одного файла и в базу
+из трех шардов; запросы по всем пользователям должны возвращать
+одинаковый результат.
+"""
+import sqlite3
+
+import pytest
+
+from database.archive import AttemptArchiver
+from database.models import MathProblemsDB
+from database.sharding import USER_TABLES, adopt_legacy_database, reshard, \
+    shard_index, shard_paths
+
+USER_IDS = list(range(101, 113))
+
+
+def _add_content(db):
+    conn = db._connect()
+    with conn:
+        conn.execute("INSERT INTO sections (id, name) VALUES (1, 'Дроби')")
+        conn.executemany(
+            'INSERT INTO problems (section_id, problem_number, problem_text, '
+            'answer) VALUES (1, ?, ?, ?)',
+            [(number, f'Задача {number}', str(number)) for number in (1, 2, 3)])
+    conn.close()
+
+
+def _add_users(db):
+    """Пользователи с разными (без равенств) показателями"""
+    for i, user_id in enumerate(USER_IDS):
+        with db._transaction(user_id) as cursor:
+            cursor.execute('''
+                INSERT INTO user_stats
+                    (user_id, username, first_name, total_attempts,
+                     correct_attempts, unique_solved_problems, last_activity)
+                VALUES (?, ?, 'Ученик', ?, ?, ?, ?)
+            ''', (user_id, f'pupil{user_id}', 5 + i, i, i * 7 % 12,
+                  f'2024-03-{1 + i * 5 % 12:02d} 10:00:00'))
+
+
+def _add_attempts(db):
+    for user_id in USER_IDS:
+        for problem_number in (1, 2, 3):
+            with db._transaction(user_id) as cursor:
+                db.add_user_attempt(user_id, problem_number, '1', '1',
+                                    problem_number != 2, cursor=cursor)
+                # Половина попыток достаточно старая для архива
+                if user_id % 2:
+                    cursor.execute('''
+                        UPDATE user_attempts SET solved_at = '2024-01-10'
+                        WHERE id = (SELECT MAX(id) FROM user_attempts)
+                    ''')
+
+
+def _row_counts(db):
+    """Число строк каждой таблицы пользователей по всем шардам"""
+    counts = dict.fromkeys(USER_TABLES, 0)
+    for path in db.user_db_paths:
+        conn = sqlite3.connect(path)
+        try:
+            for table in USER_TABLES:
+                counts[table] += conn.execute(
+                    f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+            for (table,) in conn.execute(
+                    'SELECT table_name FROM attempt_archives').fetchall():
+                counts[table] = counts.get(table, 0) + conn.execute(
+                    f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+        finally:
+            conn.close()
+    return counts
+
+
+def _user_view(db, user_id):
+    return (db.get_user_attempts_count(user_id, 1),
+            db.get_user_attempts_count(user_id, 2),
+            db.get_user_stats(user_id)['unique_solved_problems'],
+            db.count_user_attempts_by_date(user_id, '2024-01-10'))
+
+
+def test_shard_index_is_stable():
+    # Номер шарда хранится неявно в расположении данных, поэтому
+    # функция не должна меняться между версиями
+    assert [shard_index(user_id, 4) for user_id in (1, 2, 3, 123456789)] \
+        == [1, 2, 3, 1]
+    assert [shard_index(user_id, 3) for user_id in (1, 2, 3, 123456789)] \
+        == [1, 1, 2, 0]
+    assert shard_index('42', 3) == shard_index(42, 3)
+    assert {shard_index(user_id, 3) for user_id in USER_IDS} == {0, 1, 2}
+
+
+def test_shard_paths_next_to_main_database(tmp_path):
+    db_path = str(tmp_path / 'math_problems.db')
+    assert shard_paths(db_path, 1) == [db_path]
+    assert shard_paths(db_path, 2) == [
+        str(tmp_path / 'math_problems.shard0.db'),
+        str(tmp_path / 'math_problems.shard1.db')]
+
+
+def test_legacy_database_is_adopted(tmp_path):
+    legacy_path = str(tmp_path / 'math_problems.db')
+    legacy = MathProblemsDB(legacy_path)
+    _add_content(legacy)
+    _add_users(legacy)
+    views = {user_id: _user_view(legacy, user_id) for user_id in USER_IDS}
+    legacy.close()
+
+    (tmp_path / 'data').mkdir()
+    db_path = str(tmp_path / 'data' / 'math_problems.db')
+    assert adopt_legacy_database(db_path, legacy_path)
+    db = MathProblemsDB(db_path)
+    assert {user_id: _user_view(db, user_id) for user_id in USER_IDS} == views
+    assert len(db.get_leaderboard(100)) == len(USER_IDS)
+
+    # База на новом месте уже есть - старый файл больше не копируется
+    with db._transaction(USER_IDS[0]) as cursor:
+        cursor.execute('DELETE FROM user_stats')
+    assert not adopt_legacy_database(db_path, legacy_path)
+    assert db.get_leaderboard(100) == []
+    db.close()
+
+
+def test_nothing_to_adopt(tmp_path):
+    db_path = str(tmp_path / 'math_problems.db')
+    assert not adopt_legacy_database(db_path, str(tmp_path / 'missing.db'))
+    assert not adopt_legacy_database(db_path, None)
+    assert not adopt_legacy_database(db_path, db_path)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_reshard_round_trip_keeps_rows(tmp_path):
+    db_path = str(tmp_path / 'math_problems.db')
+    db = MathProblemsDB(db_path)
+    _add_content(db)
+    _add_users(db)
+    _add_attempts(db)
+    AttemptArchiver(db_path).archive_before('2024-02-01 00:00:00')
+    counts = _row_counts(db)
+    views = {user_id: _user_view(db, user_id) for user_id in USER_IDS}
+    problem_stats = db.get_problem_stats()
+    db.close()
+    assert counts['user_attempts'] == counts['user_attempts_archive_2024_01']
+
+    reshard(db_path, 3)
+    sharded = MathProblemsDB(db_path, shard_count=3)
+    assert _row_counts(sharded) == counts
+    assert {user_id: _user_view(sharded, user_id)
+            for user_id in USER_IDS} == views
+    assert sharded.get_problem_stats() == problem_stats
+    # Каждый пользователь лежит только в своем шарде
+    for user_id in USER_IDS:
+        for i, path in enumerate(sharded.user_db_paths):
+            conn = sqlite3.connect(path)
+            rows = conn.execute(
+                'SELECT COUNT(*) FROM user_stats WHERE user_id = ?',
+                (user_id,)).fetchone()[0]
+            conn.close()
+            assert rows == (i == shard_index(user_id, 3))
+    sharded.close()
+
+    with pytest.raises(ValueError):
+        MathProblemsDB(db_path)
+
+    reshard(db_path, 1)
+    single = MathProblemsDB(db_path)
+    assert _row_counts(single) == counts
+    assert {user_id: _user_view(single, user_id)
+            for user_id in USER_IDS} == views
+    assert single.get_problem_stats() == problem_stats
+    single.close()
+
+
+@pytest.fixture
+def databases(tmp_path):
+    """(база из одного файла, база из трех шардов) с одними данными"""
+    single = MathProblemsDB(str(tmp_path / 'single.db'))
+    sharded = MathProblemsDB(str(tmp_path / 'sharded.db'), shard_count=3)
+    for db in (single, sharded):
+        _add_content(db)
+        _add_users(db)
+    yield single, sharded
+    single.close()
+    sharded.close()
+
+
+@pytest.mark.parametrize('limit', [1, 5, 100])
+def test_leaderboard_matches_single_file(databases, limit):
+    single, sharded = databases
+    assert sharded.get_leaderboard(limit) == single.get_leaderboard(limit)
+    assert len(single.get_leaderboard(limit)) == min(limit, len(USER_IDS))
+
+
+@pytest.mark.parametrize('limit', [1, 5, 100])
+def test_all_users_stats_match_single_file(databases, limit):
+    single, sharded = databases
+    # created_at у баз разное, порядок определяют остальные поля
+    def strip(users):
+        return [{**user, 'created_at': None} for user in users]
+
+    assert strip(sharded.get_all_users_stats(limit)) == \
+        strip(single.get_all_users_stats(limit))
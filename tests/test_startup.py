@@ -0,0 +1,80 @@
+"""Время холодного запуска бота.
+
+Импорт main, открытие базы, загрузка каталога и сборка приложения
+выполняются в отдельном процессе, без обращения к Telegram.
+"""
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Допустимая медиана холодного запуска, секунд
+COLD_START_BUDGET = 1.5
+RUNS = 3
+
+# Модули, которые не нужны до первого обновления или в режиме
+# одного процесса
+LAZY_MODULES = [
+    'handlers.callbacks',
+    'handlers.start',
+    'handlers.problems',
+    'handlers.search',
+    'handlers.test_mode',
+    'handlers.stats',
+    'handlers.review',
+    'handlers.admin',
+    'utils.maintenance',
+    'utils.workers',
+    'database.backup',
+    'database.shared_catalog',
+]
+
+# Код, выполняемый в дочернем процессе: те же этапы, что в main.main()
+# до run_polling
+COLD_START = '''
+import json
+import sys
+import time
+started = time.perf_counter()
+import main
+services = main.build_services()
+main.initialize_database_if_needed(services.db)
+services.load_catalog()
+main.build_application(services)
+print(json.dumps({'seconds': time.perf_counter() - started,
+                  'modules': sorted(sys.modules)}))
+'''
+
+
+@pytest.fixture(scope='module')
+def cold_starts(tmp_path_factory):
+    """Результаты нескольких холодных запусков на копии базы"""
+    workdir = tmp_path_factory.mktemp('startup')
+    # Бот работает с math_problems.db в текущем каталоге,
+    # поэтому запускаемся на копии, не трогая исходную базу
+    shutil.copy(ROOT / 'math_problems.db', workdir / 'math_problems.db')
+    env = dict(os.environ, PYTHONPATH=str(ROOT), METRICS_PORT='0')
+    results = []
+    for _ in range(RUNS):
+        result = subprocess.run([sys.executable, '-c', COLD_START],
+                                cwd=workdir, env=env, capture_output=True,
+                                text=True, check=True)
+        results.append(json.loads(result.stdout.strip().splitlines()[-1]))
+    return results
+
+
+def test_cold_start_within_budget(cold_starts):
+    median = statistics.median(run['seconds'] for run in cold_starts)
+    assert median < COLD_START_BUDGET
+
+
+def test_handlers_and_background_modules_are_lazy(cold_starts):
+    loaded = set(cold_starts[0]['modules'])
+    assert sorted(loaded.intersection(LAZY_MODULES)) == []
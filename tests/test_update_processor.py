@@ -0,0 +1,73 @@
+"""Параллельная обработка обновлений с порядком внутри чата."""
+import asyncio
+from datetime import datetime
+
+from telegram import Chat, Message, Update, User
+
+from utils.update_processor import PerChatUpdateProcessor
+
+CHATS = 4
+UPDATES_PER_CHAT = 5
+MAX_CONCURRENT = 3
+
+
+def _message_update(update_id, chat_id):
+    message = Message(update_id, datetime(2024, 1, 1),
+                      Chat(chat_id, Chat.PRIVATE),
+                      from_user=User(chat_id, 'Вася', False), text='42')
+    return Update(update_id, message=message)
+
+
+async def _process_all(processor, updates):
+    """Обрабатывает (ключ, обновление) в порядке поступления; возвращает
+    журнал событий и наибольшее число одновременных обработчиков"""
+    log = []
+    running = 0
+    peak = 0
+
+    async def handler(key, update_id):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        log.append(('start', key, update_id))
+        # Ранние обновления дольше поздних: без очереди в чате
+        # поздние завершались бы первыми
+        await asyncio.sleep(0.002 * (len(updates) - update_id))
+        log.append(('end', key, update_id))
+        running -= 1
+
+    await processor.initialize()
+    await asyncio.gather(*(
+        processor.process_update(update, handler(key, update_id))
+        for update_id, (key, update) in enumerate(updates)))
+    await processor.shutdown()
+    return log, peak
+
+
+def test_updates_of_one_chat_run_in_order():
+    processor = PerChatUpdateProcessor(MAX_CONCURRENT, 100)
+    updates = [(chat_id, _message_update(i, chat_id))
+               for i in range(UPDATES_PER_CHAT)
+               for chat_id in range(1, CHATS + 1)]
+    log, peak = asyncio.run(_process_all(processor, updates))
+
+    for chat_id in range(1, CHATS + 1):
+        events = [(event, update_id) for event, key, update_id in log
+                  if key == chat_id]
+        update_ids = [update_id for _, update_id in events[::2]]
+        # Обновления чата не пересекаются и идут в порядке поступления
+        assert events == [(event, update_id) for update_id in update_ids
+                          for event in ('start', 'end')]
+        assert update_ids == sorted(update_ids)
+    assert peak == MAX_CONCURRENT
+    assert processor._chat_locks == {}
+
+
+def test_updates_without_chat_are_not_serialized():
+    processor = PerChatUpdateProcessor(MAX_CONCURRENT, 100)
+    updates = [(None, object()) for _ in range(MAX_CONCURRENT + 1)]
+    log, peak = asyncio.run(_process_all(processor, updates))
+    # Без ключа чата обновления выполняются одновременно в пределах лимита
+    assert [event for event, _, _ in log[:MAX_CONCURRENT]] == \
+        ['start'] * MAX_CONCURRENT
+    assert peak == MAX_CONCURRENT
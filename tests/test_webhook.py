@@ -0,0 +1,195 @@
+"""Запуск бота через run_webhook и прием обновлений от Telegram.
+
+Bot API заменяет benchmarks.fake_bot_api в отдельном потоке, а
+обновления отправляются на webhook так же, как их шлет Telegram.
+"""
+import asyncio
+import importlib.util
+import json
+import socket
+import threading
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+import pytest
+
+import main
+from benchmarks.fake_bot_api import FakeBotAPI
+from config.settings import Config
+
+SETTINGS_PATH = Path(__file__).resolve().parents[1] / 'config' / 'settings.py'
+
+SECRET = 'webhook-secret'
+CHAT_ID = 4242
+
+# Обновление в том виде, в каком его присылает Telegram
+START_UPDATE = {
+    'update_id': 1,
+    'message': {
+        'message_id': 10,
+        'date': 1700000000,
+        'chat': {'id': CHAT_ID, 'type': 'private', 'first_name': 'Вася'},
+        'from': {'id': CHAT_ID, 'is_bot': False, 'first_name': 'Вася'},
+        'text': '/start',
+        'entities': [{'type': 'bot_command', 'offset': 0, 'length': 6}],
+    },
+}
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _post(url, update, secret=None):
+    """Статус ответа webhook на обновление"""
+    headers = {'Content-Type': 'application/json'}
+    if secret is not None:
+        headers['X-Telegram-Bot-Api-Secret-Token'] = secret
+    request = urllib.request.Request(url, json.dumps(update).encode(),
+                                     headers)
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status
+    except urllib.error.HTTPError as exc:
+        return exc.code
+
+
+def _wait_listening(port, timeout=10):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+@pytest.fixture
+def bot_api():
+    """Тестовый Bot API в своем потоке: (сервер, его цикл событий)"""
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    api = FakeBotAPI()
+    asyncio.run_coroutine_threadsafe(api.start(), loop).result(10)
+    yield api, loop
+    asyncio.run_coroutine_threadsafe(api.stop(), loop).result(10)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(10)
+    loop.close()
+
+
+@pytest.fixture
+def webhook_config(tmp_path, monkeypatch):
+    port = _free_port()
+    settings = {
+        'RUN_MODE': 'webhook',
+        'WEBHOOK_LISTEN': '127.0.0.1',
+        'WEBHOOK_PORT': port,
+        'WEBHOOK_PATH': 'telegram',
+        'WEBHOOK_URL': 'https://bot.example.com',
+        'WEBHOOK_SECRET_TOKEN': SECRET,
+        'DB_PATH': str(tmp_path / 'math_problems.db'),
+        'PERSISTENCE_DB_PATH': str(tmp_path / 'persistence.db'),
+        'DB_SHARDS': 1,
+        # Фоновые задачи и сервер метрик в тесте не нужны
+        'METRICS_PORT': 0,
+        'ARCHIVE_AFTER_DAYS': 0,
+        'VACUUM_PAGES': 0,
+        'BACKUP_INTERVAL': 0,
+        'REVIEW_PLAN_INTERVAL': 0,
+    }
+    for name, value in settings.items():
+        monkeypatch.setattr(Config, name, value)
+    return f"http://127.0.0.1:{port}/telegram"
+
+
+def _run_webhook(bot_api, send):
+    """Запускает бота через run_webhook, пока send(results) шлет запросы"""
+    api, api_loop = bot_api
+    services = main.build_services()
+    application = main.build_application(services, bot_api_url=api.url)
+    results = {}
+
+    def telegram():
+        # Запросы "от Telegram" идут, пока run_webhook держит главный поток
+        try:
+            _wait_listening(Config.WEBHOOK_PORT)
+            send(results)
+            results['reply'] = asyncio.run_coroutine_threadsafe(
+                asyncio.wait_for(api.inbox(CHAT_ID).get(), 10),
+                api_loop).result()
+        finally:
+            while not application.running:
+                time.sleep(0.05)
+            loop.call_soon_threadsafe(application.stop_running)
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    client = threading.Thread(target=telegram, daemon=True)
+    client.start()
+    try:
+        main.run_application(application)
+    finally:
+        asyncio.set_event_loop(None)
+    client.join(10)
+    return results
+
+
+def _load_settings(monkeypatch, **env):
+    """Config, прочитанный заново из окружения, без подмены config.settings"""
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+    spec = importlib.util.spec_from_file_location(
+        'settings_under_test', SETTINGS_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.Config
+
+
+def test_run_webhook_accepts_only_secret_updates(bot_api, webhook_config):
+    api, _ = bot_api
+
+    def send(results):
+        results['missing'] = _post(webhook_config, START_UPDATE)
+        results['wrong'] = _post(webhook_config, START_UPDATE, 'wrong')
+        results['valid'] = _post(webhook_config, START_UPDATE, SECRET)
+
+    results = _run_webhook(bot_api, send)
+
+    assert results['missing'] == 403
+    assert results['wrong'] == 403
+    assert results['valid'] == 200
+    method, params, _ = results['reply']
+    assert method == 'sendMessage'
+    assert 'Привет, Вася' in params['text']
+    # Отклоненные обновления не обработаны: ответ в чат был один
+    assert api.inbox(CHAT_ID).empty()
+    assert api.method_counts['setWebhook'] == 1
+
+
+def test_empty_secret_env_accepts_updates(bot_api, webhook_config,
+                                          monkeypatch):
+    # docker-compose передает незаданную переменную пустой строкой
+    loaded = _load_settings(monkeypatch, WEBHOOK_SECRET_TOKEN='')
+    assert loaded.WEBHOOK_SECRET_TOKEN is None
+
+    monkeypatch.setattr(Config, 'WEBHOOK_SECRET_TOKEN',
+                        loaded.WEBHOOK_SECRET_TOKEN)
+    assert main.webhook_settings()['secret_token'] is None
+
+    def send(results):
+        results['missing'] = _post(webhook_config, START_UPDATE)
+
+    results = _run_webhook(bot_api, send)
+
+    assert results['missing'] == 200
+    method, params, _ = results['reply']
+    assert method == 'sendMessage'
+    assert 'Привет, Вася' in params['text']
@@ -0,0 +1,40 @@
+"""Распределение обновлений по рабочим процессам (WORKERS > 1)."""
+from datetime import datetime
+
+from telegram import Chat, Message, Update, User
+
+from database.sharding import shard_index
+from utils.workers import WorkerPool
+
+WORKERS = 4
+
+
+def _message_update(update_id, chat, user=None):
+    message = Message(update_id, datetime(2024, 1, 1), chat, from_user=user,
+                      text='42')
+    if chat.type == Chat.CHANNEL:
+        return Update(update_id, channel_post=message)
+    return Update(update_id, message=message)
+
+
+def _pool():
+    # Процессы создаются, но не запускаются
+    return WorkerPool(WORKERS, print)
+
+
+def test_user_goes_to_one_worker_from_any_chat():
+    pool = _pool()
+    pupil = User(1001, 'Вася', False)
+    chats = [Chat(1001, Chat.PRIVATE)] + [
+        Chat(-100 - i, Chat.GROUP) for i in range(WORKERS * 3)]
+    workers = {pool.worker_for(_message_update(i, chat, pupil))
+               for i, chat in enumerate(chats)}
+    assert workers == {shard_index(pupil.id, WORKERS)}
+
+
+def test_updates_without_user_go_by_chat():
+    pool = _pool()
+    channel = Chat(-1005, Chat.CHANNEL)
+    assert pool.worker_for(_message_update(1, channel)) == \
+        shard_index(channel.id, WORKERS)
+    assert pool.worker_for(object()) == 0
@@ -0,0 +1,155 @@
+import importlib
+import logging
+import time
+
+from utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Ключ узла префиксного дерева, под которым хранится маршрут
+_ROUTE = ''
+
+
+class CallbackRouter:
+    """Маршрутизатор callback data к обработчикам.
+
+    Точные совпадения ищутся в словаре, префиксы - в префиксном дереве
+    по символам, поэтому стоимость поиска зависит только от длины callback
+    data, а не от числа маршрутов. Из нескольких подходящих префиксов
+    выбирается самый длинный, параметры которого удалось разобрать.
+
+    Остаток callback data после префикса делится по '_' и приводится к
+    типам из params, значения передаются обработчику после update и context.
+    Первые required параметров обязательны (по умолчанию все), остальные
+    можно не передавать - обработчик получит свои значения по умолчанию.
+
+    Модули, переданные в defer, импортируются при первом промахе поиска:
+    их маршруты регистрируются декораторами при импорте.
+    """
+
+    def __init__(self):
+        self._exact = {}
+        self._trie = {}
+        self._deferred = []
+
+    def route(self, data=None, prefix=None, params=(), required=None):
+        """Декоратор: регистрирует обработчик для data или для prefix"""
+        if (data is None) == (prefix is None):
+            raise ValueError("Нужно указать ровно одно из data или prefix")
+
+        def decorator(handler):
+            if data is not None:
+                self.add_exact(data, handler)
+            else:
+                self.add_prefix(prefix, handler, params, required)
+            return handler
+
+        return decorator
+
+    def add_exact(self, data, handler):
+        if data in self._exact:
+            raise ValueError(f"Маршрут {data} уже зарегистрирован")
+        self._exact[data] = handler
+
+    def add_prefix(self, prefix, handler, params=(), required=None):
+        params = tuple(params)
+        if required is None:
+            required = len(params)
+        if not 0 <= required <= len(params):
+            raise ValueError(f"Маршрут {prefix}*: required вне 0..{len(params)}")
+        node = self._trie
+        for char in prefix:
+            node = node.setdefault(char, {})
+        if _ROUTE in node:
+            raise ValueError(f"Маршрут {prefix}* уже зарегистрирован")
+        node[_ROUTE] = (handler, params, required)
+
+    def defer(self, *module_names):
+        """Откладывает импорт модулей с маршрутами до первого промаха"""
+        self._deferred.extend(module_names)
+
+    def _load_deferred(self):
+        """Импортирует отложенные модули. Возвращает True, если они были"""
+        if not self._deferred:
+            return False
+        modules, self._deferred = self._deferred, []
+        for module_name in modules:
+            importlib.import_module(module_name)
+        return True
+
+    def resolve(self, data):
+        """Возвращает (обработчик, аргументы) или None, если маршрута нет"""
+        resolved = self._resolve(data)
+        if resolved is None and self._load_deferred():
+            resolved = self._resolve(data)
+        return resolved
+
+    def _resolve(self, data):
+        handler = self._exact.get(data)
+        if handler is not None:
+            return handler, ()
+
+        # Подходящие префиксы от короткого к длинному
+        matches = []
+        node = self._trie
+        for position, char in enumerate(data):
+            node = node.get(char)
+            if node is None:
+                break
+            route = node.get(_ROUTE)
+            if route is not None:
+                matches.append((route, position + 1))
+
+        for route, prefix_length in reversed(matches):
+            args = self._parse_args(data, data[prefix_length:], *route[1:])
+            if args is not None:
+                return route[0], args
+        return None
+
+    @staticmethod
+    def _parse_args(data, rest, params, required):
+        """Параметры маршрута из остатка callback data или None"""
+        if not params:
+            return ()
+
+        parts = rest.split('_', len(params) - 1) if rest else []
+        if len(parts) < required:
+            logger.warning(f"Callback data {data}: ожидалось параметров "
+                           f"{required}..{len(params)}, получено {len(parts)}")
+            return None
+
+        try:
+            return tuple(convert(part) for convert, part in zip(params, parts))
+        except ValueError:
+            logger.warning(f"Неверные параметры в callback data: {data}")
+            return None
+
+    async def dispatch(self, update, context, data):
+        """Вызывает обработчик для data. Возвращает False, если маршрута нет"""
+        resolved = self.resolve(data)
+        if resolved is None:
+            return False
+        await self._call(update, context, *resolved)
+        return True
+
+    async def call(self, update, context, data, default=None):
+        """Вызывает обработчик для data и возвращает его результат.
+
+        Нужен там, где результат важен, например новое состояние
+        ConversationHandler. Если маршрута нет, возвращает default.
+        """
+        resolved = self.resolve(data)
+        if resolved is None:
+            logger.warning(f"Неизвестный callback data: {data}")
+            return default
+        return await self._call(update, context, *resolved)
+
+    @staticmethod
+    async def _call(update, context, handler, args):
+        started = time.perf_counter()
+        try:
+            return await handler(update, context, *args)
+        finally:
+            registry.observe('bot_callback_route_seconds',
+                             time.perf_counter() - started,
+                             route=handler.__name__)
@@ -0,0 +1,163 @@
+import asyncio
+import logging
+import time
+
+from database.archive import AttemptArchiver, archive_cutoff
+from database.reviews import ReviewScheduler
+from utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+registry.describe('bot_archived_attempts_total',
+                  'Попытки, перенесенные в архив')
+registry.describe('bot_vacuum_pages_total',
+                  'Страницы, возвращенные файлу базы incremental_vacuum')
+registry.describe('bot_backup_seconds', 'Время снятия резервной копии базы')
+registry.describe('bot_backup_errors_total',
+                  'Неудачные попытки снять резервную копию')
+
+
+class PeriodicTask:
+    """Фоновая задача: run_once в отдельном потоке раз в interval секунд.
+
+    Первый запуск откладывается на first_run_delay секунд.
+    """
+
+    name = 'периодическая задача'
+
+    def __init__(self, interval, first_run_delay=60):
+        self.interval = interval
+        self.first_run_delay = first_run_delay
+        self._task = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"{self.name.capitalize()}: раз в {self.interval} с")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        # Первый запуск откладываем, чтобы не мешать старту бота
+        await asyncio.sleep(min(self.first_run_delay, self.interval))
+        while True:
+            try:
+                await asyncio.to_thread(self.run_once)
+            except Exception as e:
+                logger.error(f"Ошибка: {self.name}: {e}")
+            await asyncio.sleep(self.interval)
+
+    def run_once(self):
+        raise NotImplementedError
+
+
+class MaintenanceScheduler(PeriodicTask):
+    """Периодическое обслуживание базы в фоне работающего бота.
+
+    Раз в interval секунд переносит в архив попытки старше
+    archive_after_days дней (0 - не архивировать) и возвращает файлу
+    до vacuum_pages свободных страниц (0 - не освобождать). Обслуживаются
+    все файлы db_paths (основная база или шарды).
+    """
+
+    name = 'обслуживание базы'
+
+    def __init__(self, db_paths, archive_after_days=180, interval=6 * 3600,
+                 vacuum_pages=2000, batch_size=5000, first_run_delay=60):
+        super().__init__(interval, first_run_delay)
+        self.archivers = [AttemptArchiver(db_path, batch_size)
+                          for db_path in db_paths]
+        self.archive_after_days = archive_after_days
+        self.vacuum_pages = vacuum_pages
+        self._warned_auto_vacuum = False
+
+    def run_once(self):
+        """Один цикл: архивация, затем incremental_vacuum"""
+        for archiver in self.archivers:
+            self._maintain(archiver)
+
+    def _maintain(self, archiver):
+        if self.archive_after_days:
+            moved = archiver.archive_before(
+                archive_cutoff(self.archive_after_days))
+            registry.inc('bot_archived_attempts_total', moved)
+
+        if self.vacuum_pages:
+            freed = archiver.incremental_vacuum(self.vacuum_pages)
+            if freed is None:
+                if not self._warned_auto_vacuum:
+                    self._warned_auto_vacuum = True
+                    logger.info(
+                        "auto_vacuum базы не INCREMENTAL, место не "
+                        "освобождается; для перевода выполните "
+                        "python -m database.archive --vacuum")
+            elif freed:
+                registry.inc('bot_vacuum_pages_total', freed)
+                logger.info(f"incremental_vacuum освободил страниц: {freed}")
+
+
+class BackupScheduler(PeriodicTask):
+    """Резервные копии базы (и ее шардов) раз в interval секунд"""
+
+    name = 'резервное копирование'
+
+    def __init__(self, managers, interval=24 * 3600, first_run_delay=300):
+        super().__init__(interval, first_run_delay)
+        self.managers = managers
+
+    def run_once(self):
+        started = time.perf_counter()
+        try:
+            for manager in self.managers:
+                manager.backup()
+        except Exception:
+            registry.inc('bot_backup_errors_total')
+            raise
+        finally:
+            registry.observe('bot_backup_seconds',
+                             time.perf_counter() - started)
+
+
+class ReviewPlanScheduler(PeriodicTask):
+    """Планы интервальных повторений на завтра раз в interval секунд"""
+
+    name = 'планирование повторений'
+
+    def __init__(self, db, interval=6 * 3600, first_run_delay=60):
+        super().__init__(interval, first_run_delay)
+        self.reviews = ReviewScheduler(db)
+
+    def run_once(self):
+        self.reviews.build_plans()
+
+
+class AdaptiveReloader(PeriodicTask):
+    """Сложность задач по попыткам всех процессов бота.
+
+    Каждый рабочий процесс учитывает в памяти только свои попытки; раз
+    в interval секунд счетчики перечитываются из problem_stats, куда
+    пишут все процессы. Удаление попыток (очистка статистики админом)
+    замечается по версии счетчиков не позже чем через check_interval
+    секунд.
+    """
+
+    name = 'обновление сложности задач'
+
+    def __init__(self, services, interval=60, check_interval=5):
+        super().__init__(min(interval, check_interval), check_interval)
+        self.services = services
+        self.reload_interval = interval
+        self._reloaded_at = time.monotonic()
+
+    def run_once(self):
+        if time.monotonic() - self._reloaded_at >= self.reload_interval:
+            self.services.reload_adaptive()
+            self._reloaded_at = time.monotonic()
+        else:
+            self.services.refresh_adaptive()
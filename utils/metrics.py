@@ -0,0 +1,276 @@
+import asyncio
+import functools
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Квантили, которые отдаются для каждого замера времени
+QUANTILES = (0.5, 0.95, 0.99)
+
+# Сколько последних замеров хранится для расчета квантилей
+WINDOW_SIZE = 1024
+
+
+class Summary:
+    """Замеры времени: число, сумма и квантили по скользящему окну"""
+
+    __slots__ = ('count', 'total', '_window')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self._window = deque(maxlen=WINDOW_SIZE)
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self._window.append(seconds)
+
+    def quantiles(self):
+        """Квантили из QUANTILES по последним замерам"""
+        if not self._window:
+            return {q: 0.0 for q in QUANTILES}
+        ordered = sorted(self._window)
+        last = len(ordered) - 1
+        return {q: ordered[min(last, int(q * len(ordered)))] for q in QUANTILES}
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    parts = []
+    for name, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"')
+        parts.append(f'{name}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+
+class MetricsRegistry:
+    """Счетчики и замеры времени с выдачей в текстовом формате Prometheus.
+
+    Метрики меняются и из цикла событий, и из фоновых потоков
+    (asyncio.to_thread), поэтому все изменения идут под блокировкой.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # имя метрики -> {метки: значение}
+        self._counters = {}
+        self._summaries = {}
+        self._help = {}
+        # (функция, возвращающая текущие значения {имя: число}, тип метрики)
+        self._collectors = []
+
+    def describe(self, name, text):
+        self._help[name] = text
+
+    def inc(self, name, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def observe(self, name, seconds, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._summaries.setdefault(name, {})
+            summary = series.get(key)
+            if summary is None:
+                summary = series[key] = Summary()
+            summary.observe(seconds)
+
+    def add_collector(self, collector, metric_type='gauge'):
+        """Добавляет функцию, значения которой отдаются как metric_type
+        ('gauge' или 'counter')"""
+        self._collectors.append((collector, metric_type))
+
+    def summary(self, name, **labels):
+        with self._lock:
+            return self._summaries.get(name, {}).get(
+                tuple(sorted(labels.items())))
+
+    def render(self):
+        """Все метрики в текстовом формате Prometheus"""
+        with self._lock:
+            return self._render()
+
+    def _render(self):
+        lines = []
+
+        for name, series in sorted(self._counters.items()):
+            if name in self._help:
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} counter")
+            for labels, value in sorted(series.items()):
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+
+        for name, series in sorted(self._summaries.items()):
+            if name in self._help:
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} summary")
+            for labels, summary in sorted(series.items()):
+                for q, value in summary.quantiles().items():
+                    quantile_labels = labels + (('quantile', q),)
+                    lines.append(
+                        f"{name}{_format_labels(quantile_labels)} {value:.6f}")
+                lines.append(
+                    f"{name}_sum{_format_labels(labels)} {summary.total:.6f}")
+                lines.append(
+                    f"{name}_count{_format_labels(labels)} {summary.count}")
+
+        for collector, metric_type in self._collectors:
+            try:
+                values = collector()
+            except Exception as e:
+                logger.error(f"Ошибка при сборе метрик: {e}")
+                continue
+            for name, value in sorted(values.items()):
+                lines.append(f"# TYPE {name} {metric_type}")
+                lines.append(f"{name} {value}")
+
+        return '\n'.join(lines) + '\n'
+
+
+# Общий реестр метрик процесса
+registry = MetricsRegistry()
+registry.describe('bot_handler_seconds', 'Время выполнения обработчиков')
+registry.describe('bot_handler_errors_total', 'Исключения в обработчиках')
+registry.describe('bot_conversation_state_total',
+                  'Обновления, обработанные в состояниях диалогов')
+registry.describe('bot_callback_route_seconds',
+                  'Время обработки callback data по маршрутам')
+registry.describe('bot_db_seconds', 'Время выполнения методов MathProblemsDB')
+registry.describe('bot_update_seconds',
+                  'Полное время обработки обновления, включая ожидание '
+                  'очереди чата')
+
+
+def timed_handler(handler, name=None, conversation=None, state=None):
+    """Обертка обработчика PTB, замеряющая время его выполнения"""
+    name = name or getattr(handler, '__name__', repr(handler))
+
+    @functools.wraps(handler)
+    async def wrapper(update, context, *args):
+        if state is not None:
+            registry.inc('bot_conversation_state_total',
+                         conversation=conversation, state=state)
+        started = time.perf_counter()
+        try:
+            return await handler(update, context, *args)
+        except Exception:
+            registry.inc('bot_handler_errors_total', handler=name)
+            raise
+        finally:
+            registry.observe('bot_handler_seconds',
+                             time.perf_counter() - started, handler=name)
+
+    return wrapper
+
+
+def instrument_application(application, state_names=None):
+    """Оборачивает замером времени все зарегистрированные обработчики.
+
+    state_names - словарь {состояние: имя} для меток состояний диалогов.
+    """
+    state_names = state_names or {}
+
+    def wrap(handler, conversation=None, state=None):
+        if hasattr(handler, 'entry_points'):
+            # ConversationHandler: оборачиваем вложенные обработчики
+            name = handler.name
+            for child in handler.entry_points:
+                wrap(child, name, 'entry')
+            for child_state, children in handler.states.items():
+                for child in children:
+                    wrap(child, name, state_names.get(child_state, child_state))
+            for child in handler.fallbacks:
+                wrap(child, name, 'fallback')
+            return
+        handler.callback = timed_handler(handler.callback,
+                                         conversation=conversation,
+                                         state=state)
+
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            wrap(handler)
+
+
+def instrument_db(db, prefix=None):
+    """Замеряет время всех публичных методов экземпляра MathProblemsDB.
+
+    Так же замеряются хранилища над базой (прогресс, повторения и т.д.):
+    их методы попадают в метрику с меткой method="prefix.имя".
+    """
+    for name in dir(type(db)):
+        if name.startswith('_'):
+            continue
+        method = getattr(db, name)
+        if not callable(method):
+            continue
+        label = f'{prefix}.{name}' if prefix else name
+        setattr(db, name, _timed_method(method, label))
+    return db
+
+
+def _timed_method(method, name):
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            registry.observe('bot_db_seconds', time.perf_counter() - started,
+                             method=name)
+
+    return wrapper
+
+
+class MetricsServer:
+    """Минимальный HTTP-сервер, отдающий метрики по GET /metrics"""
+
+    def __init__(self, host='127.0.0.1', port=9100, metrics=registry):
+        self.host = host
+        self.port = port
+        self.metrics = metrics
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host,
+                                                  self.port)
+        logger.info(f"Метрики доступны на http://{self.host}:{self.port}/metrics")
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader, writer):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), 5)
+            # Заголовки запроса не нужны, но их нужно дочитать
+            while (await asyncio.wait_for(reader.readline(), 5)).strip():
+                pass
+
+            parts = request_line.decode('latin-1').split()
+            if len(parts) >= 2 and parts[0] == 'GET' and \
+                    parts[1].split('?')[0] == '/metrics':
+                status = '200 OK'
+                body = self.metrics.render().encode()
+            else:
+                status = '404 Not Found'
+                body = b'not found\n'
+
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                f"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: close\r\n\r\n".encode() + body)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
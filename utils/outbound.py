@@ -0,0 +1,389 @@
+import asyncio
+import itertools
+import logging
+import time
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты исходящих запросов (меньше - раньше)
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+# Ответы на нажатия кнопок пользователь ждет сильнее всего,
+# служебные запросы могут подождать
+ENDPOINT_PRIORITIES = {
+    'answerCallbackQuery': PRIORITY_HIGH,
+    'setMyCommands': PRIORITY_LOW,
+    'deleteMyCommands': PRIORITY_LOW,
+}
+
+# Запросы, которые можно схлопнуть: из нескольких ожидающих правок одного
+# сообщения имеет смысл отправить только последнюю
+COALESCED_ENDPOINTS = {'editMessageText', 'editMessageReplyMarkup'}
+
+# Запросы, результат которых обработчики не используют: Bot API
+# возвращает для них отправленное сообщение или True, и PTB передает True
+# вызывающему как есть. Обработчик не ждет их отправки дольше, чем нужно:
+# если запрос должен ждать ведра чата или паузы после 429, обработчик
+# сразу получает True, а запрос отправляется в фоне
+DETACHED_ENDPOINTS = {'sendMessage', 'editMessageText',
+                      'editMessageReplyMarkup', 'answerCallbackQuery',
+                      'sendChatAction', 'deleteMessage'}
+
+# После скольких чатов начинать выбрасывать ведра простаивающих чатов
+MAX_IDLE_CHAT_BUCKETS = 10000
+
+
+class TokenBucket:
+    """Ведро токенов: не более rate запросов в секунду с запасом capacity"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity,
+                           self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self):
+        """Сколько секунд нужно подождать до появления токена"""
+        now = time.monotonic()
+        self._refill(now)
+        wait = max(0.0, self._blocked_until - now)
+        if self._tokens < 1:
+            wait = max(wait, (1 - self._tokens) / self.rate)
+        return wait
+
+    def is_full(self):
+        """Ведро не использовалось достаточно долго, чтобы заполниться"""
+        return self.delay() == 0 and self._tokens >= self.capacity
+
+    def is_blocked(self):
+        """Выдача токенов приостановлена после ответа 429"""
+        return self._blocked_until > time.monotonic()
+
+    def block(self, seconds):
+        """Запрещает выдачу токенов на время (ответ 429 от Telegram)"""
+        self._blocked_until = max(self._blocked_until,
+                                  time.monotonic() + seconds)
+
+    async def acquire(self):
+        """Ждет и забирает один токен"""
+        while True:
+            wait = self.delay()
+            if wait <= 0:
+                self._tokens -= 1
+                return
+            await asyncio.sleep(wait)
+
+
+class _OutboundRequest:
+    """Исходящий запрос, ожидающий отправки"""
+
+    __slots__ = ('callback', 'args', 'kwargs', 'chat_id', 'priority',
+                 'coalesce_key', 'detachable', 'future', 'enqueued_at',
+                 'retries')
+
+    def __init__(self, callback, args, kwargs, chat_id, priority,
+                 coalesce_key, detachable):
+        self.callback = callback
+        self.args = args
+        self.kwargs = kwargs
+        self.chat_id = chat_id
+        self.priority = priority
+        self.coalesce_key = coalesce_key
+        self.detachable = detachable
+        self.future = asyncio.get_running_loop().create_future()
+        self.enqueued_at = time.monotonic()
+        self.retries = 0
+
+
+class OutboundRateLimiter(BaseRateLimiter):
+    """Очередь исходящих запросов к Bot API с учетом лимитов Telegram.
+
+    Все запросы бота (reply_text, edit_message_text и т.д.) проходят через
+    ExtBot.rate_limiter, поэтому обработчикам не нужно ничего менять.
+
+    - запросы одного чата ограничиваются собственным ведром токенов
+      (для групп лимит строже), общий поток - глобальным;
+    - из очереди запросы забираются по приоритету;
+    - несколько ожидающих правок одного сообщения схлопываются в одну;
+    - при 429 запрос повторяется после retry_after, а чат (или весь бот,
+      если чат не известен) на это время приостанавливается;
+    - запросы из DETACHED_ENDPOINTS не держат обработчик (и его слот в
+      PerChatUpdateProcessor) на время ожидания ведра чата и пауз после
+      429: вызывающий получает True, запрос отправляется в фоне, а ошибка
+      такой отправки только пишется в лог. Если обработчику нужен
+      результат, он передает rate_limit_args={'wait_result': True}.
+    """
+
+    def __init__(self, global_rate=30.0, chat_rate=1.0, chat_burst=3,
+                 group_rate=20 / 60, max_retries=3):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.max_retries = max_retries
+
+        self._chat_buckets = {}
+        # id чата -> future, который завершится, когда последний
+        # поставленный в очередь чата запрос дождется своего ведра
+        self._chat_tails = {}
+        self._pending_edits = {}
+        self._queue = None
+        self._dispatcher = None
+        self._tasks = set()
+        self._sequence = itertools.count()
+
+        self.sent_count = 0
+        self.coalesced_count = 0
+        self.retry_count = 0
+        self.dropped_count = 0
+        self.wait_count = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.chat_wait_seconds_total = 0.0
+
+    async def initialize(self):
+        # Application и Updater инициализируют бота каждый по разу,
+        # второй диспетчер забирал бы запросы в обход порядка
+        if self._dispatcher is not None:
+            return
+        self._queue = asyncio.PriorityQueue()
+        self._dispatcher = asyncio.create_task(self._dispatch_loop())
+
+    async def shutdown(self):
+        tasks = list(self._tasks)
+        if self._dispatcher is not None:
+            tasks.append(self._dispatcher)
+            self._dispatcher = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        # Не отправленные до остановки запросы завершаем ошибкой,
+        # чтобы вызывающие не ждали вечно
+        while self._queue is not None and not self._queue.empty():
+            _, _, request = self._queue.get_nowait()
+            self._fail(request)
+        self._pending_edits.clear()
+        self._chat_tails.clear()
+
+    @staticmethod
+    def _fail(request):
+        if not request.future.done():
+            request.future.set_exception(
+                RuntimeError("Очередь отправки остановлена"))
+
+    def _finish(self, request, result=None, error=None):
+        """Передает результат запроса вызывающему, если тот еще ждет"""
+        if not request.future.done():
+            if error is None:
+                request.future.set_result(result)
+            else:
+                request.future.set_exception(error)
+        elif error is not None:
+            # Вызывающий уже отпущен - ошибку фоновой отправки некому вернуть
+            self.dropped_count += 1
+            logger.warning(f"Запрос в чат {request.chat_id} не отправлен: "
+                           f"{error}")
+
+    def _spawn(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def metrics(self):
+        """Текущие показатели очереди отправки (gauge)"""
+        return {
+            'queue_depth': self._queue.qsize() if self._queue else 0,
+            'wait_seconds_max': self.wait_seconds_max,
+        }
+
+    def counters(self):
+        """Накопленные с запуска счетчики очереди отправки (counter).
+
+        wait_seconds_total - ожидание от вызова до отправки, включая ведро
+        чата, глобальное ведро и паузы после 429; chat_wait_seconds_total -
+        его часть, проведенная в ожидании ведра чата; dropped_total -
+        фоновые отправки, завершившиеся ошибкой.
+        """
+        return {
+            'sent_total': self.sent_count,
+            'coalesced_total': self.coalesced_count,
+            'retries_total': self.retry_count,
+            'dropped_total': self.dropped_count,
+            'waits_total': self.wait_count,
+            'wait_seconds_total': self.wait_seconds_total,
+            'chat_wait_seconds_total': self.chat_wait_seconds_total,
+        }
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) >= MAX_IDLE_CHAT_BUCKETS:
+                self._prune_chat_buckets()
+            # Отрицательные id - группы и каналы: не более 20 сообщений в минуту
+            if isinstance(chat_id, int) and chat_id < 0:
+                bucket = TokenBucket(self.group_rate, 1)
+            else:
+                bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            self._chat_buckets[chat_id] = bucket
+        return bucket
+
+    def _prune_chat_buckets(self):
+        """Удаляет ведра чатов, которые успели полностью восстановиться"""
+        idle = [chat_id for chat_id, bucket in self._chat_buckets.items()
+                if bucket.is_full()]
+        for chat_id in idle:
+            del self._chat_buckets[chat_id]
+
+    def _join_chat(self, chat_id):
+        """Ставит запрос в очередь чата.
+
+        Возвращает (future предыдущего запроса чата или None, future этого
+        запроса). Очередь занимается сразу, без await, поэтому запросы,
+        отправляемые в фоне, не обгоняют следующие запросы того же чата.
+        """
+        previous = self._chat_tails.get(chat_id)
+        turn = asyncio.get_running_loop().create_future()
+        self._chat_tails[chat_id] = turn
+        return previous, turn
+
+    async def _wait_for_chat(self, chat_id, previous, turn):
+        """Ждет разрешения отправить в чат, сохраняя порядок запросов"""
+        try:
+            if previous is not None:
+                await asyncio.wait([previous])
+            await self._chat_bucket(chat_id).acquire()
+        finally:
+            turn.set_result(None)
+            if self._chat_tails.get(chat_id) is turn:
+                del self._chat_tails[chat_id]
+
+    async def process_request(self, callback, args, kwargs, endpoint, data,
+                              rate_limit_args):
+        chat_id = data.get('chat_id')
+        options = rate_limit_args if isinstance(rate_limit_args, dict) else {}
+        priority = options.get(
+            'priority', ENDPOINT_PRIORITIES.get(endpoint, PRIORITY_NORMAL))
+        detachable = endpoint in DETACHED_ENDPOINTS \
+            and not options.get('wait_result')
+
+        coalesce_key = None
+        if endpoint in COALESCED_ENDPOINTS:
+            coalesce_key = (endpoint, chat_id, data.get('message_id'),
+                            data.get('inline_message_id'))
+            queued = self._pending_edits.get(coalesce_key)
+            if queued is not None:
+                # Более раннюю правку заменяем новой и ждем общий результат
+                queued.args = args
+                queued.kwargs = kwargs
+                self.coalesced_count += 1
+                # Если вызывающий первой правки уже отпущен, future
+                # завершен и этот вызов тоже сразу получает True
+                return await asyncio.shield(queued.future)
+
+        request = _OutboundRequest(callback, args, kwargs, chat_id, priority,
+                                   coalesce_key, detachable)
+        if coalesce_key is not None:
+            self._pending_edits[coalesce_key] = request
+
+        if chat_id is None:
+            self._enqueue(request)
+            return await asyncio.shield(request.future)
+
+        previous, turn = self._join_chat(chat_id)
+        if detachable and (previous is not None
+                           or self._chat_bucket(chat_id).delay() > 0):
+            # Ведро чата пусто или перед запросом есть другие: обработчик
+            # не ждет, запрос дождется своей очереди в фоне
+            request.future.set_result(True)
+            self._spawn(self._enqueue_after_chat(request, previous, turn))
+            return True
+
+        await self._enqueue_after_chat(request, previous, turn)
+        return await asyncio.shield(request.future)
+
+    async def _enqueue_after_chat(self, request, previous, turn):
+        started = time.monotonic()
+        await self._wait_for_chat(request.chat_id, previous, turn)
+        self.chat_wait_seconds_total += time.monotonic() - started
+        self._enqueue(request)
+
+    def _enqueue(self, request):
+        if self._dispatcher is None:
+            # Очередь остановили, пока запрос ждал ведра чата
+            self._fail(request)
+            self._pending_edits.pop(request.coalesce_key, None)
+            return
+        self._queue.put_nowait(
+            (request.priority, next(self._sequence), request))
+
+    async def _dispatch_loop(self):
+        """Забирает запросы по приоритету в рамках глобального лимита"""
+        while True:
+            _, _, request = await self._queue.get()
+            if request.detachable and self.global_bucket.is_blocked():
+                # Весь бот на паузе после 429 - не держим обработчик
+                self._finish(request, True)
+            await self.global_bucket.acquire()
+
+            if request.coalesce_key is not None:
+                self._pending_edits.pop(request.coalesce_key, None)
+
+            # enqueued_at выставлен до ожидания ведра чата, поэтому
+            # ожидание включает и его
+            wait = time.monotonic() - request.enqueued_at
+            self.wait_count += 1
+            self.wait_seconds_total += wait
+            self.wait_seconds_max = max(self.wait_seconds_max, wait)
+
+            self._spawn(self._execute(request))
+
+    async def _execute(self, request):
+        try:
+            result = await request.callback(*request.args, **request.kwargs)
+        except RetryAfter as e:
+            retry_after = float(e.retry_after)
+            if request.retries >= self.max_retries:
+                self._finish(request, error=e)
+                return
+
+            request.retries += 1
+            self.retry_count += 1
+            logger.warning(f"Превышен лимит Telegram, повтор через "
+                           f"{retry_after} с (чат {request.chat_id})")
+
+            if request.detachable:
+                # Обработчик не ждет паузы, повтор уйдет в фоне
+                self._finish(request, True)
+            # Пауза до повтора тоже входит в ожидание отправки
+            request.enqueued_at = time.monotonic()
+            if request.chat_id is not None:
+                self._chat_bucket(request.chat_id).block(retry_after)
+                # Повтор встает в очередь чата сразу, чтобы следующие
+                # сообщения чата не обогнали его после паузы
+                previous, turn = self._join_chat(request.chat_id)
+                await self._enqueue_after_chat(request, previous, turn)
+            else:
+                self.global_bucket.block(retry_after)
+                await asyncio.sleep(retry_after)
+                self._enqueue(request)
+        except asyncio.CancelledError:
+            self._fail(request)
+            raise
+        except Exception as e:
+            self._finish(request, error=e)
+        else:
+            self.sent_count += 1
+            self._finish(request, result)
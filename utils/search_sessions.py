@@ -0,0 +1,54 @@
+import itertools
+import time
+from collections import namedtuple
+
+# Результаты одного поиска: номера найденных задач в порядке выдачи
+SearchSession = namedtuple(
+    'SearchSession', ['session_id', 'keyword', 'problem_numbers', 'expires_at'])
+
+
+class SearchSessions:
+    """Результаты последнего поиска каждого пользователя с ограниченным сроком жизни.
+
+    Запрос к базе выполняется один раз, дальше страницы результатов
+    берутся из сохраненного списка номеров задач. Идентификатор сессии
+    попадает в callback data, поэтому кнопки старого поиска не листают
+    результаты нового.
+    """
+
+    def __init__(self, ttl=600):
+        self.ttl = ttl
+        # id пользователя -> SearchSession
+        self._sessions = {}
+        self._ids = itertools.count(1)
+
+    def create(self, user_id, keyword, problem_numbers):
+        """Сохраняет результаты нового поиска пользователя"""
+        self._prune()
+        session = SearchSession(next(self._ids), keyword,
+                                tuple(problem_numbers),
+                                time.monotonic() + self.ttl)
+        # Переставляем пользователя в конец: словарь остается
+        # упорядоченным по сроку истечения
+        self._sessions.pop(user_id, None)
+        self._sessions[user_id] = session
+        return session
+
+    def get(self, user_id, session_id):
+        """Возвращает сессию или None, если она устарела или заменена"""
+        session = self._sessions.get(user_id)
+        if session is None or session.session_id != session_id:
+            return None
+        if session.expires_at < time.monotonic():
+            del self._sessions[user_id]
+            return None
+        return session
+
+    def _prune(self):
+        """Удаляет истекшие сессии, начиная с самых старых"""
+        now = time.monotonic()
+        while self._sessions:
+            user_id, session = next(iter(self._sessions.items()))
+            if session.expires_at >= now:
+                break
+            del self._sessions[user_id]
@@ -0,0 +1,144 @@
+import asyncio
+
+from database.adaptive import AdaptiveSelector
+from database.catalog import ProblemCatalog
+from database.exams import ExamStore
+from database.models import MathProblemsDB
+from database.profiler import QueryProfiler
+from database.progress import ProgressStore
+from database.reviews import ReviewScheduler
+from utils.metrics import instrument_db
+from utils.search_sessions import SearchSessions
+
+# Ключ в application.bot_data, под которым лежит контейнер сервисов
+SERVICES_KEY = 'services'
+
+
+class Services:
+    """Общие для всех обработчиков объекты: база данных и кэши над ней.
+
+    Создается один раз в main() и кладется в application.bot_data,
+    поэтому все обработчики работают с одним экземпляром и общими кэшами.
+    """
+
+    def __init__(self, db: MathProblemsDB, search_session_ttl=600):
+        self.db = db
+        self.catalog = None
+        # Готовые клавиатуры, построенные по текущему каталогу
+        self.keyboards = {}
+        self.search_sessions = SearchSessions(search_session_ttl)
+        self.progress = None
+        self.adaptive = None
+        self._stats_version = None
+        self._instrumented = False
+        self.reviews = ReviewScheduler(db)
+        self.exams = ExamStore(db)
+
+    @classmethod
+    def build(cls, db_path, search_session_ttl=600, profile_sql=False,
+              slow_query_ms=50, explain_sample_rate=0.1, shard_count=1):
+        """Создает весь набор сервисов для базы по указанному пути"""
+        profiler = None
+        if profile_sql:
+            profiler = QueryProfiler(db_path, slow_query_ms,
+                                     explain_sample_rate)
+        return cls(MathProblemsDB(db_path, profiler=profiler,
+                                  shard_count=shard_count),
+                   search_session_ttl)
+
+    def load_catalog(self):
+        """Загружает каталог задач заново и сбрасывает зависящие от него кэши"""
+        return self.use_catalog(ProblemCatalog.load(self.db))
+
+    def use_catalog(self, catalog):
+        """Подключает готовый каталог (например, из разделяемой памяти)"""
+        self.catalog = catalog
+        self.keyboards.clear()
+        # Номера битов прогресса зависят от набора задач в каталоге
+        self.progress = ProgressStore(self.db, self.catalog)
+        if self._instrumented:
+            instrument_db(self.progress, 'progress')
+        self._stats_version = self.db.get_stats_version()
+        self.adaptive = AdaptiveSelector(self.catalog,
+                                         self.db.get_problem_stats())
+        return self.catalog
+
+    def instrument(self):
+        """Замеряет время методов базы и хранилищ над ней"""
+        self._instrumented = True
+        instrument_db(self.db)
+        if self.progress is not None:
+            instrument_db(self.progress, 'progress')
+        instrument_db(self.reviews, 'reviews')
+        instrument_db(self.exams, 'exams')
+
+    def reload_adaptive(self):
+        """Перечитывает счетчики задач из базы (их пишут все процессы)"""
+        version = self.db.get_stats_version()
+        self.adaptive = self.adaptive.with_stats(self.db.get_problem_stats())
+        self._stats_version = version
+        return self.adaptive
+
+    def refresh_adaptive(self):
+        """Перечитывает счетчики задач, если с прошлого чтения из базы
+        удалялись попытки (например, админом в другом процессе)"""
+        if self.db.get_stats_version() != self._stats_version:
+            return self.reload_adaptive()
+        return self.adaptive
+
+    async def run(self, func, *args, **kwargs):
+        """Выполняет блокирующий вызов (запрос к базе) в пуле потоков.
+
+        Обработчики обращаются к базе через run, чтобы медленный запрос
+        одного пользователя не останавливал цикл событий для остальных.
+        """
+        return await asyncio.to_thread(func, *args, **kwargs)
+
+    async def record_attempt(self, user, problem_number, user_answer,
+                             correct_answer, is_correct):
+        """Сохраняет попытку решения задачи и обновляет статистику и прогресс.
+
+        Возвращает номер попытки пользователя для этой задачи.
+        """
+        attempt_number = await self.run(
+            self.save_attempt, user, problem_number, user_answer,
+            correct_answer, is_correct)
+        # Счетчики сложности меняются в цикле событий, где их читает
+        # подбор задач для теста
+        self.adaptive.record(problem_number, is_correct)
+        return attempt_number
+
+    def save_attempt(self, user, problem_number, user_answer,
+                     correct_answer, is_correct):
+        """Записывает попытку в базу (блокирующий вызов).
+
+        Попытка, прогресс, расписание повторений и статистика пишутся
+        одной транзакцией в шард пользователя. Возвращает номер попытки.
+        """
+        try:
+            with self.db._transaction(user.id) as cursor:
+                attempt_number = self.db.add_user_attempt(
+                    user.id, problem_number, user_answer, correct_answer,
+                    is_correct, cursor=cursor)
+                progress = self.progress.record_attempt(
+                    user.id, problem_number, is_correct, cursor=cursor)
+                self.reviews.record(user.id, problem_number, is_correct,
+                                    cursor=cursor)
+
+                # Число решенных задач уже известно из прогресса,
+                # пересчитывать его по user_attempts не нужно
+                self.db.update_user_stats(
+                    user.id, user.username, user.first_name, user.last_name,
+                    is_correct, problem_number,
+                    unique_solved=progress.solved_count, cursor=cursor)
+        except Exception:
+            # Прогресс в памяти уже отметил попытку, которой нет в базе
+            self.progress.drop(user.id)
+            raise
+        return attempt_number
+
+
+def get_services(context) -> Services:
+    """Возвращает контейнер сервисов приложения"""
+    return context.bot_data[SERVICES_KEY]
+
@@ -0,0 +1,87 @@
+import importlib
+import logging
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+def lazy_handler(path):
+    """Обработчик, модуль которого импортируется при первом вызове.
+
+    path имеет вид 'модуль:функция', например 'handlers.stats:stats'.
+    """
+    module_name, _, attribute = path.partition(':')
+    handler = None
+
+    async def wrapper(update, context, *args):
+        nonlocal handler
+        if handler is None:
+            handler = getattr(importlib.import_module(module_name), attribute)
+        return await handler(update, context, *args)
+
+    wrapper.__name__ = attribute
+    wrapper.__qualname__ = path
+    return wrapper
+
+
+class StartupProfiler:
+    """Замеряет длительность этапов запуска бота"""
+
+    def __init__(self, started_at=None):
+        self.started_at = started_at or time.perf_counter()
+        self.phases = []
+
+    @contextmanager
+    def phase(self, name):
+        """Контекстный менеджер: замеряет один этап запуска"""
+        phase_started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - phase_started))
+
+    def add_phase(self, name, seconds):
+        self.phases.append((name, seconds))
+
+    def report(self):
+        """Отчет по этапам запуска"""
+        total = time.perf_counter() - self.started_at
+        lines = ["⏱ Время запуска по этапам:"]
+        for name, seconds in self.phases:
+            lines.append(f"   {name:<28} {seconds * 1000:>9.1f} мс")
+        lines.append(f"   {'всего до готовности':<28} {total * 1000:>9.1f} мс")
+        return '\n'.join(lines)
+
+
+def import_time_report(module='main', limit=15):
+    """Самые медленные импорты модуля по данным python -X importtime.
+
+    Импорт выполняется в отдельном процессе, чтобы кэш модулей текущего
+    процесса не искажал результат.
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        capture_output=True, text=True)
+
+    # Строки вида: "import time:   self [us] | cumulative | imported package"
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue
+        entries.append((int(parts[1]), int(parts[0]), parts[2].rstrip()))
+
+    if not entries:
+        return f"Не удалось получить данные -X importtime: {result.stderr[-500:]}"
+
+    entries.sort(reverse=True)
+    lines = [f"📦 Самые медленные импорты {module} (-X importtime):",
+             f"   {'всего, мс':>10} {'свои, мс':>9}  модуль"]
+    for cumulative, own, name in entries[:limit]:
+        lines.append(f"   {cumulative / 1000:>10.1f} {own / 1000:>9.1f}  {name}")
+    return '\n'.join(lines)
@@ -0,0 +1,97 @@
+import asyncio
+import logging
+import time
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+
+def update_chat_key(update):
+    """Определяет, в рамках чего нужно сохранять порядок обновлений"""
+    if not isinstance(update, Update):
+        return None
+    if update.effective_chat:
+        return update.effective_chat.id
+    if update.effective_user:
+        return update.effective_user.id
+    return None
+
+
+def update_user_key(update):
+    """Пользователь обновления, а для обновлений без него - чат"""
+    if not isinstance(update, Update):
+        return None
+    if update.effective_user:
+        return update.effective_user.id
+    if update.effective_chat:
+        return update.effective_chat.id
+    return None
+
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """Обрабатывает обновления параллельно, сохраняя порядок внутри чата.
+
+    Обновления одного чата (пользователя) выполняются строго по очереди,
+    поэтому состояние ConversationHandler и user_data не ломается, а
+    обновления разных пользователей обрабатываются одновременно.
+
+    max_concurrent_updates ограничивает число одновременно выполняемых
+    обработчиков, max_pending_updates - общее число принятых в работу
+    обновлений, включая ожидающие своей очереди в чате.
+    """
+
+    def __init__(self, max_concurrent_updates: int,
+                 max_pending_updates: int = None):
+        max_pending_updates = max(max_pending_updates or 0,
+                                  max_concurrent_updates)
+        # Семафор базового класса ограничивает все принятые обновления:
+        # ожидание своей очереди в чате не должно занимать слоты обработки
+        super().__init__(max_pending_updates)
+        self._handler_limit = max_concurrent_updates
+        self._handler_semaphore = None
+        # ключ чата -> [блокировка, число обновлений в очереди]
+        self._chat_locks = {}
+
+    async def do_process_update(self, update, coroutine):
+        started = time.perf_counter()
+        try:
+            await self._process_in_order(update, coroutine)
+        finally:
+            registry.observe('bot_update_seconds',
+                             time.perf_counter() - started)
+
+    async def _process_in_order(self, update, coroutine):
+        key = update_chat_key(update)
+
+        if key is None:
+            async with self._handler_semaphore:
+                await coroutine
+            return
+
+        entry = self._chat_locks.get(key)
+        if entry is None:
+            entry = self._chat_locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+
+        try:
+            # asyncio.Lock пропускает ожидающих в порядке очереди
+            async with entry[0]:
+                async with self._handler_semaphore:
+                    await coroutine
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._chat_locks[key]
+
+    async def initialize(self):
+        self._handler_semaphore = asyncio.BoundedSemaphore(
+            self._handler_limit)
+        logger.info(f"Параллельная обработка обновлений: до "
+                    f"{self._handler_limit} одновременно")
+
+    async def shutdown(self):
+        self._chat_locks.clear()
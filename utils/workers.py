@@ -0,0 +1,85 @@
+"""Рабочие процессы бота для режима WORKERS > 1.
+
+Основной процесс получает обновления от Telegram и раздает их рабочим
+процессам по хешу пользователя. Обновления одного пользователя (из любых
+чатов) всегда попадают в один процесс и обрабатываются там по порядку,
+поэтому состояние диалогов, user_data и кэши пользователя живут в одном
+месте.
+"""
+import asyncio
+import json
+import logging
+import multiprocessing
+import signal
+
+from telegram import Update
+
+from database.sharding import shard_index
+from utils.update_processor import update_user_key
+
+logger = logging.getLogger(__name__)
+
+
+class WorkerPool:
+    """Рабочие процессы и очереди обновлений к ним.
+
+    target(index, count, updates, *args) выполняется в каждом процессе;
+    updates - его очередь обновлений в JSON, None означает остановку.
+    """
+
+    def __init__(self, count, target, args=()):
+        # spawn: дочерний процесс не наследует цикл событий и потоки
+        # основного процесса
+        context = multiprocessing.get_context('spawn')
+        self.queues = [context.Queue() for _ in range(count)]
+        self.processes = [
+            context.Process(target=target, args=(index, count, queue, *args),
+                            name=f'bot-worker-{index}')
+            for index, queue in enumerate(self.queues)]
+
+    def start(self):
+        for process in self.processes:
+            process.start()
+        logger.info(f"Запущено рабочих процессов: {len(self.processes)}")
+
+    def worker_for(self, update):
+        """Номер процесса, который обрабатывает обновления пользователя.
+
+        По чату распределять нельзя: пользователь, пишущий боту из двух
+        чатов, получил бы две расходящиеся копии user_data.
+        """
+        key = update_user_key(update)
+        if key is None:
+            return 0
+        return shard_index(key, len(self.processes))
+
+    def dispatch(self, update):
+        self.queues[self.worker_for(update)].put(update.to_json())
+
+    def stop(self, timeout=30):
+        """Останавливает процессы после обработки уже переданных обновлений"""
+        for queue in self.queues:
+            queue.put(None)
+        for process in self.processes:
+            process.join(timeout)
+            if process.is_alive():
+                logger.warning(f"{process.name} не остановился за "
+                               f"{timeout} с, завершаем принудительно")
+                process.terminate()
+                process.join()
+
+
+def ignore_interrupts():
+    """Ctrl+C получает вся группа процессов; рабочие процессы
+    останавливает основной, когда передаст им все обновления"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+async def serve_updates(application, updates):
+    """Передает приложению обновления из очереди до сигнала остановки"""
+    while True:
+        data = await asyncio.to_thread(updates.get)
+        if data is None:
+            return
+        await application.update_queue.put(
+            Update.de_json(json.loads(data), application.bot))